@@ -1,6 +1,7 @@
 # app/__init__.py
 import datetime
 import os
+import click
 from flask import Flask
 from .extensions import db, mail, login_manager, migrate
 from config import Config
@@ -44,6 +45,20 @@ def create_app(config_class=Config):
         """Создает пользователя admin по умолчанию."""
         _create_default_admin(app)
 
+    @app.cli.command("sync")
+    @click.option('--full', is_flag=True, help='Полная перезагрузка таблиц вместо инкрементальной синхронизации.')
+    def sync_command(full):
+        """Синхронизирует данные из удаленной БД MySQL."""
+        from sync_worker import run_locked_sync
+        run_locked_sync(app, full=full)
+
+    @app.cli.command("sync-worker")
+    @click.option('--once', is_flag=True, help='Выполнить одну синхронизацию и завершиться.')
+    def sync_worker_command(once):
+        """Запускает отдельный процесс периодической синхронизации."""
+        from sync_worker import run_sync_worker
+        run_sync_worker(app, once=once)
+
     # --- НАСТРОЙКА FLASK-LOGIN ---
 
     @login_manager.user_loader
@@ -0,0 +1,619 @@
+# app/client_index.py
+"""
+Производные таблицы для списка клиентов и поиска по клиентам.
+Обновляются по синхронизированным таблицам при каждой синхронизации (data_sync.sync_data),
+страницы приложения только читают их.
+SQL производных таблиц записан шаблонами: имена таблиц ({contacts}, {directory}...)
+и условие отбора клиентов ({clients}) подставляются при выполнении - одни и те же
+запросы строят таблицы целиком, обновляют отдельных клиентов и заполняют теневые
+копии при полной перезагрузке.
+"""
+import base64
+import binascii
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# Клиент попадает в список, если у контакта заполнены имя и телефон
+# и есть хотя бы одна сделка с номером договора.
+VALID_CLIENT_CONDITION = (
+    "c.contacts_buy_name IS NOT NULL AND c.contacts_buy_name!='' "
+    "AND c.contacts_buy_phones IS NOT NULL AND c.contacts_buy_phones!='' "
+    "AND d.agreement_number IS NOT NULL AND TRIM(d.agreement_number)!=''"
+)
+
+# --- Полнотекстовый поиск ---
+# Виртуальная таблица FTS5 с триграммным токенизатором (SQLite >= 3.34): находит
+# подстроку в любом месте имени, телефона или номера договора без учета регистра.
+# rowid = id контакта (estate_deals_contacts.id).
+CLIENT_SEARCH_TABLE = 'client_search'
+CLIENT_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CLIENT_SEARCH_TABLE} "
+    "USING fts5(name, phones, agreements, tokenize='trigram')"
+)
+# Триграммный индекс ищет строки не короче 3 символов, более короткие запросы
+# выполняются через LIKE.
+FTS_MIN_QUERY_LENGTH = 3
+
+# Телефон индексируется и как есть, и одними цифрами: "+998 90 123-45-67"
+# находится и по "90 123", и по "901234567"
+_CLIENT_SEARCH_INSERT_SQL = """
+    INSERT INTO {search} (rowid, name, phones, agreements)
+    SELECT c.id, c.contacts_buy_name, c.contacts_buy_phones || ' ' || phone_digits(c.contacts_buy_phones),
+           REPLACE(GROUP_CONCAT(DISTINCT d.agreement_number), ',', ' ')
+    FROM {contacts} c
+    JOIN {deals} d ON c.id=d.contacts_buy_id
+    WHERE {valid} AND {clients}
+    GROUP BY c.id
+"""
+
+
+# --- Список клиентов (таблица client_directory, модель ClientDirectory) ---
+CLIENT_DIRECTORY_TABLE = 'client_directory'
+CLIENT_DIRECTORY_COLUMNS = (
+    'client_pos', 'client_id', 'deal_id', 'contacts_buy_name', 'contacts_buy_phones', 'agreement_number',
+    'deal_sum', 'finances_income_reserved', 'estate_floor', 'estate_riser', 'geo_flatnum', 'estate_rooms',
+    'complex_name', 'house_name',
+)
+# Клиенты нумеруются по имени (при совпадении имен - по id), строки одного
+# клиента идут подряд в порядке сделок. {client_pos} - выражение номера клиента.
+_CLIENT_DIRECTORY_SELECT_SQL = """
+    SELECT {client_pos} AS client_pos,
+           c.id, d.id, c.contacts_buy_name, c.contacts_buy_phones, d.agreement_number,
+           d.deal_sum, d.finances_income_reserved, s.estate_floor, s.estate_riser, s.geo_flatnum, s.estate_rooms,
+           h.complex_name, h.name
+    FROM {contacts} c
+    JOIN {deals} d ON c.id=d.contacts_buy_id
+    LEFT JOIN {sells} s ON d.estate_sell_id=s.estate_sell_id
+    LEFT JOIN {houses} h ON s.house_id=h.house_id
+    WHERE {valid} AND {clients}
+    ORDER BY c.contacts_buy_name, c.id, d.id
+"""
+_CLIENT_DIRECTORY_INSERT_SQL = (
+    f"INSERT INTO {{directory}} ({', '.join(CLIENT_DIRECTORY_COLUMNS)}) {_CLIENT_DIRECTORY_SELECT_SQL}"
+)
+# Номера всех клиентов сразу - при построении таблицы целиком
+_CLIENT_POS_RANK = "DENSE_RANK() OVER (ORDER BY c.contacts_buy_name, c.id)"
+# Номер обновленного клиента до перенумерации (renumber_client_directory) -
+# номер его предшественника по (имя, id): клиент сразу попадает на свою страницу
+_CLIENT_POS_PROVISIONAL = """COALESCE((
+        SELECT p.client_pos FROM {directory} p
+        WHERE (p.contacts_buy_name, p.client_id) < (c.contacts_buy_name, c.id)
+        ORDER BY p.contacts_buy_name DESC, p.client_id DESC LIMIT 1), 1)"""
+# Клиентов за одну перенумерацию (одна транзакция)
+RENUMBER_BATCH_SIZE = 2000
+
+
+def encode_cursor(name, client_id):
+    """Непрозрачный курсор страницы списка: позиция клиента (имя, id) в base64."""
+    raw = json.dumps([name, client_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (имя, id) из курсора или None, если курсор поврежден."""
+    try:
+        name, client_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if not isinstance(name, str) or not isinstance(client_id, int):
+        return None
+    return name, client_id
+
+
+# --- Подсказки при поиске (таблица client_suggest, модель ClientSuggest) ---
+CLIENT_SUGGEST_TABLE = 'client_suggest'
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+
+# Транслитерация кириллицы (русской и узбекской) в латиницу: имена в источнике
+# записаны и так и так, а операторы набирают в любой раскладке.
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+# Латинские варианты одного звука приводятся к одному написанию:
+# Xolmatov / Kholmatov / Холматов, Zhuravlev / Журавлев, O'ktam / Ўктам
+_LATIN_VARIANTS = (("'", ''), ('ʻ', ''), ('ʼ', ''), ('‘', ''), ('’', ''), ('kh', 'h'), ('x', 'h'), ('zh', 'j'))
+
+
+def normalize_suggest_key(value):
+    """Ключ подсказки: нижний регистр, латиница, только буквы, цифры и одиночные пробелы."""
+    value = value.casefold().translate(_TRANSLIT)
+    for variant, canonical in _LATIN_VARIANTS:
+        value = value.replace(variant, canonical)
+    return ' '.join(re.sub(r'[^\w\s]', '', value).split())
+
+
+def _agreement_suggest_key(agreement_number):
+    """Номер договора без пробелов и разделителей: "ДКП-12/3" -> "dkp123"."""
+    return normalize_suggest_key(agreement_number or '').replace(' ', '')
+
+
+# Ключи подсказок клиентов по client_directory: для имени - с каждого слова до
+# конца ("ivanov petr", "petr"; один раз на клиента), для договора - номер без
+# разделителей. Слова нормализованного имени разделены одним пробелом, поэтому
+# хвосты имени получаются рекурсивно: отрезаем все до первого пробела.
+_CLIENT_SUGGEST_INSERT_SQL = """
+    WITH RECURSIVE name_keys(client_id, client_pos, name, key) AS (
+        SELECT client_id, MIN(client_pos), contacts_buy_name, suggest_key(contacts_buy_name)
+        FROM {directory} WHERE {clients} GROUP BY client_id
+        UNION ALL
+        SELECT client_id, client_pos, name, substr(key, instr(key, ' ') + 1) FROM name_keys WHERE instr(key, ' ') > 0
+    )
+    INSERT INTO {suggest} (key, client_id, client_pos, contacts_buy_name, matched)
+    SELECT key, client_id, client_pos, name, name FROM name_keys WHERE key != ''
+    UNION ALL
+    SELECT agreement_suggest_key(agreement_number), client_id, client_pos, contacts_buy_name,
+           TRIM(agreement_number, ' ' || char(9, 10, 13))
+    FROM {directory} WHERE {clients} AND agreement_suggest_key(agreement_number) != ''
+"""
+
+
+def suggest_clients(con, query, limit=SUGGEST_LIMIT):
+    """
+    Подсказки для строки поиска: клиенты, у которых слово имени или номер договора
+    начинается с query. Читается диапазон индекса [prefix, prefix + 1) страницами
+    по (key, client_pos, id), пока не наберется limit разных клиентов: у одного
+    клиента в диапазоне может быть несколько ключей (имя и договоры).
+    Возвращает не больше limit клиентов: [{'id', 'name', 'matched'}].
+    """
+    prefix = normalize_suggest_key(query)
+    # Запрос из одних цифр и разделителей ищем и как номер договора ("12-3" -> "123")
+    prefixes = {prefix, prefix.replace(' ', '')} - {''}
+    suggestions, seen_clients = [], set()
+    for prefix in sorted(prefixes):
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        params = {'prefix': prefix, 'upper': upper, 'limit': limit * 4}
+        after = "key >= :prefix"
+        while len(suggestions) < limit:
+            rows = con.execute(text(
+                f"SELECT id, key, client_pos, client_id, contacts_buy_name, matched FROM {CLIENT_SUGGEST_TABLE} "
+                f"WHERE {after} AND key < :upper ORDER BY key, client_pos, id LIMIT :limit"
+            ), params).all()
+            for row_id, key, client_pos, client_id, name, matched in rows:
+                if client_id not in seen_clients and len(suggestions) < limit:
+                    seen_clients.add(client_id)
+                    suggestions.append({'id': client_id, 'name': name, 'matched': matched})
+            if len(rows) < params['limit']:
+                break
+            after = "(key, client_pos, id) > (:key, :pos, :id)"
+            params.update(key=key, pos=client_pos, id=row_id)
+    return suggestions
+
+
+# --- Телефоны (таблица contact_phones, модель ContactPhone) ---
+CONTACT_PHONES_TABLE = 'contact_phones'
+COUNTRY_CODE = '998'
+# Номер без кода страны (90 123 45 67)
+LOCAL_NUMBER_LENGTH = 9
+# Поиск по окончанию номера - не короче 5 цифр, иначе совпадений слишком много
+MIN_PHONE_SUFFIX_LENGTH = 5
+# В поле телефонов может быть несколько номеров через запятую, точку с запятой или "/"
+_PHONE_SEPARATORS = re.compile(r'[,;/\n]')
+# Строка поиска похожа на номер телефона: цифры, пробелы, "+", "-", скобки
+_PHONE_QUERY = re.compile(r'\+?[\d\s()\-]+')
+
+
+def normalize_phone(phone):
+    """
+    Цифры номера в формате E.164 без "+": "+998 (90) 123-45-67", "90 1234567",
+    "8 90 123 45 67" -> "998901234567". Номера других стран остаются как есть.
+    Возвращает None, если цифр меньше MIN_PHONE_SUFFIX_LENGTH.
+    """
+    digits = re.sub(r'\D', '', phone)
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if len(digits) == LOCAL_NUMBER_LENGTH:
+        digits = COUNTRY_CODE + digits
+    elif len(digits) == LOCAL_NUMBER_LENGTH + 1 and digits.startswith('8'):
+        digits = COUNTRY_CODE + digits[1:]
+    if len(digits) < MIN_PHONE_SUFFIX_LENGTH:
+        return None
+    return digits
+
+
+def split_phones(phones):
+    """Нормализованные номера из поля contacts_buy_phones (без повторов)."""
+    numbers = []
+    for part in _PHONE_SEPARATORS.split(phones or ''):
+        digits = normalize_phone(part)
+        if digits and digits not in numbers:
+            numbers.append(digits)
+    return numbers
+
+
+def _insert_contact_phones(con, tables, clients, params):
+    """Записывает номера контактов, отобранных условием clients (по c.id). Возвращает количество номеров."""
+    contacts = con.exec_driver_sql(
+        f"SELECT c.id, c.contacts_buy_phones FROM {tables['contacts']} c WHERE {clients} "
+        "AND c.contacts_buy_phones IS NOT NULL AND c.contacts_buy_phones!=''", params
+    ).all()
+    rows = [(contact_id, digits, digits[::-1]) for contact_id, phones in contacts for digits in split_phones(phones)]
+    if rows:
+        con.exec_driver_sql(
+            f"INSERT INTO {tables['phones']} (contact_id, phone_digits, phone_reversed) VALUES (?, ?, ?)", rows
+        )
+    return len(rows)
+
+
+def phone_lookup(query):
+    """
+    Условие поиска контактов по номеру телефона для contact_phones:
+    полный номер (с кодом страны или 9 цифр без него) ищется точно,
+    часть номера - по окончанию (диапазон по phone_reversed).
+    Возвращает (условие SQL, параметры, 'exact'/'suffix') или None, если query не похож на номер.
+    """
+    if not _PHONE_QUERY.fullmatch(query.strip()):
+        return None
+    digits = normalize_phone(query)
+    if digits is None:
+        return None
+    if len(digits) > LOCAL_NUMBER_LENGTH:
+        return "phone_digits = :phone_digits", {'phone_digits': digits}, 'exact'
+    reversed_digits = digits[::-1]
+    # Все номера, у которых phone_reversed начинается с reversed_digits
+    upper = reversed_digits[:-1] + chr(ord(reversed_digits[-1]) + 1)
+    return ("phone_reversed >= :phone_reversed AND phone_reversed < :phone_reversed_upper",
+            {'phone_reversed': reversed_digits, 'phone_reversed_upper': upper}, 'suffix')
+
+
+def find_contacts_by_phone(con, phone, limit=SUGGEST_MAX_LIMIT):
+    """
+    Контакты с номером phone: [{'id', 'name', 'phones', 'match'}].
+    match - 'exact' (совпал весь номер) или 'suffix' (совпало окончание).
+    """
+    lookup = phone_lookup(phone)
+    if lookup is None:
+        return []
+    condition, params, match = lookup
+    rows = con.execute(text(
+        "SELECT id, contacts_buy_name, contacts_buy_phones FROM estate_deals_contacts "
+        f"WHERE id IN (SELECT contact_id FROM {CONTACT_PHONES_TABLE} WHERE {condition}) "
+        "ORDER BY contacts_buy_name, id LIMIT :limit"
+    ), dict(params, limit=limit)).all()
+    return [{'id': contact_id, 'name': name, 'phones': phones, 'match': match} for contact_id, name, phones in rows]
+
+
+def create_client_search(con, table_name=CLIENT_SEARCH_TABLE):
+    """
+    Создает таблицу поиска, если ее нет. Возвращает False, если SQLite собрана
+    без FTS5 или без триграммного токенизатора (тогда поиск работает через LIKE).
+    """
+    try:
+        con.execute(text(CLIENT_SEARCH_DDL.replace(CLIENT_SEARCH_TABLE, table_name, 1)))
+        return True
+    except OperationalError as e:
+        print(f"❌ Не удалось создать таблицу поиска {table_name}: {e}")
+        return False
+
+
+def client_search_exists(con):
+    return con.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {'name': CLIENT_SEARCH_TABLE}
+    ).first() is not None
+
+
+def fts_match_expression(search_query):
+    """
+    Выражение для MATCH: весь запрос ищется как одна фраза (подстрока).
+    Возвращает None, если запрос слишком короткий для триграммного индекса.
+    """
+    search_query = search_query.strip()
+    if len(search_query) < FTS_MIN_QUERY_LENGTH:
+        return None
+    return '"' + search_query.replace('"', '""') + '"'
+
+
+# --- Построение и обновление производных таблиц ---
+# Исходные и производные таблицы для шаблонов SQL. При полной перезагрузке
+# (data_sync._full_reload) вместо них подставляются теневые копии (<таблица>__staging).
+CLIENT_TABLES = {
+    'contacts': 'estate_deals_contacts', 'deals': 'estate_deals', 'sells': 'estate_sells', 'houses': 'estate_houses',
+    'directory': CLIENT_DIRECTORY_TABLE, 'suggest': CLIENT_SUGGEST_TABLE, 'phones': CONTACT_PHONES_TABLE,
+    'search': CLIENT_SEARCH_TABLE,
+}
+# Клиентов (контактов) в одной транзакции при построении и обновлении таблиц
+CLIENT_BATCH_SIZE = 500
+# После каждой пачки соединение отпускает базу на время, сравнимое с самой
+# пачкой: обработчик занятости SQLite у других соединений проверяет блокировку
+# с паузами до 100 мс и без промежутка между транзакциями может не дождаться
+# своей очереди (database is locked при сохранении заявки)
+BATCH_PAUSE_RATIO = 1.0
+# Отбор клиентов по списку id (JSON-массив в параметре :ids) и по диапазону id (:after, :upto]
+_IDS_CONDITION = "{column} IN (SELECT value FROM json_each(:ids))"
+_RANGE_CONDITION = "{column} > :after AND {column} <= :upto"
+
+# Список целиком одним запросом (для разбора плана в benchmarks/explain_views.py)
+_CLIENT_DIRECTORY_SOURCE_SQL = _CLIENT_DIRECTORY_SELECT_SQL.format(
+    valid=VALID_CLIENT_CONDITION, clients='1', client_pos=_CLIENT_POS_RANK, **CLIENT_TABLES
+)
+
+# Клиенты, на строки которых влияет изменение записи таблицы (id записей - в :ids).
+# Прежний владелец измененной или удаленной сделки берется из client_directory
+# (она еще не обновлена), новый - из estate_deals.
+_AFFECTED_CLIENTS_SQL = {
+    'estate_deals_contacts': "SELECT value FROM json_each(:ids)",
+    'estate_deals': f"SELECT client_id FROM {CLIENT_DIRECTORY_TABLE} WHERE deal_id IN (SELECT value FROM json_each(:ids)) "
+                    "UNION SELECT contacts_buy_id FROM estate_deals WHERE id IN (SELECT value FROM json_each(:ids))",
+    'estate_sells': "SELECT contacts_buy_id FROM estate_deals WHERE estate_sell_id IN (SELECT value FROM json_each(:ids))",
+    'estate_houses': "SELECT d.contacts_buy_id FROM estate_deals d JOIN estate_sells s ON d.estate_sell_id=s.estate_sell_id "
+                     "WHERE s.house_id IN (SELECT value FROM json_each(:ids))",
+}
+
+
+def register_sql_functions(con):
+    """
+    Регистрирует в соединении SQLite функции нормализации, чтобы производные
+    таблицы заполнялись INSERT ... SELECT, без выборки строк в Python.
+    """
+    driver_connection = con.connection.driver_connection
+    driver_connection.create_function('suggest_key', 1, lambda value: normalize_suggest_key(value or ''),
+                                      deterministic=True)
+    driver_connection.create_function('agreement_suggest_key', 1, _agreement_suggest_key, deterministic=True)
+    driver_connection.create_function('phone_digits', 1, lambda value: re.sub(r'\D', '', value or ''),
+                                      deterministic=True)
+
+
+def _execute(con, template, tables, params=None, **parts):
+    """
+    Выполняет шаблон SQL для таблиц tables; parts - условие {clients} и выражение
+    {client_pos}. Возвращает количество измененных строк.
+    """
+    parts = {name: part.format(**tables) for name, part in parts.items()}
+    con.exec_driver_sql(template.format(valid=VALID_CLIENT_CONDITION, **tables, **parts), params or {})
+    # rowcount для INSERT с WITH драйвер не заполняет (-1), берем из SQLite
+    return con.exec_driver_sql("SELECT changes()").scalar()
+
+
+def _commit_batch(con, started):
+    """Фиксирует пачку, начатую в started (time.perf_counter()), и уступает базу другим соединениям."""
+    con.commit()
+    time.sleep((time.perf_counter() - started) * BATCH_PAUSE_RATIO)
+
+
+def _contact_id_ranges(con, contacts_table):
+    """Диапазоны id контактов (after, upto] по CLIENT_BATCH_SIZE контактов."""
+    ranges = []
+    after = con.exec_driver_sql(f"SELECT MIN(id) - 1 FROM {contacts_table}").scalar()
+    while after is not None:
+        upto = con.exec_driver_sql(
+            f"SELECT MAX(id) FROM (SELECT id FROM {contacts_table} WHERE id > ? ORDER BY id LIMIT ?)",
+            (after, CLIENT_BATCH_SIZE)
+        ).scalar()
+        if upto is None:
+            break
+        ranges.append((after, upto))
+        after = upto
+    return ranges
+
+
+def renumber_client_directory(con, tables=CLIENT_TABLES):
+    """
+    Проставляет клиентам номера client_pos подряд (1, 2, 3...) в порядке (имя, id)
+    в client_directory и client_suggest. Список проходится по индексу
+    (contacts_buy_name, client_id) порциями по RENUMBER_BATCH_SIZE клиентов, каждая
+    порция - отдельной транзакцией; переписываются только клиенты, чей номер
+    изменился. Пока идет перенумерация, страница по номеру может на мгновение
+    показать клиента дважды или пропустить его.
+    Возвращает количество клиентов.
+    """
+    position, after = 0, None
+    while True:
+        started = time.perf_counter()
+        keyset = "WHERE (contacts_buy_name, client_id) > (?, ?) " if after else ""
+        clients = con.exec_driver_sql(
+            f"SELECT contacts_buy_name, client_id, MIN(client_pos), MAX(client_pos) FROM {tables['directory']} "
+            f"{keyset}GROUP BY contacts_buy_name, client_id ORDER BY contacts_buy_name, client_id LIMIT ?",
+            (*(after or ()), RENUMBER_BATCH_SIZE)
+        ).all()
+        if not clients:
+            con.commit()
+            return position
+        moved = []
+        for name, client_id, min_pos, max_pos in clients:
+            position += 1
+            if min_pos != position or max_pos != position:
+                moved.append((position, client_id))
+        if moved:
+            for table_name in (tables['directory'], tables['suggest']):
+                con.exec_driver_sql(f"UPDATE {table_name} SET client_pos = ? WHERE client_id = ?", moved)
+            _commit_batch(con, started)
+        else:
+            con.commit()
+        after = tuple(clients[-1][:2])
+
+
+def build_client_tables(con, tables):
+    """
+    Заполняет пустые производные таблицы tables (теневые копии при полной
+    перезагрузке) порциями по CLIENT_BATCH_SIZE контактов, каждая порция -
+    отдельной транзакцией: блокировка записи не держится все построение.
+    Возвращает {таблица: количество строк (для списка - клиентов)}.
+    """
+    register_sql_functions(con)
+    counts = dict.fromkeys((CLIENT_DIRECTORY_TABLE, CLIENT_SUGGEST_TABLE, CONTACT_PHONES_TABLE), 0)
+    if tables['search']:
+        counts[CLIENT_SEARCH_TABLE] = 0
+    ranges = _contact_id_ranges(con, tables['contacts'])
+
+    contact_range = _RANGE_CONDITION.format(column='c.id')
+    for after, upto in ranges:
+        started = time.perf_counter()
+        params = {'after': after, 'upto': upto}
+        _execute(con, _CLIENT_DIRECTORY_INSERT_SQL, tables, params, clients=contact_range, client_pos='0')
+        counts[CONTACT_PHONES_TABLE] += _insert_contact_phones(con, tables, contact_range, params)
+        if tables['search']:
+            counts[CLIENT_SEARCH_TABLE] += _execute(con, _CLIENT_SEARCH_INSERT_SQL, tables, params,
+                                                    clients=contact_range)
+        _commit_batch(con, started)
+    counts[CLIENT_DIRECTORY_TABLE] = renumber_client_directory(con, tables)
+
+    # Подсказкам нужны уже окончательные номера клиентов
+    client_range = _RANGE_CONDITION.format(column='client_id')
+    for after, upto in ranges:
+        started = time.perf_counter()
+        counts[CLIENT_SUGGEST_TABLE] += _execute(con, _CLIENT_SUGGEST_INSERT_SQL, tables,
+                                                 {'after': after, 'upto': upto}, clients=client_range)
+        _commit_batch(con, started)
+    return counts
+
+
+def affected_client_ids(con, changed):
+    """
+    Id клиентов, строки которых в производных таблицах могли измениться.
+    changed - {таблица: id записанных и удаленных синхронизацией строк}.
+    Вызывается после записи изменений, но до обновления производных таблиц.
+    """
+    client_ids = set()
+    for table_name, ids in changed.items():
+        ids = sorted(ids)
+        for start in range(0, len(ids), CLIENT_BATCH_SIZE):
+            rows = con.exec_driver_sql(_AFFECTED_CLIENTS_SQL[table_name],
+                                       {'ids': json.dumps(ids[start:start + CLIENT_BATCH_SIZE])})
+            client_ids.update(client_id for (client_id,) in rows if client_id is not None)
+    return client_ids
+
+
+def all_client_ids(con):
+    """Id всех контактов: нынешних и удаленных, но еще оставшихся в производных таблицах."""
+    return {contact_id for (contact_id,) in con.exec_driver_sql(
+        f"SELECT id FROM estate_deals_contacts UNION SELECT client_id FROM {CLIENT_DIRECTORY_TABLE} "
+        f"UNION SELECT contact_id FROM {CONTACT_PHONES_TABLE}"
+    )}
+
+
+def refresh_client_tables(con, client_ids, phone_contact_ids):
+    """
+    Обновляет производные таблицы после инкрементальной синхронизации: строки
+    списка, подсказки и поиск - только для клиентов client_ids (affected_client_ids),
+    номера телефонов - только для контактов phone_contact_ids (изменившихся или
+    удаленных). Пачки по CLIENT_BATCH_SIZE фиксируются по отдельности, затем
+    номера клиентов выравниваются (renumber_client_directory).
+    Возвращает {таблица: количество записанных строк (для списка - всего клиентов)}.
+    """
+    register_sql_functions(con)
+    tables = dict(CLIENT_TABLES, search=CLIENT_SEARCH_TABLE if client_search_exists(con) else None)
+    counts = dict.fromkeys((CLIENT_SUGGEST_TABLE, CONTACT_PHONES_TABLE), 0)
+    if tables['search']:
+        counts[CLIENT_SEARCH_TABLE] = 0
+    contact_ids = _IDS_CONDITION.format(column='c.id')
+    directory_ids = _IDS_CONDITION.format(column='client_id')
+
+    client_ids = sorted(client_ids)
+    for start in range(0, len(client_ids), CLIENT_BATCH_SIZE):
+        started = time.perf_counter()
+        params = {'ids': json.dumps(client_ids[start:start + CLIENT_BATCH_SIZE])}
+        _execute(con, "DELETE FROM {directory} WHERE {clients}", tables, params, clients=directory_ids)
+        _execute(con, "DELETE FROM {suggest} WHERE {clients}", tables, params, clients=directory_ids)
+        _execute(con, _CLIENT_DIRECTORY_INSERT_SQL, tables, params,
+                 clients=contact_ids, client_pos=_CLIENT_POS_PROVISIONAL)
+        counts[CLIENT_SUGGEST_TABLE] += _execute(con, _CLIENT_SUGGEST_INSERT_SQL, tables, params,
+                                                 clients=directory_ids)
+        if tables['search']:
+            _execute(con, "DELETE FROM {search} WHERE {clients}", tables, params,
+                     clients=_IDS_CONDITION.format(column='rowid'))
+            counts[CLIENT_SEARCH_TABLE] += _execute(con, _CLIENT_SEARCH_INSERT_SQL, tables, params,
+                                                    clients=contact_ids)
+        _commit_batch(con, started)
+
+    phone_contact_ids = sorted(phone_contact_ids)
+    for start in range(0, len(phone_contact_ids), CLIENT_BATCH_SIZE):
+        started = time.perf_counter()
+        params = {'ids': json.dumps(phone_contact_ids[start:start + CLIENT_BATCH_SIZE])}
+        _execute(con, "DELETE FROM {phones} WHERE {clients}", tables, params,
+                 clients=_IDS_CONDITION.format(column='contact_id'))
+        counts[CONTACT_PHONES_TABLE] += _insert_contact_phones(con, tables, contact_ids, params)
+        _commit_batch(con, started)
+
+    counts[CLIENT_DIRECTORY_TABLE] = renumber_client_directory(con, tables)
+    return counts
+
+
+def rebuild_client_tables(con):
+    """
+    Строит все производные таблицы заново одной транзакцией - при запуске
+    приложения, если они еще не построены (client_tables_need_rebuild).
+    Возвращает {таблица: количество строк (для списка - клиентов)}.
+    """
+    register_sql_functions(con)
+    tables = dict(CLIENT_TABLES)
+    if not create_client_search(con):
+        print("-> Поиск по клиентам будет работать без индекса (LIKE).")
+        tables['search'] = None
+    for table_name in (CLIENT_DIRECTORY_TABLE, CLIENT_SUGGEST_TABLE, CONTACT_PHONES_TABLE, tables['search']):
+        if table_name:
+            con.exec_driver_sql(f"DELETE FROM {table_name}")
+
+    _execute(con, _CLIENT_DIRECTORY_INSERT_SQL, tables, clients='1', client_pos=_CLIENT_POS_RANK)
+    counts = {
+        CLIENT_DIRECTORY_TABLE: con.exec_driver_sql(f"SELECT MAX(client_pos) FROM {CLIENT_DIRECTORY_TABLE}").scalar() or 0,
+        CLIENT_SUGGEST_TABLE: _execute(con, _CLIENT_SUGGEST_INSERT_SQL, tables, clients='1'),
+        CONTACT_PHONES_TABLE: 0,
+    }
+    contact_range = _RANGE_CONDITION.format(column='c.id')
+    for after, upto in _contact_id_ranges(con, tables['contacts']):
+        counts[CONTACT_PHONES_TABLE] += _insert_contact_phones(con, tables, contact_range,
+                                                               {'after': after, 'upto': upto})
+    if tables['search']:
+        counts[CLIENT_SEARCH_TABLE] = _execute(con, _CLIENT_SEARCH_INSERT_SQL, tables, clients='1')
+    con.commit()
+    return counts
+
+
+def client_tables_need_rebuild(con):
+    """
+    True, если производные таблицы еще не построены: новая база или база,
+    обновленная до версии с новыми таблицами (они пусты).
+    """
+    if not client_search_exists(con):
+        return True
+    return any(con.exec_driver_sql(f"SELECT 1 FROM {table_name} LIMIT 1").first() is None
+               for table_name in (CLIENT_DIRECTORY_TABLE, CLIENT_SUGGEST_TABLE, CONTACT_PHONES_TABLE))
+
+
+# --- Кеш количества клиентов для пагинации ---
+# Данные списка меняются только при синхронизации, поэтому количество найденных
+# клиентов кешируется в процессе по ключу (поколение синхронизации, запрос).
+# Поколение - id последней успешной синхронизации: после нее старые ключи
+# больше не запрашиваются и вытесняются из LRU.
+COUNT_CACHE_SIZE = 512
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def sync_generation(session):
+    """Поколение данных: id последней успешной синхронизации (0, если их не было)."""
+    return session.execute(text("SELECT MAX(id) FROM sync_runs WHERE status='success'")).scalar() or 0
+
+
+def normalize_search(search_query):
+    """Запрос без лишних пробелов: "  Иванов   Петр " -> "Иванов Петр"."""
+    return ' '.join(search_query.split())
+
+
+def cached_client_count(generation, key, compute):
+    """
+    Возвращает количество из кеша или вычисляет его через compute() и запоминает.
+    key - нормализованный запрос (None для списка без фильтра).
+    """
+    cache_key = (generation, key)
+    with _count_cache_lock:
+        if cache_key in _count_cache:
+            _count_cache.move_to_end(cache_key)
+            return _count_cache[cache_key]
+
+    count = compute()
+    with _count_cache_lock:
+        _count_cache[cache_key] = count
+        _count_cache.move_to_end(cache_key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
@@ -64,15 +64,15 @@ class Application(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('estate_deals_contacts.id'), nullable=False)
     # НОВОЕ ПОЛЕ: ID пользователя, создавшего заявку
-    creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     agreement_number = db.Column(db.String(255), nullable=False)
     application_type = db.Column(db.String(50), nullable=False)
     comment = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(50), nullable=False, default='В работе')
-    responsible_person_id = db.Column(db.Integer, db.ForeignKey('responsible_persons.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    responsible_person_id = db.Column(db.Integer, db.ForeignKey('responsible_persons.id'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
     # НОВЫЕ ПОЛЯ: даты для отслеживания сроков
-    due_date = db.Column(db.DateTime, nullable=True)  # Срок выполнения заявки
+    due_date = db.Column(db.DateTime, nullable=True, index=True)  # Срок выполнения заявки
     completed_at = db.Column(db.DateTime, nullable=True)  # Дата фактического завершения
     # НОВОЕ ПОЛЕ: источник заявки
     source = db.Column(db.String(100), nullable=True, default='Звонок')  # Источник заявки
@@ -82,6 +82,11 @@ class Application(db.Model):
     logs = db.relationship('ApplicationLog', backref='application', lazy=True, cascade="all, delete-orphan")
     # НОВАЯ СВЯЗЬ: объект создателя заявки
     creator = db.relationship('User', backref=db.backref('created_applications', lazy='dynamic'), foreign_keys=[creator_id])
+    # Заявки клиента в карточке: WHERE client_id ORDER BY created_at DESC, постранично.
+    # Список заявок (app/queries.py): фильтр по статусу с сортировкой по дате создания,
+    # диапазоны и сортировка по created_at/due_date, видимость по creator_id/responsible_person_id.
+    __table_args__ = (db.Index('ix_applications_client_created', 'client_id', 'created_at'),
+                      db.Index('ix_applications_status_created', 'status', 'created_at'))
     
     @property
     def is_overdue(self):
@@ -94,7 +99,7 @@ class EstateSells(db.Model):
     __tablename__ = 'estate_sells'
     estate_sell_id = db.Column(db.Integer, primary_key=True)
     estate_sell_category = db.Column(db.String(255))
-    house_id = db.Column(db.Integer, db.ForeignKey('estate_houses.house_id'))
+    house_id = db.Column(db.Integer, db.ForeignKey('estate_houses.house_id'), index=True)
     estate_rooms = db.Column(db.Integer)
     geo_house_entrance = db.Column(db.String(50))
     estate_floor = db.Column(db.Integer)
@@ -104,14 +109,16 @@ class EstateSells(db.Model):
 
 class EstateDeals(db.Model):
     __tablename__ = 'estate_deals'
+    # Поиск сделки по договору и клиенту (отчеты, письма); индекс годится и для поиска только по договору
+    __table_args__ = (db.Index('ix_estate_deals_agreement_contact', 'agreement_number', 'contacts_buy_id'),)
     id = db.Column(db.Integer, primary_key=True)
-    estate_sell_id = db.Column(db.Integer, db.ForeignKey('estate_sells.estate_sell_id'))
+    estate_sell_id = db.Column(db.Integer, db.ForeignKey('estate_sells.estate_sell_id'), index=True)
     deal_status_name = db.Column(db.String(255))
     agreement_number = db.Column(db.String(255))
     agreement_date = db.Column(db.Date)
     deal_sum = db.Column(db.Float)
     deal_area = db.Column(db.Float)
-    contacts_buy_id = db.Column(db.Integer, db.ForeignKey('estate_deals_contacts.id'))
+    contacts_buy_id = db.Column(db.Integer, db.ForeignKey('estate_deals_contacts.id'), index=True)
     finances_income_reserved = db.Column(db.Float)
 
 class EstateDealsContacts(db.Model):
@@ -134,14 +141,14 @@ class EstateHouses(db.Model):
 class Defect(db.Model):
     __tablename__ = 'defects'
     id = db.Column(db.Integer, primary_key=True)
-    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'), nullable=False)
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'), nullable=False, index=True)
     defect_type = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=False)
 
 class ApplicationLog(db.Model):
     __tablename__ = 'application_logs'
     id = db.Column(db.Integer, primary_key=True)
-    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'), nullable=False)
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     action = db.Column(db.String(255), nullable=False)
     comment = db.Column(db.Text)
@@ -149,7 +156,85 @@ class ApplicationLog(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     author = db.relationship('User', backref=db.backref('application_logs', lazy='dynamic'))
 
+class HouseView:
+    """Дом для страниц, собираемых из строк SQL (вместо модели EstateHouses)."""
+    __slots__ = ('complex_name', 'name', 'warranty_house_end_date', 'warranty_apartments_end_date')
+
+    def __init__(self, complex_name, name, warranty_house_end_date=None, warranty_apartments_end_date=None):
+        self.complex_name = complex_name
+        self.name = name
+        self.warranty_house_end_date = warranty_house_end_date
+        self.warranty_apartments_end_date = warranty_apartments_end_date
+
+
+class SellView:
+    """Объект недвижимости из строки SQL (вместо модели EstateSells)."""
+    __slots__ = ('estate_floor', 'estate_riser', 'geo_flatnum', 'estate_rooms', 'house')
+
+    def __init__(self, estate_floor, estate_riser, geo_flatnum, estate_rooms, house):
+        self.estate_floor = estate_floor
+        self.estate_riser = estate_riser
+        self.geo_flatnum = geo_flatnum
+        self.estate_rooms = estate_rooms
+        self.house = house
+
+
+class DealView:
+    """Сделка из строки SQL (вместо модели EstateDeals)."""
+    __slots__ = ('agreement_number', 'deal_sum', 'finances_income_reserved', 'sell')
+
+    def __init__(self, agreement_number, deal_sum, finances_income_reserved, sell):
+        self.agreement_number = agreement_number
+        self.deal_sum = deal_sum
+        self.finances_income_reserved = finances_income_reserved
+        self.sell = sell
+
+    @classmethod
+    def from_row(cls, row):
+        """Сделка с объектом и домом из строки с колонками client_directory."""
+        house = HouseView(row['complex_name'], row['house_name'])
+        sell = SellView(row['estate_floor'], row['estate_riser'], row['geo_flatnum'], row['estate_rooms'], house)
+        return cls(row['agreement_number'], row['deal_sum'], row['finances_income_reserved'], sell)
+
+
+class ClientView:
+    """Контакт из строки SQL (вместо модели EstateDealsContacts)."""
+    __slots__ = ('id', 'contacts_buy_name', 'contacts_buy_phones')
+
+    def __init__(self, id, contacts_buy_name, contacts_buy_phones):
+        self.id = id
+        self.contacts_buy_name = contacts_buy_name
+        self.contacts_buy_phones = contacts_buy_phones
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['client_id'], row['contacts_buy_name'], row['contacts_buy_phones'])
+
+
+class ClientDeal:
+    """Строка таблицы договоров в карточке клиента (Client.deals)."""
+    __slots__ = ('complex_name', 'house_name', 'floor', 'riser', 'flat_num', 'rooms', 'deal_sum', 'to_pay',
+                 'agreement_number')
+
+    def __init__(self, complex_name, house_name, floor, riser, flat_num, rooms, deal_sum, to_pay, agreement_number):
+        self.complex_name = complex_name
+        self.house_name = house_name
+        self.floor = floor
+        self.riser = riser
+        self.flat_num = flat_num
+        self.rooms = rooms
+        self.deal_sum = deal_sum
+        self.to_pay = to_pay
+        self.agreement_number = agreement_number
+
+
 class Client:
+    """
+    Клиент для страниц: принимает модели EstateDealsContacts/EstateDeals
+    или их легковесные аналоги ClientView/DealView.
+    """
+    __slots__ = ('id', 'fio', 'phone', 'agreement_numbers', 'deals_map', 'deals')
+
     def __init__(self, contact, deals):
         self.id = contact.id
         self.fio = contact.contacts_buy_name
@@ -162,18 +247,17 @@ class Client:
                 continue
             sell = deal.sell
             house = sell.house if sell else None
-            deal_info = {
-                'complex_name': house.complex_name if house else 'N/A',
-                'house_name': house.name if house else 'N/A',
-                'floor': sell.estate_floor if sell else 'N/A',
-                'riser': sell.estate_riser if sell else 'N/A',
-                'flat_num': sell.geo_flatnum if sell else 'N/A',
-                'rooms': sell.estate_rooms if sell else 'N/A',
-                'deal_sum': deal.deal_sum,
-                'to_pay': deal.finances_income_reserved,
-                'agreement_number': deal.agreement_number
-            }
-            self.deals.append(type('obj', (), deal_info)())
+            self.deals.append(ClientDeal(
+                complex_name=house.complex_name if house else 'N/A',
+                house_name=house.name if house else 'N/A',
+                floor=sell.estate_floor if sell else 'N/A',
+                riser=sell.estate_riser if sell else 'N/A',
+                flat_num=sell.geo_flatnum if sell else 'N/A',
+                rooms=sell.estate_rooms if sell else 'N/A',
+                deal_sum=deal.deal_sum,
+                to_pay=deal.finances_income_reserved,
+                agreement_number=deal.agreement_number
+            ))
             if house:
                 self.deals_map[deal.agreement_number] = house.complex_name
 
@@ -208,3 +292,107 @@ class ApplicationType(db.Model):
 
     def __repr__(self):
         return f'<ApplicationType {self.name}>'
+
+class SyncRowHash(db.Model):
+    """Контрольные суммы строк источника для инкрементальной синхронизации (data_sync)."""
+    __tablename__ = 'sync_row_hashes'
+    table_name = db.Column(db.String(64), primary_key=True)
+    pk = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    row_hash = db.Column(db.BigInteger, nullable=False)
+
+class SyncRun(db.Model):
+    """История запусков синхронизации: статус, длительность и объем изменений."""
+    __tablename__ = 'sync_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False)  # full / incremental
+    trigger = db.Column(db.String(20), nullable=False)  # schedule / retry / startup / manual
+    status = db.Column(db.String(20), nullable=False, index=True)  # running / success / failed
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    rows_synced = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # Прогресс выполняющегося запуска (data_sync): его читает /admin/sync-status любого процесса
+    stage = db.Column(db.String(20), nullable=True)  # connect / load / swap / compare / apply / client_index
+    current_table = db.Column(db.String(64), nullable=True)
+    tables_progress = db.Column(db.Text, nullable=True)  # JSON {таблица: обработано строк}
+    progress_updated_at = db.Column(db.DateTime, nullable=True)
+
+class ReportJob(db.Model):
+    """Фоновое формирование отчета (app/report_jobs.py): статус, прогресс и готовый файл."""
+    __tablename__ = 'report_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # period / completed (app/reports.PERIOD_REPORTS)
+    start_date = db.Column(db.DateTime, nullable=False)
+    end_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, index=True)  # queued / running / success / empty / failed
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Процесс, взявший задание из очереди, отмечает heartbeat_at, пока его выполняет:
+    # задание без отметки дольше REPORT_JOB_STALE_MINUTES (воркер перезапущен)
+    # возвращается в очередь. claim_token - метка запуска: результат и прогресс
+    # записываются, только пока задание принадлежит этому запуску.
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    claim_token = db.Column(db.String(32), nullable=True)
+    attempts = db.Column(db.Integer, nullable=True, default=0)
+    rows_total = db.Column(db.Integer, nullable=True)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    filename = db.Column(db.String(255), nullable=True)  # имя файла для скачивания
+    file_path = db.Column(db.String(500), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    error = db.Column(db.Text, nullable=True)
+
+class ClientDirectory(db.Model):
+    """
+    Денормализованный список клиентов для главной страницы (app/client_index.py).
+    Одна строка на пару (клиент, договор) с уже подставленными ЖК, домом и квартирой.
+    client_pos - номер клиента по алфавиту (1, 2, 3...), страница списка читается
+    диапазоном client_pos. При синхронизации обновляются строки изменившихся клиентов.
+    """
+    __tablename__ = 'client_directory'
+    # Индекс для постраничного вывода по курсору (имя, id клиента)
+    __table_args__ = (db.Index('ix_client_directory_name_client', 'contacts_buy_name', 'client_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    client_pos = db.Column(db.Integer, nullable=False, index=True)
+    client_id = db.Column(db.Integer, nullable=False, index=True)
+    deal_id = db.Column(db.Integer, nullable=False, index=True)
+    contacts_buy_name = db.Column(db.String(255))
+    contacts_buy_phones = db.Column(db.String(255))
+    agreement_number = db.Column(db.String(255))
+    deal_sum = db.Column(db.Float)
+    finances_income_reserved = db.Column(db.Float)
+    estate_floor = db.Column(db.Integer)
+    estate_riser = db.Column(db.String(50))
+    geo_flatnum = db.Column(db.String(50))
+    estate_rooms = db.Column(db.Integer)
+    complex_name = db.Column(db.String(255))
+    house_name = db.Column(db.String(255))
+
+class ClientSuggest(db.Model):
+    """
+    Префиксный индекс для подсказок при поиске клиента (app/client_index.py).
+    key - нормализованное слово имени или номер договора (нижний регистр, латиница);
+    подсказки читаются диапазоном по индексу key. Обновляется при синхронизации.
+    """
+    __tablename__ = 'client_suggest'
+    __table_args__ = (db.Index('ix_client_suggest_key', 'key', 'client_pos'),)
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    client_id = db.Column(db.Integer, nullable=False, index=True)
+    client_pos = db.Column(db.Integer, nullable=False)
+    contacts_buy_name = db.Column(db.String(255))
+    matched = db.Column(db.String(255))  # Имя или номер договора, по которому найден клиент
+
+class ContactPhone(db.Model):
+    """
+    Телефоны контактов в нормализованном виде (app/client_index.py): одни цифры
+    в формате E.164 без "+" (998901234567). phone_reversed - те же цифры задом
+    наперед для поиска по окончанию номера. Обновляется при синхронизации.
+    """
+    __tablename__ = 'contact_phones'
+    id = db.Column(db.Integer, primary_key=True)
+    contact_id = db.Column(db.Integer, nullable=False, index=True)
+    phone_digits = db.Column(db.String(20), nullable=False, index=True)
+    phone_reversed = db.Column(db.String(20), nullable=False, index=True)
@@ -0,0 +1,133 @@
+# app/queries.py
+"""
+Фильтры списка заявок (/client-service/applications) и экспорта заявок.
+ApplicationQuery один раз разбирает параметры запроса (статус, тип, даты,
+поиск, просрочка, сортировка) и строит SQLAlchemy Select - список, экспорт
+и будущие API получают одни и те же условия.
+Условия записаны так, чтобы их покрывали индексы applications: даты
+сравниваются с готовыми границами (конец периода - "меньше следующего дня"),
+без функций от колонок.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, or_
+from .extensions import db
+from .models import Application, EstateDealsContacts
+
+# Сортировки списка заявок (параметр sort); неизвестное значение - по умолчанию
+APPLICATION_SORTS = {
+    'created_desc': (Application.created_at.desc(),),
+    'created_asc': (Application.created_at.asc(),),
+    'due_desc': (Application.due_date.desc().nullslast(),),
+    'due_asc': (Application.due_date.asc().nullsfirst(),),
+    'id_desc': (Application.id.desc(),),
+    'id_asc': (Application.id.asc(),),
+}
+DEFAULT_APPLICATION_SORT = 'created_desc'
+
+
+def _parse_date(value):
+    """Дата 'ГГГГ-ММ-ДД' или None, если она не указана или указана неверно (фильтр не применяется)."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+class ApplicationQuery:
+    """
+    Фильтры заявок. visible_to - (id пользователя, id его профиля ответственного
+    или None) для не-админов: такие пользователи видят заявки, которые создали
+    или по которым назначены ответственными; None - все заявки.
+    """
+
+    def __init__(self, status='', app_type='', date_from=None, date_to=None, search='', overdue='',
+                 sort=DEFAULT_APPLICATION_SORT, visible_to=None):
+        self.status = status
+        self.app_type = app_type
+        self.date_from = date_from
+        self.date_to = date_to
+        self.search = search
+        self.overdue = overdue
+        self.sort = sort if sort in APPLICATION_SORTS else DEFAULT_APPLICATION_SORT
+        self.visible_to = visible_to
+
+    @classmethod
+    def from_request_args(cls, args, user):
+        """Фильтры из параметров запроса (request.args) с учетом роли пользователя."""
+        visible_to = None
+        if not user.has_role('Админ'):
+            profile = user.responsible_person_profile
+            visible_to = (user.id, profile.id if profile else None)
+        return cls(status=args.get('status', ''),
+                   app_type=args.get('type', ''),
+                   date_from=_parse_date(args.get('date_from', '')),
+                   date_to=_parse_date(args.get('date_to', '')),
+                   search=args.get('search', ''),
+                   overdue=args.get('overdue', ''),
+                   sort=args.get('sort', DEFAULT_APPLICATION_SORT),
+                   visible_to=visible_to)
+
+    def conditions(self):
+        """Условия WHERE для заявок (поиск по ФИО требует соединения с клиентом, см. select)."""
+        criteria = []
+        if self.visible_to is not None:
+            user_id, responsible_person_id = self.visible_to
+            visible = [Application.creator_id == user_id]
+            if responsible_person_id is not None:
+                visible.append(Application.responsible_person_id == responsible_person_id)
+            criteria.append(or_(*visible))
+        if self.status:
+            criteria.append(Application.status == self.status)
+        if self.app_type:
+            criteria.append(Application.application_type == self.app_type)
+        if self.date_from:
+            criteria.append(Application.created_at >= self.date_from)
+        if self.date_to:
+            # Весь последний день, включая доли последней секунды
+            criteria.append(Application.created_at < self.date_to + timedelta(days=1))
+        if self.search:
+            criteria.append(or_(EstateDealsContacts.contacts_buy_name.contains(self.search),
+                                Application.agreement_number.contains(self.search)))
+
+        now = datetime.utcnow()
+        if self.overdue == 'yes':
+            criteria.extend([Application.due_date.isnot(None),
+                             Application.due_date < now,
+                             Application.completed_at.is_(None)])
+        elif self.overdue == 'no':
+            criteria.append(or_(Application.due_date.is_(None),
+                                Application.due_date >= now,
+                                Application.completed_at.isnot(None)))
+        return criteria
+
+    def select(self):
+        """Select заявок с фильтрами и сортировкой; подгрузку связей добавляет вызывающий (.options)."""
+        stmt = select(Application)
+        if self.search:
+            stmt = stmt.join(Application.client)
+        return stmt.where(*self.conditions()).order_by(*APPLICATION_SORTS[self.sort])
+
+    def sql(self):
+        """SQL запроса с подставленными значениями - для профилирования (EXPLAIN, журнал медленных запросов)."""
+        return str(self.select().compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+
+    def describe(self):
+        """Примененные фильтры для людей (строка над таблицей в Excel-экспорте)."""
+        filter_info = []
+        if self.status:
+            filter_info.append(f"Статус: {self.status}")
+        if self.app_type:
+            filter_info.append(f"Тип: {self.app_type}")
+        if self.date_from:
+            filter_info.append(f"С даты: {self.date_from:%Y-%m-%d}")
+        if self.date_to:
+            filter_info.append(f"По дату: {self.date_to:%Y-%m-%d}")
+        if self.search:
+            filter_info.append(f"Поиск: {self.search}")
+        if self.overdue == 'yes':
+            filter_info.append("Только просроченные")
+        elif self.overdue == 'no':
+            filter_info.append("Не просроченные")
+        return filter_info
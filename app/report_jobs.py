@@ -0,0 +1,307 @@
+# app/report_jobs.py
+"""
+Фоновое формирование отчетов за период (app/reports.PERIOD_REPORTS).
+Запрос только добавляет задание в таблицу report_jobs (status='queued') и сразу
+отвечает; страница «Отчетность» опрашивает статус и скачивает готовый файл.
+Очередь - сама таблица: в каждом процессе веб-сервера REPORT_JOB_WORKERS потоков
+забирают задания из базы (queued -> running с меткой claim_token) и отмечают
+heartbeat_at, пока строят отчет. Поэтому задание не теряется при перезапуске
+воркера gunicorn (max_requests): оставшиеся в очереди берет другой процесс, а
+прерванное выполнение без отметок дольше REPORT_JOB_STALE_MINUTES возвращается
+в очередь (не больше REPORT_JOB_MAX_ATTEMPTS запусков).
+Готовые файлы хранятся в REPORTS_DIR и удаляются через REPORT_FILE_TTL_HOURS.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from .extensions import db
+from .models import ReportJob
+from .reports import (PERIOD_REPORTS, REPORT_CHUNK_SIZE, iter_report_rows, load_report_ids, write_report_xlsx,
+                      period_report_filename)
+
+INTERRUPTED_MESSAGE = 'Формирование отчета было прервано (перезапуск сервера). Запустите отчет заново.'
+
+# Потоки, забирающие задания, запускаются в каждом процессе один раз (после fork - заново)
+_workers_pid = None
+_workers_lock = threading.Lock()
+# Новое задание будит свободный поток этого процесса, не дожидаясь REPORT_JOB_POLL_SECONDS
+_wakeup = threading.Event()
+# Задания, которые выполняются в этом процессе (метка -> недописанный файл), и признак
+# остановки процесса (release_report_jobs)
+_running_jobs = {}
+_stopping = threading.Event()
+
+
+def start_report_workers(app):
+    """Запускает в текущем процессе потоки, выполняющие задания из report_jobs (если еще не запущены)."""
+    global _workers_pid
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        _running_jobs.clear()
+        _stopping.clear()
+        for index in range(app.config['REPORT_JOB_WORKERS']):
+            threading.Thread(target=_report_worker, args=(app,), name=f'report-job-{index}', daemon=True).start()
+
+
+def submit_report_job(app, kind, start_date, end_date, user_id):
+    """Создает задание на отчет kind за период; его заберет свободный поток любого процесса."""
+    cleanup_expired_report_jobs(app)
+    job = ReportJob(kind=kind, start_date=start_date, end_date=end_date, status='queued',
+                    created_by_id=user_id, attempts=0)
+    db.session.add(job)
+    db.session.commit()
+    start_report_workers(app)
+    _wakeup.set()
+    return job
+
+
+def _report_worker(app):
+    """Цикл потока: вернуть в очередь прерванные задания, взять следующее и выполнить."""
+    with app.app_context():
+        while not _stopping.is_set():
+            try:
+                _wakeup.clear()
+                requeue_stale_jobs(app)
+                claimed = None if _stopping.is_set() else _claim_next_job()
+                db.session.remove()
+                if claimed is None:
+                    _wakeup.wait(app.config['REPORT_JOB_POLL_SECONDS'])
+                    continue
+                _run_report_job(app, *claimed)
+            except Exception as e:
+                db.session.remove()
+                print(f"❌ Ошибка очереди отчетов: {e}")
+                _wakeup.wait(app.config['REPORT_JOB_POLL_SECONDS'])
+
+
+def _claim_next_job():
+    """
+    Забирает самое старое задание из очереди: (id, метка) или None.
+    Пустая очередь проверяется чтением; забирает задание условный UPDATE
+    (status='queued'), поэтому одно задание не достанется двум потокам.
+    """
+    while True:
+        job_id = db.session.scalar(select(ReportJob.id).where(ReportJob.status == 'queued')
+                                   .order_by(ReportJob.id).limit(1))
+        db.session.rollback()
+        if job_id is None:
+            return None
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        with db.engine.begin() as con:
+            claimed = con.execute(update(ReportJob).where(ReportJob.id == job_id, ReportJob.status == 'queued').values(
+                status='running', claim_token=token, started_at=now, heartbeat_at=now,
+                attempts=func.coalesce(ReportJob.attempts, 0) + 1)).rowcount
+        if claimed:
+            return job_id, token
+
+
+def requeue_stale_jobs(app):
+    """
+    Выполняющиеся задания без отметки дольше REPORT_JOB_STALE_MINUTES возвращает
+    в очередь, а исчерпавшие REPORT_JOB_MAX_ATTEMPTS запусков - помечает ошибкой.
+    Задания в очереди не устаревают: они ждут свободный поток.
+    """
+    stale_before = datetime.utcnow() - timedelta(minutes=app.config['REPORT_JOB_STALE_MINUTES'])
+    stale = db.session.execute(select(ReportJob.id, ReportJob.attempts).where(
+        ReportJob.status == 'running', ReportJob.heartbeat_at < stale_before)).all()
+    db.session.rollback()
+    for job_id, attempts in stale:
+        stale_job = (ReportJob.id == job_id, ReportJob.status == 'running', ReportJob.heartbeat_at < stale_before)
+        with db.engine.begin() as con:
+            if (attempts or 0) < app.config['REPORT_JOB_MAX_ATTEMPTS']:
+                requeued = con.execute(update(ReportJob).where(*stale_job).values(
+                    status='queued', claim_token=None, rows_done=0, rows_total=None)).rowcount
+                if requeued:
+                    print(f"   - Отчет #{job_id} прерван и возвращен в очередь")
+            else:
+                con.execute(update(ReportJob).where(*stale_job).values(
+                    status='failed', error=INTERRUPTED_MESSAGE, claim_token=None,
+                    **_finished_values(app)))
+
+
+def release_report_jobs(app):
+    """
+    Вызывается при остановке воркера gunicorn: новые задания процесс больше не
+    берет, выполняющиеся ждет до REPORT_JOB_EXIT_WAIT_SECONDS, а недоделанные
+    возвращает в очередь - другой процесс заберет их, не дожидаясь
+    REPORT_JOB_STALE_MINUTES. Попытка при этом не засчитывается.
+    """
+    _stopping.set()
+    _wakeup.set()
+    deadline = time.monotonic() + app.config['REPORT_JOB_EXIT_WAIT_SECONDS']
+    while _running_jobs and time.monotonic() < deadline:
+        time.sleep(0.5)
+    running = dict(_running_jobs)
+    if not running:
+        return 0
+    with db.engine.begin() as con:
+        released = con.execute(update(ReportJob).where(
+            ReportJob.claim_token.in_(list(running)), ReportJob.status == 'running'
+        ).values(status='queued', claim_token=None, rows_done=0, rows_total=None,
+                 attempts=func.coalesce(ReportJob.attempts, 1) - 1)).rowcount
+    for part_path in running.values():
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+    if released:
+        print(f"✔️ Отчетов возвращено в очередь при остановке процесса: {released}")
+    return released
+
+
+def _job_update(job_id, token, **values):
+    """
+    Обновляет задание, только пока оно принадлежит запуску token; False - задание
+    уже вернули в очередь или завершили. Пишется отдельным соединением: commit
+    сессии сбросил бы уже загруженные заявки (expire_on_commit).
+    """
+    with db.engine.begin() as con:
+        return con.execute(update(ReportJob).where(
+            ReportJob.id == job_id, ReportJob.claim_token == token, ReportJob.status == 'running'
+        ).values(**values)).rowcount > 0
+
+
+def _set_job_progress(job_id, token, rows_done, **values):
+    if not _job_update(job_id, token, rows_done=rows_done, heartbeat_at=datetime.utcnow(), **values):
+        raise RuntimeError('задание передано другому процессу')
+
+
+def _track_progress(job_id, token, rows):
+    """Пропускает строки отчета, отмечая прогресс задания каждые REPORT_CHUNK_SIZE строк."""
+    rows_done = 0
+    for row in rows:
+        yield row
+        rows_done += 1
+        if rows_done % REPORT_CHUNK_SIZE == 0:
+            _set_job_progress(job_id, token, rows_done)
+
+
+def _heartbeat(app, job_id, token, stop):
+    """Отмечает задание раз в REPORT_JOB_HEARTBEAT_SECONDS, пока оно выполняется (и при долгой выборке)."""
+    with app.app_context():
+        while not stop.wait(app.config['REPORT_JOB_HEARTBEAT_SECONDS']):
+            try:
+                if not _job_update(job_id, token, heartbeat_at=datetime.utcnow()):
+                    return
+            except Exception as e:
+                print(f"❌ Не удалось отметить выполнение отчета #{job_id}: {e}")
+
+
+def _finished_values(app):
+    """Время завершения; запись (и файл) хранятся REPORT_FILE_TTL_HOURS, затем удаляются."""
+    finished_at = datetime.utcnow()
+    return {'finished_at': finished_at, 'heartbeat_at': finished_at,
+            'expires_at': finished_at + timedelta(hours=app.config['REPORT_FILE_TTL_HOURS'])}
+
+
+def _finish_job(app, job_id, token, status, error=None, **values):
+    """Завершает задание, если оно все еще принадлежит запуску token."""
+    return _job_update(job_id, token, status=status, error=error, **_finished_values(app), **values)
+
+
+def _run_report_job(app, job_id, token):
+    with app.app_context():
+        part_path = file_path = None
+        stop_heartbeat = threading.Event()
+        _running_jobs[token] = None
+        threading.Thread(target=_heartbeat, args=(app, job_id, token, stop_heartbeat),
+                         name=f'report-job-{job_id}-heartbeat', daemon=True).start()
+        try:
+            job = db.session.get(ReportJob, job_id)
+            report = PERIOD_REPORTS[job.kind]
+            print(f"--- ОТЧЕТ #{job_id}: {report['sheet_title']} за {job.start_date:%Y-%m-%d} - {job.end_date:%Y-%m-%d} "
+                  f"(запуск {job.attempts}) ---")
+
+            app_ids = load_report_ids(report['query'](job.start_date, job.end_date))
+            if not app_ids:
+                _finish_job(app, job_id, token, 'empty', report['empty_message'], rows_total=0)
+                print(f"✔️ Отчет #{job_id}: заявок за период нет")
+                return
+            _set_job_progress(job_id, token, 0, rows_total=len(app_ids))
+
+            reports_dir = app.config['REPORTS_DIR']
+            os.makedirs(reports_dir, exist_ok=True)
+            file_path = os.path.join(reports_dir, f"{job_id}_{uuid.uuid4().hex}.xlsx")
+            rows = _track_progress(job_id, token, iter_report_rows(app_ids, report['headers']))
+            # Файл пишется под временным именем и переименовывается, когда готов целиком
+            part_path = _running_jobs[token] = file_path + '.part'
+            with open(part_path, 'wb') as output:
+                write_report_xlsx(report['sheet_title'], report['headers'], rows, output=output)
+            os.replace(part_path, file_path)
+
+            filename = period_report_filename(job.kind, job.start_date, job.end_date)
+            if not _finish_job(app, job_id, token, 'success', rows_done=len(app_ids), file_path=file_path,
+                               filename=filename):
+                raise RuntimeError('задание передано другому процессу')
+            print(f"✔️ Отчет #{job_id} готов: {len(app_ids)} строк, {file_path}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Ошибка формирования отчета #{job_id}: {e}")
+            for path in (part_path, file_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            _finish_job(app, job_id, token, 'failed', str(e))
+        finally:
+            stop_heartbeat.set()
+            _running_jobs.pop(token, None)
+            db.session.remove()
+
+
+def cleanup_expired_report_jobs(app):
+    """
+    Удаляет файлы и записи заданий, срок хранения которых истек, а также
+    недописанные файлы (.part) процессов, остановленных посреди отчета.
+    """
+    _remove_abandoned_parts(app)
+    expired = ReportJob.query.filter(ReportJob.expires_at.isnot(None), ReportJob.expires_at < datetime.utcnow()).all()
+    for job in expired:
+        if job.file_path and os.path.exists(job.file_path):
+            try:
+                os.remove(job.file_path)
+            except OSError as e:
+                print(f"❌ Не удалось удалить файл отчета {job.file_path}: {e}")
+                continue
+        db.session.delete(job)
+    if expired:
+        db.session.commit()
+        print(f"✔️ Удалено устаревших отчетов: {len(expired)}")
+    return len(expired)
+
+
+def _remove_abandoned_parts(app):
+    reports_dir = app.config['REPORTS_DIR']
+    if not os.path.isdir(reports_dir):
+        return
+    abandoned_before = datetime.now().timestamp() - app.config['REPORT_FILE_TTL_HOURS'] * 3600
+    for name in os.listdir(reports_dir):
+        path = os.path.join(reports_dir, name)
+        try:
+            if name.endswith('.part') and os.path.getmtime(path) < abandoned_before:
+                os.remove(path)
+        except OSError as e:
+            print(f"❌ Не удалось удалить файл отчета {path}: {e}")
+
+
+def report_job_to_dict(job):
+    progress = None
+    if job.rows_total:
+        progress = round(100 * min(job.rows_done or 0, job.rows_total) / job.rows_total)
+    elif job.status == 'success':
+        progress = 100
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'rows_total': job.rows_total,
+        'rows_done': job.rows_done,
+        'progress': progress,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'filename': job.filename,
+        'error': job.error,
+    }
@@ -0,0 +1,173 @@
+# app/report_tables.py
+"""
+Выгрузка отчетов по заявкам в CSV и Parquet (для аналитиков).
+В отличие от xlsx (app/reports.py), значения не собираются по заявке:
+все колонки отчета, включая объект, последний комментарий и дефекты, читаются
+одним SQL-запросом в DataFrame, а значения по умолчанию ("N/A", "Не назначен"...),
+признаки просрочки и время выполнения считаются по колонкам целиком.
+Колонки и значения те же, что в xlsx; в Parquet даты и число дней остаются
+типизированными (пустое значение - null, а не "N/A").
+Нужен pandas, для Parquet - еще pyarrow; без них эти форматы недоступны.
+"""
+import importlib.util
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+from .extensions import db
+from .models import (Application, ApplicationLog, Defect, EstateDeals, EstateDealsContacts, EstateSells,
+                     EstateHouses, ResponsiblePerson, User)
+from .reports import REPORT_SPOOL_MAX_SIZE
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Форматы выгрузки кроме xlsx: расширение файла и MIME-тип
+TABLE_FORMATS = {
+    'csv': {'extension': 'csv', 'mimetype': 'text/csv'},
+    'parquet': {'extension': 'parquet', 'mimetype': 'application/vnd.apache.parquet'},
+}
+
+# Форматы дат в CSV - как в xlsx
+_CSV_DATE_FORMATS = {
+    "Дата создания": '%Y-%m-%d %H:%M:%S',
+    "Срок выполнения": '%Y-%m-%d',
+    "Дата завершения": '%Y-%m-%d %H:%M:%S',
+    "Дата последнего изменения": '%Y-%m-%d %H:%M:%S',
+}
+
+
+def table_format_error(fmt):
+    """Сообщение для пользователя, если выгрузка в формате fmt невозможна, иначе None."""
+    if fmt not in TABLE_FORMATS:
+        return f'Неизвестный формат выгрузки: {fmt}.'
+    if pd is None:
+        return 'Выгрузка в CSV и Parquet недоступна: на сервере не установлен pandas.'
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        return 'Выгрузка в Parquet недоступна: на сервере не установлен pyarrow.'
+    return None
+
+
+def applications_table_query(stmt):
+    """
+    Запрос колонок отчета для заявок stmt (Select заявок; фильтры и сортировка сохраняются).
+    Сделка - первая (по id) с договором и клиентом заявки, как в load_property_info;
+    последний лог и дефекты - коррелированные подзапросы по индексам application_id.
+    Таблицы связей подключаются через псевдонимы: stmt уже может быть соединен
+    с клиентом (поиск по ФИО в экспорте).
+    """
+    contact = aliased(EstateDealsContacts)
+    deal = aliased(EstateDeals)
+    sell = aliased(EstateSells)
+    house = aliased(EstateHouses)
+    person = aliased(ResponsiblePerson)
+    creator = aliased(User)
+    last_log = aliased(ApplicationLog)
+
+    first_deal_id = select(func.min(EstateDeals.id)).where(
+        EstateDeals.agreement_number == Application.agreement_number,
+        EstateDeals.contacts_buy_id == contact.id
+    ).scalar_subquery()
+    last_log_id = select(ApplicationLog.id).where(
+        ApplicationLog.application_id == Application.id
+    ).order_by(ApplicationLog.timestamp.desc(), ApplicationLog.id.desc()).limit(1).scalar_subquery()
+    defects = select(
+        func.aggregate_strings(Defect.defect_type + ': ' + Defect.description, '; ')
+    ).where(Defect.application_id == Application.id).scalar_subquery()
+
+    return stmt.with_only_columns(
+        Application.id, Application.created_at, Application.status, Application.application_type,
+        Application.agreement_number, Application.source, Application.due_date, Application.completed_at,
+        Application.last_status_change, Application.comment,
+        contact.id.label('contact_id'), contact.contacts_buy_name, contact.contacts_buy_phones,
+        deal.id.label('deal_id'), sell.estate_sell_id, sell.geo_house_entrance, sell.geo_flatnum,
+        house.house_id, house.complex_name, house.name.label('house_name'),
+        person.id.label('person_id'), person.full_name, person.email,
+        creator.id.label('creator_id'), creator.username,
+        last_log.id.label('log_id'), last_log.comment.label('last_comment'),
+        defects.label('defects')
+    ).outerjoin(contact, contact.id == Application.client_id) \
+        .outerjoin(deal, deal.id == first_deal_id) \
+        .outerjoin(sell, sell.estate_sell_id == deal.estate_sell_id) \
+        .outerjoin(house, house.house_id == sell.house_id) \
+        .outerjoin(person, person.id == Application.responsible_person_id) \
+        .outerjoin(creator, creator.id == Application.creator_id) \
+        .outerjoin(last_log, last_log.id == last_log_id)
+
+
+def _value_or(series, mask, default="N/A"):
+    """Значение колонки там, где mask и оно непустое, иначе default (как `value or default`)."""
+    return series.where(mask & series.notna() & series.ne(''), default)
+
+
+def load_applications_table(stmt, headers):
+    """DataFrame с колонками headers (значения как в application_report_values) для заявок stmt."""
+    df = pd.read_sql(applications_table_query(stmt), db.session.connection())
+    created_at, due_date, completed_at, last_status_change = (
+        pd.to_datetime(df[column]) for column in ('created_at', 'due_date', 'completed_at', 'last_status_change'))
+    now = datetime.utcnow()
+
+    has_client = df['contact_id'].notna()
+    has_deal = has_client & df['deal_id'].notna() & df['agreement_number'].notna() & df['agreement_number'].ne('')
+    has_sell = has_deal & df['estate_sell_id'].notna()
+    has_house = has_sell & df['house_id'].notna()
+    has_person = df['person_id'].notna()
+    yes_no = {True: "Да", False: "Нет"}
+
+    columns = {
+        "ID Заявки": df['id'],
+        "Дата создания": created_at,
+        "Статус": df['status'],
+        "Тип заявки": df['application_type'],
+        "№ Договора": df['agreement_number'],
+        "ФИО Клиента": df['contacts_buy_name'].where(has_client, "N/A"),
+        "Телефон клиента": df['contacts_buy_phones'].where(has_client, "N/A"),
+        "ЖК": _value_or(df['complex_name'], has_house),
+        "Дом": _value_or(df['house_name'], has_house),
+        "Подъезд": _value_or(df['geo_house_entrance'], has_sell),
+        "Номер квартиры": _value_or(df['geo_flatnum'], has_sell),
+        "Ответственный": df['full_name'].where(has_person, "Не назначен"),
+        "Email ответственного": df['email'].where(has_person, "N/A"),
+        "Создатель заявки": df['username'].where(df['creator_id'].notna(), "Система"),
+        "Источник": _value_or(df['source'], True, "Не указан"),
+        "Срок выполнения": due_date,
+        "Дата завершения": completed_at,
+        "Время выполнения (дней)": (completed_at - created_at).dt.days.astype('Int64'),
+        "Просрочено": (due_date.notna() & completed_at.isna() & (due_date < now)).map(yes_no),
+        "Была просрочена": (due_date.notna() & completed_at.notna() & (completed_at > due_date)).map(yes_no),
+        "Дата последнего изменения": last_status_change,
+        "Последний комментарий": df['last_comment'].where(df['log_id'].notna(), "N/A"),
+        "Комментарий к заявке": df['comment'],
+        "Дефекты (Тип: Комментарий)": df['defects'].fillna(''),
+    }
+    return pd.DataFrame({header: columns[header] for header in headers})
+
+
+def _csv_table(table):
+    """Даты и число дней в текстовом виде xlsx: пустые значения - "N/A"."""
+    table = table.copy()
+    for column, fmt in _CSV_DATE_FORMATS.items():
+        if column in table:
+            table[column] = table[column].dt.strftime(fmt).fillna("N/A")
+    column = "Время выполнения (дней)"
+    if column in table:
+        table[column] = table[column].astype(object).where(table[column].notna(), "N/A")
+    return table
+
+
+def write_report_table(table, fmt, output=None):
+    """
+    Пишет DataFrame отчета в CSV (UTF-8 с BOM, чтобы Excel читал кириллицу) или Parquet
+    и возвращает (файл, размер), как write_report_xlsx.
+    """
+    if output is None:
+        output = SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    if fmt == 'csv':
+        _csv_table(table).to_csv(output, index=False, encoding='utf-8-sig')
+    else:
+        table.to_parquet(output, index=False)
+    size = output.tell()
+    output.seek(0)
+    return output, size
@@ -0,0 +1,302 @@
+# app/reports.py
+"""
+Excel-отчеты по заявкам (экспорт заявок, отчет за период, отчет по
+завершенным заявкам). Данные об объекте (ЖК, дом, подъезд, квартира) и последний
+комментарий из логов подгружаются не по запросу на заявку, а пачкой на каждые
+REPORT_CHUNK_SIZE заявок: один запрос по сделкам и один по логам. Сами заявки
+тоже читаются страницами по REPORT_CHUNK_SIZE, поэтому память не растет с периодом.
+Файл пишется в режиме write_only во временный файл и отдается потоком;
+отчеты за период можно формировать и в фоне (app/report_jobs.py).
+"""
+from array import array
+from datetime import datetime
+from itertools import chain, islice
+from tempfile import SpooledTemporaryFile
+from flask import send_file
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import joinedload
+from .extensions import db
+from .models import Application, ApplicationLog, EstateDeals, EstateSells, EstateHouses
+
+REPORT_CHUNK_SIZE = 500
+# Ширина колонок оценивается по заголовку и первым строкам отчета
+REPORT_WIDTH_SAMPLE_SIZE = 200
+REPORT_MAX_COLUMN_WIDTH = 50
+# Готовый xlsx держится в памяти до этого размера, дальше - во временном файле на диске
+REPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Колонки отчетов (заголовки - ключи словаря из application_report_values)
+APPLICATIONS_EXPORT_HEADERS = [
+    "ID Заявки", "Дата создания", "Статус", "Тип заявки", "№ Договора",
+    "ФИО Клиента", "Телефон клиента", "ЖК", "Дом", "Подъезд", "Номер квартиры",
+    "Ответственный", "Email ответственного", "Создатель заявки", "Источник",
+    "Срок выполнения", "Дата завершения", "Просрочено", "Дата последнего изменения",
+    "Последний комментарий", "Комментарий к заявке", "Дефекты (Тип: Комментарий)"]
+PERIOD_REPORT_HEADERS = [h for h in APPLICATIONS_EXPORT_HEADERS if h != "Создатель заявки"]
+COMPLETED_REPORT_HEADERS = [
+    "ID Заявки", "Дата создания", "Дата завершения", "Время выполнения (дней)",
+    "Статус", "Тип заявки", "№ Договора", "ФИО Клиента", "Телефон клиента",
+    "ЖК", "Дом", "Подъезд", "Номер квартиры",
+    "Ответственный", "Email ответственного", "Создатель заявки", "Источник",
+    "Была просрочена", "Дата последнего изменения", "Последний комментарий",
+    "Комментарий к заявке", "Дефекты (Тип: Комментарий)"]
+
+_NO_PROPERTY = ("N/A", "N/A", "N/A", "N/A")
+
+
+def parse_report_period(start_date_str, end_date_str):
+    """
+    Начало и конец периода отчета из дат 'ГГГГ-ММ-ДД' (конец - 23:59:59 последнего дня).
+    При ошибке - ValueError с сообщением для пользователя.
+    """
+    if not start_date_str or not end_date_str:
+        raise ValueError('Необходимо указать и начальную, и конечную дату.')
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    except ValueError:
+        raise ValueError('Неверный формат даты.')
+    return start_date, end_date
+
+
+def load_report_ids(stmt):
+    """
+    id заявок запроса stmt (Select) в порядке отчета. Сами заявки грузятся
+    страницами в iter_report_rows, так что в памяти целиком держится только
+    массив id, а не все заявки со связями.
+    """
+    return array('q', db.session.scalars(stmt.with_only_columns(Application.id)))
+
+
+def load_report_applications(app_ids):
+    """
+    Заявки с id из app_ids в том же порядке со связями, которые читает
+    application_report_values (client, responsible_person, creator, defects), -
+    одним запросом. Заявки, удаленные после выборки id, пропускаются.
+    """
+    apps = {app.id: app for app in db.session.scalars(
+        select(Application).where(Application.id.in_(app_ids)).options(
+            joinedload(Application.client),
+            joinedload(Application.responsible_person),
+            joinedload(Application.creator),
+            joinedload(Application.defects)
+        )).unique()}
+    return [apps[app_id] for app_id in app_ids if app_id in apps]
+
+
+def period_report_query(start_date, end_date):
+    """Заявки, созданные за период (отчет за период)."""
+    return select(Application).where(
+        Application.created_at >= start_date,
+        Application.created_at <= end_date
+    ).order_by(Application.created_at.desc())
+
+
+def completed_report_query(start_date, end_date):
+    """Заявки, завершенные за период (по дате завершения)."""
+    return select(Application).where(
+        Application.completed_at >= start_date,
+        Application.completed_at <= end_date,
+        Application.status.in_(['Выполнено', 'Закрыто', 'Отклонено'])
+    ).order_by(Application.completed_at.desc())
+
+
+# Отчеты страницы «Отчетность»: запрос, колонки, лист, имя файла (без расширения) и сообщение, если заявок нет
+PERIOD_REPORTS = {
+    'period': {
+        'query': period_report_query,
+        'headers': PERIOD_REPORT_HEADERS,
+        'sheet_title': "Отчет по заявкам",
+        'filename': "report_{start}_to_{end}",
+        'empty_message': 'За указанный период не найдено ни одной заявки.',
+    },
+    'completed': {
+        'query': completed_report_query,
+        'headers': COMPLETED_REPORT_HEADERS,
+        'sheet_title': "Завершенные заявки",
+        'filename': "completed_applications_{start}_to_{end}",
+        'empty_message': 'За указанный период не найдено ни одной завершенной заявки.',
+    },
+}
+
+
+def period_report_filename(kind, start_date, end_date, extension='xlsx'):
+    name = PERIOD_REPORTS[kind]['filename'].format(start=start_date.strftime('%Y-%m-%d'),
+                                                   end=end_date.strftime('%Y-%m-%d'))
+    return f"{name}.{extension}"
+
+
+def load_property_info(applications):
+    """
+    {(номер договора, id клиента): (ЖК, дом, подъезд, квартира)} для заявок.
+    Как и прежний filter_by(...).first(), берется первая сделка по договору и
+    клиенту (с меньшим id); нет объекта или дома - "N/A".
+    """
+    keys = {(app.agreement_number, app.client.id) for app in applications if app.client and app.agreement_number}
+    if not keys:
+        return {}
+    stmt = (
+        select(EstateDeals.agreement_number, EstateDeals.contacts_buy_id,
+               EstateSells.estate_sell_id, EstateSells.geo_house_entrance, EstateSells.geo_flatnum,
+               EstateHouses.house_id, EstateHouses.complex_name, EstateHouses.name)
+        .outerjoin(EstateSells, EstateSells.estate_sell_id == EstateDeals.estate_sell_id)
+        .outerjoin(EstateHouses, EstateHouses.house_id == EstateSells.house_id)
+        .where(tuple_(EstateDeals.agreement_number, EstateDeals.contacts_buy_id).in_(list(keys)))
+        .order_by(EstateDeals.id)
+    )
+    info = {}
+    for row in db.session.execute(stmt):
+        key = (row.agreement_number, row.contacts_buy_id)
+        if key in info:
+            continue
+        complex_name, house_name, entrance, flat_num = _NO_PROPERTY
+        if row.estate_sell_id is not None:
+            entrance = row.geo_house_entrance or "N/A"
+            flat_num = row.geo_flatnum or "N/A"
+            if row.house_id is not None:
+                complex_name = row.complex_name or "N/A"
+                house_name = row.name or "N/A"
+        info[key] = (complex_name, house_name, entrance, flat_num)
+    return info
+
+
+def load_last_comments(app_ids):
+    """{id заявки: комментарий последнего (по времени) лога} одним запросом."""
+    if not app_ids:
+        return {}
+    ranked = select(
+        ApplicationLog.application_id, ApplicationLog.comment,
+        func.row_number().over(partition_by=ApplicationLog.application_id,
+                               order_by=(ApplicationLog.timestamp.desc(), ApplicationLog.id.desc())).label('rn')
+    ).where(ApplicationLog.application_id.in_(app_ids)).subquery()
+    stmt = select(ranked.c.application_id, ranked.c.comment).where(ranked.c.rn == 1)
+    return {row.application_id: row.comment for row in db.session.execute(stmt)}
+
+
+def _format(value, fmt='%Y-%m-%d %H:%M:%S'):
+    return value.strftime(fmt) if value else "N/A"
+
+
+def application_report_values(app, property_info, last_comments):
+    """
+    Значения всех колонок отчетов для одной заявки: {заголовок: значение}.
+    client, responsible_person, creator и defects заявки должны быть загружены
+    основным запросом (joinedload), иначе каждая строка даст lazy-запросы.
+    """
+    complex_name, house_name, entrance, flat_num = _NO_PROPERTY
+    if app.client and app.agreement_number:
+        complex_name, house_name, entrance, flat_num = property_info.get((app.agreement_number, app.client.id),
+                                                                         _NO_PROPERTY)
+    execution_time = "N/A"
+    if app.completed_at and app.created_at:
+        execution_time = (app.completed_at - app.created_at).days
+    was_overdue = "Да" if app.due_date and app.completed_at and app.completed_at > app.due_date else "Нет"
+
+    return {
+        "ID Заявки": app.id,
+        "Дата создания": app.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        "Статус": app.status,
+        "Тип заявки": app.application_type,
+        "№ Договора": app.agreement_number,
+        "ФИО Клиента": app.client.contacts_buy_name if app.client else "N/A",
+        "Телефон клиента": app.client.contacts_buy_phones if app.client else "N/A",
+        "ЖК": complex_name,
+        "Дом": house_name,
+        "Подъезд": entrance,
+        "Номер квартиры": flat_num,
+        "Ответственный": app.responsible_person.full_name if app.responsible_person else "Не назначен",
+        "Email ответственного": app.responsible_person.email if app.responsible_person else "N/A",
+        "Создатель заявки": app.creator.username if app.creator else "Система",
+        "Источник": app.source if app.source else "Не указан",
+        "Срок выполнения": _format(app.due_date, '%Y-%m-%d'),
+        "Дата завершения": _format(app.completed_at),
+        "Время выполнения (дней)": execution_time,
+        "Просрочено": "Да" if app.is_overdue else "Нет",
+        "Была просрочена": was_overdue,
+        "Дата последнего изменения": _format(app.last_status_change),
+        "Последний комментарий": last_comments.get(app.id, "N/A"),
+        "Комментарий к заявке": app.comment,
+        "Дефекты (Тип: Комментарий)": "; ".join([f"{d.defect_type}: {d.description}" for d in app.defects]),
+    }
+
+
+def iter_report_rows(app_ids, headers):
+    """
+    Строки отчета (списки значений в порядке headers) для заявок с id из app_ids
+    (load_report_ids). Заявки со связями, объекты и последние комментарии грузятся
+    страницами по REPORT_CHUNK_SIZE заявок; следующая страница читается после того,
+    как строки предыдущей отданы.
+    """
+    for start in range(0, len(app_ids), REPORT_CHUNK_SIZE):
+        chunk = load_report_applications(app_ids[start:start + REPORT_CHUNK_SIZE])
+        property_info = load_property_info(chunk)
+        last_comments = load_last_comments([app.id for app in chunk])
+        for app in chunk:
+            values = application_report_values(app, property_info, last_comments)
+            yield [values[header] for header in headers]
+
+
+def estimate_column_widths(headers, sample_rows):
+    """Ширина колонок по самому длинному значению заголовка и строк выборки (не больше REPORT_MAX_COLUMN_WIDTH)."""
+    widths = [len(str(header)) for header in headers]
+    for row in sample_rows:
+        for index, value in enumerate(row):
+            if value is not None:
+                widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, REPORT_MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_report_xlsx(sheet_title, headers, rows, title=None, output=None):
+    """
+    Пишет отчет в xlsx и возвращает (файл, размер). По умолчанию файл -
+    SpooledTemporaryFile, перемотанный в начало; output - свой файл для записи.
+    Книга открывается в режиме write_only: строки сразу уходят во временный
+    файл openpyxl, в памяти держится только выборка для ширины колонок.
+    title - строка над таблицей (объединяется на ширину таблицы).
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, REPORT_WIDTH_SAMPLE_SIZE))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    # В режиме write_only ширину колонок нужно задать до первой строки
+    for index, width in enumerate(estimate_column_widths(headers, sample), start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    if title:
+        title_cell = WriteOnlyCell(ws, value=title)
+        title_cell.font = Font(bold=True, size=12)
+        title_cell.alignment = Alignment(horizontal="left", vertical="center")
+        ws.append([title_cell])
+        ws.merged_cells.add(f"A1:{get_column_letter(len(headers))}1")
+        ws.append([])  # Пустая строка
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for row in chain(sample, rows):
+        ws.append(row)
+
+    if output is None:
+        output = SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    wb.save(output)
+    size = output.tell()
+    output.seek(0)
+    return output, size
+
+
+def send_report(output, size, filename, mimetype=XLSX_MIMETYPE):
+    """Отдает файл отчета потоком (блоками, без чтения в память); файл закрывается после отправки."""
+    response = send_file(output, as_attachment=True, download_name=filename, mimetype=mimetype)
+    response.content_length = size
+    return response
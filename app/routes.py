@@ -11,17 +11,29 @@ from openpyxl.styles import Font, Alignment
 from flask import (render_template, request, Blueprint, abort, flash, redirect,
                    url_for, jsonify, current_app, send_file)
 from flask_login import login_required, current_user
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import joinedload
 from sqlalchemy import text
 from flask_mail import Message
 from werkzeug.utils import secure_filename
 from .extensions import db
-from .models import (User, EstateDealsContacts, EstateDeals, EstateSells, Client,
+from .models import (User, EstateDealsContacts, EstateDeals, EstateSells, Client, ClientView, DealView,
                      Application, Defect, ApplicationLog, ResponsiblePerson, EstateHouses, responsible_assignments,
-                     DefectType, EmailLog, ApplicationType)
+                     DefectType, EmailLog, ApplicationType, SyncRun, ReportJob)
 from .email_utils import generate_and_send_email
+from .client_index import (CLIENT_DIRECTORY_TABLE, CLIENT_SEARCH_TABLE, client_search_exists, fts_match_expression,
+                           normalize_search, sync_generation, cached_client_count, encode_cursor, decode_cursor,
+                           suggest_clients, SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, CONTACT_PHONES_TABLE, phone_lookup,
+                           find_contacts_by_phone)
+from .services import (load_client_card, get_defect_types, get_application_types, invalidate_reference_cache,
+                       load_client_applications, decode_application_cursor, load_application_logs,
+                       application_log_to_dict, CARD_APPLICATIONS_PAGE_SIZE, CARD_APPLICATIONS_MAX_PAGE_SIZE,
+                       LOGS_BATCH_MAX_IDS)
+from .reports import (iter_report_rows, load_report_ids, write_report_xlsx, send_report, parse_report_period,
+                      period_report_filename, APPLICATIONS_EXPORT_HEADERS, PERIOD_REPORTS, XLSX_MIMETYPE)
+from .report_tables import table_format_error, load_applications_table, write_report_table, TABLE_FORMATS
+from .queries import ApplicationQuery
+from .report_jobs import submit_report_job, start_report_workers, report_job_to_dict
 from .decorators import permission_required, admin_required
-from sqlalchemy import or_
 
 main = Blueprint('main', __name__)
 
@@ -42,6 +54,9 @@ class SQLPagination:
         self.page = page
         self.per_page = per_page
         self.total = total
+        # Курсоры для постраничного вывода без OFFSET (необязательные)
+        self.prev_cursor = None
+        self.next_cursor = None
 
     @property
     def pages(self):
@@ -79,65 +94,103 @@ class SQLPagination:
 @login_required
 def index():
     page = request.args.get('page', 1, type=int)
-    search_query = request.args.get('search', '')
+    search_query = normalize_search(request.args.get('search', ''))
+    # Кнопки "назад"/"вперед" передают курсор - позицию (имя, id) крайнего клиента
+    # соседней страницы; номер страницы в этом случае только отображается
+    after = decode_cursor(request.args.get('after', ''))
+    before = None if after else decode_cursor(request.args.get('before', ''))
     per_page = 100
     offset = (page - 1) * per_page
-    params = {}
-    from_clause = "FROM estate_deals_contacts c JOIN estate_deals d ON c.id=d.contacts_buy_id"
-    where_clause = "WHERE c.contacts_buy_name IS NOT NULL AND c.contacts_buy_name!='' AND c.contacts_buy_phones IS NOT NULL AND c.contacts_buy_phones!='' AND d.agreement_number IS NOT NULL AND TRIM(d.agreement_number)!=''"
-    if search_query:
-        where_clause += " AND (c.contacts_buy_name LIKE :search OR d.agreement_number LIKE :search)"
-        params['search'] = f'%{search_query}%'
-
-    count_sql = f"SELECT COUNT(DISTINCT c.id) {from_clause} {where_clause}"
-    total_clients = db.session.execute(text(count_sql), params).scalar() or 0
-    data_sql = f"""
-        SELECT c.id AS client_id,c.contacts_buy_name,c.contacts_buy_phones,d.agreement_number,d.deal_sum,d.finances_income_reserved,s.estate_floor,s.estate_riser,s.geo_flatnum,s.estate_rooms,h.complex_name,h.name as house_name
-        FROM estate_deals_contacts c
-        JOIN estate_deals d ON c.id=d.contacts_buy_id
-        LEFT JOIN estate_sells s ON d.estate_sell_id=s.estate_sell_id
-        LEFT JOIN estate_houses h ON s.house_id=h.house_id
-        JOIN(SELECT DISTINCT c.id {from_clause} {where_clause} ORDER BY c.contacts_buy_name LIMIT :limit OFFSET :offset) AS page_ids ON c.id=page_ids.id
-        WHERE d.agreement_number IS NOT NULL AND TRIM(d.agreement_number)!=''
-    """
-    params['limit'], params['offset'] = per_page, offset
+    # Общее количество клиентов меняется только при синхронизации и берется из кеша
+    generation = sync_generation(db.session)
+    # Список читается из client_directory (строится после синхронизации):
+    # строки уже отсортированы по имени клиента и пронумерованы (client_pos)
+    columns = ("client_id, contacts_buy_name, contacts_buy_phones, agreement_number, deal_sum, finances_income_reserved, "
+               "estate_floor, estate_riser, geo_flatnum, estate_rooms, complex_name, house_name")
+    if not search_query:
+        match_clause, params = '1', {}
+        total_clients = cached_client_count(generation, None, lambda: db.session.execute(
+            text(f"SELECT MAX(client_pos) FROM {CLIENT_DIRECTORY_TABLE}")).scalar() or 0)
+    else:
+        # Поиск по имени, телефону и номеру договора через триграммный индекс FTS5;
+        # короткие запросы (и SQLite без FTS5) - через LIKE
+        match_expression = fts_match_expression(search_query)
+        if match_expression and client_search_exists(db.session):
+            match_clause = f"client_id IN (SELECT rowid FROM {CLIENT_SEARCH_TABLE} WHERE {CLIENT_SEARCH_TABLE} MATCH :match)"
+            params = {'match': match_expression}
+            # Поиск по индексу не зависит от регистра - и кеш тоже
+            count_key = ('match', search_query.casefold())
+        else:
+            match_clause = "(contacts_buy_name LIKE :search OR contacts_buy_phones LIKE :search OR agreement_number LIKE :search)"
+            params = {'search': f'%{search_query}%'}
+            count_key = ('like', search_query)
+        # Запрос, похожий на номер телефона, ищется еще и по нормализованным номерам
+        # (точно или по окончанию номера, по индексу contact_phones)
+        lookup = phone_lookup(search_query)
+        if lookup:
+            phone_condition, phone_params, _ = lookup
+            match_clause = f"(client_id IN (SELECT contact_id FROM {CONTACT_PHONES_TABLE} WHERE {phone_condition}) OR {match_clause})"
+            params.update(phone_params)
+
+        total_clients = cached_client_count(generation, count_key, lambda: db.session.execute(
+            text(f"SELECT COUNT(DISTINCT client_pos) FROM {CLIENT_DIRECTORY_TABLE} WHERE {match_clause}"), params
+        ).scalar() or 0)
+
+    if after or before:
+        # Страница по курсору: чтение индекса (имя, id) от позиции курсора без OFFSET,
+        # поэтому дальние страницы стоят столько же, сколько первая
+        comparison, direction = ('>', 'ASC') if after else ('<', 'DESC')
+        params['cursor_name'], params['cursor_id'] = after or before
+        page_positions_sql = f"""
+            SELECT client_pos FROM {CLIENT_DIRECTORY_TABLE}
+            WHERE {match_clause} AND (contacts_buy_name, client_id) {comparison} (:cursor_name, :cursor_id)
+            GROUP BY contacts_buy_name, client_id
+            ORDER BY contacts_buy_name {direction}, client_id {direction} LIMIT :limit
+        """
+        params['limit'] = per_page
+    elif not search_query:
+        # Переход на страницу по номеру: диапазон client_pos по индексу
+        page_positions_sql = None
+        params.update(offset=offset, limit=per_page)
+    else:
+        page_positions_sql = f"""
+            SELECT DISTINCT client_pos FROM {CLIENT_DIRECTORY_TABLE} WHERE {match_clause}
+            ORDER BY client_pos LIMIT :limit OFFSET :offset
+        """
+        params.update(limit=per_page, offset=offset)
+
+    if page_positions_sql:
+        data_sql = f"""
+            SELECT {columns} FROM {CLIENT_DIRECTORY_TABLE}
+            WHERE client_pos IN ({page_positions_sql})
+            ORDER BY client_pos, id
+        """
+    else:
+        data_sql = f"""
+            SELECT {columns} FROM {CLIENT_DIRECTORY_TABLE}
+            WHERE client_pos > :offset AND client_pos <= :offset + :limit
+            ORDER BY client_pos, id
+        """
     all_data = db.session.execute(text(data_sql), params).mappings().all()
+    # Строки одного клиента идут подряд: собираем клиентов и их сделки за один проход
     clients_data, ordered_client_ids = {}, []
     for row in all_data:
         client_id = row['client_id']
         if client_id not in clients_data:
             ordered_client_ids.append(client_id)
-            contact_info = {'id': row.get('client_id'), 'contacts_buy_name': row.get('contacts_buy_name'),
-                            'contacts_buy_phones': row.get('contacts_buy_phones')}
-            clients_data[client_id] = {'contact': contact_info, 'deals': []}
-        clients_data[client_id]['deals'].append(row)
-
-    client_list = []
-    for cid in ordered_client_ids:
-        data = clients_data.get(cid)
-        if data:
-            structured_deals = []
-            for deal_row in data['deals']:
-                sell_obj = type('obj', (object,), {'estate_floor': deal_row.get('estate_floor'),
-                                                   'estate_riser': deal_row.get('estate_riser'),
-                                                   'geo_flatnum': deal_row.get('geo_flatnum'),
-                                                   'estate_rooms': deal_row.get('estate_rooms'),
-                                                   'house': type('obj', (object,),
-                                                                 {'complex_name': deal_row.get('complex_name'),
-                                                                  'name': deal_row.get('house_name')})})
-                structured_deals.append(type('obj', (object,), {'agreement_number': deal_row.get('agreement_number'),
-                                                                'deal_sum': deal_row.get('deal_sum'),
-                                                                'finances_income_reserved': deal_row.get(
-                                                                    'finances_income_reserved'), 'sell': sell_obj}))
-            contact_obj = type('obj', (object,), data['contact'])
-            client_list.append(Client(contact_obj, structured_deals))
+            clients_data[client_id] = {'contact': ClientView.from_row(row), 'deals': []}
+        clients_data[client_id]['deals'].append(DealView.from_row(row))
+
+    client_list = [Client(clients_data[cid]['contact'], clients_data[cid]['deals']) for cid in ordered_client_ids]
 
     pagination = SQLPagination(client_list, page, per_page, total_clients)
+    if client_list:
+        pagination.prev_cursor = encode_cursor(client_list[0].fio, client_list[0].id)
+        pagination.next_cursor = encode_cursor(client_list[-1].fio, client_list[-1].id)
     
     # Получаем данные для модального окна создания заявки без клиента
-    application_types = ApplicationType.query.order_by(ApplicationType.name).all()
-    defect_types_query = DefectType.query.order_by(DefectType.name).all()
-    defect_types = [{'id': dt.id, 'name': dt.name} for dt in defect_types_query]
+    application_types = get_application_types()
+    defect_types = get_defect_types()
     responsible_persons = ResponsiblePerson.query.order_by(ResponsiblePerson.full_name).all()
     
     return render_template('index.html', 
@@ -149,257 +202,117 @@ def index():
                          responsible_persons=responsible_persons)
 
 
-@main.route('/client-service/client/<int:client_id>')
+@main.route('/client-service/api/clients/suggest')
 @login_required
-def client_card(client_id):
-    contact = EstateDealsContacts.query.get_or_404(client_id)
-    deals_for_client = contact.deals.options(selectinload(EstateDeals.sell).selectinload(EstateSells.house)).all()
-    applications = Application.query.filter_by(client_id=client_id).order_by(Application.created_at.desc()).all()
-    client = Client(contact, deals_for_client)
+def suggest_clients_api():
+    """Подсказки при вводе в строку поиска клиентов: клиенты, у которых имя или договор начинается с q."""
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', SUGGEST_LIMIT, type=int), SUGGEST_MAX_LIMIT))
+    suggestions = suggest_clients(db.session, query, limit)
+    for suggestion in suggestions:
+        suggestion['url'] = url_for('main.client_card', client_id=suggestion['id'])
+    return jsonify(suggestions)
 
-    defect_types_query = DefectType.query.order_by(DefectType.name).all()
-    defect_types = [{'id': dt.id, 'name': dt.name} for dt in defect_types_query]
 
-    application_types = ApplicationType.query.order_by(ApplicationType.name).all()
-    application_statuses = current_app.config['APPLICATION_STATUSES']
+@main.route('/client-service/api/clients/by-phone')
+@login_required
+def find_clients_by_phone_api():
+    """Клиенты по номеру телефона (например, входящего звонка): полному или окончанию номера."""
+    clients = find_contacts_by_phone(db.session, request.args.get('phone', ''))
+    for client in clients:
+        client['url'] = url_for('main.client_card', client_id=client['id'])
+    return jsonify(clients)
+
+
+@main.route('/client-service/api/client/<int:client_id>/applications')
+@login_required
+def client_applications_api(client_id):
+    """
+    Следующая страница заявок карточки клиента после курсора after:
+    {"html": строки таблицы, "ids": [...], "next_cursor": курсор или null}.
+    """
+    after = None
+    if request.args.get('after'):
+        after = decode_application_cursor(request.args['after'])
+        if after is None:
+            return jsonify({'error': 'Некорректный курсор страницы.'}), 400
+    limit = max(1, min(request.args.get('limit', CARD_APPLICATIONS_PAGE_SIZE, type=int), CARD_APPLICATIONS_MAX_PAGE_SIZE))
+    applications, next_cursor = load_client_applications(client_id, after, limit)
+    return jsonify({
+        'html': render_template('_client_application_rows.html', applications=applications),
+        'ids': [app.id for app in applications],
+        'next_cursor': next_cursor,
+    })
 
-    warranty_info = {}
-    for deal in deals_for_client:
-        if deal.sell and deal.sell.house:
-            house_key = deal.sell.house.name
-            if house_key and house_key not in warranty_info:
-                warranty_info[house_key] = {
-                    'house_date': deal.sell.house.warranty_house_end_date,
-                    'apartments_date': deal.sell.house.warranty_apartments_end_date
-                }
 
+@main.route('/client-service/client/<int:client_id>')
+@login_required
+def client_card(client_id):
+    card = load_client_card(client_id)
+    if card is None:
+        abort(404)
+
+    application_statuses = current_app.config['APPLICATION_STATUSES']
     current_date = datetime.now().date()
 
     return render_template('client_card.html',
-                           client=client,
-                           applications=applications,
-                           defect_types=defect_types,
-                           application_types=application_types,
+                           client=card['client'],
+                           applications=card['applications'],
+                           applications_cursor=card['applications_cursor'],
+                           defect_types=get_defect_types(),
+                           application_types=get_application_types(),
                            application_statuses=application_statuses,
-                           warranty_info=warranty_info,
+                           warranty_info=card['warranty_info'],
                            current_date=current_date)
 
 @main.route('/client-service/export-applications')
 @login_required
 def export_applications():
-    """Экспорт заявок в Excel с учетом всех фильтров"""
-    # Базовый запрос с предзагрузкой связанных данных
-    query = Application.query.options(
-        joinedload(Application.client),
-        joinedload(Application.responsible_person),
-        joinedload(Application.creator),
-        joinedload(Application.defects)
-    )
-
-    # Фильтрация заявок в зависимости от роли
-    if not current_user.has_role('Админ'):
-        created_by_me = Application.creator_id == current_user.id
-        responsible_for = Application.responsible_person_id == (
-            current_user.responsible_person_profile.id if current_user.responsible_person_profile else -1
-        )
-        query = query.filter(or_(created_by_me, responsible_for))
-    
-    # Применяем те же фильтры, что и в основном маршруте
-    status = request.args.get('status', '')
-    if status:
-        query = query.filter(Application.status == status)
-    
-    app_type = request.args.get('type', '')
-    if app_type:
-        query = query.filter(Application.application_type == app_type)
-    
-    date_from = request.args.get('date_from', '')
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Application.created_at >= date_from_obj)
-        except ValueError:
-            pass
-    
-    date_to = request.args.get('date_to', '')
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-            query = query.filter(Application.created_at <= date_to_obj)
-        except ValueError:
-            pass
-    
-    search = request.args.get('search', '')
-    if search:
-        query = query.join(Application.client).filter(
-            or_(
-                EstateDealsContacts.contacts_buy_name.contains(search),
-                Application.agreement_number.contains(search)
-            )
-        )
-    
-    overdue = request.args.get('overdue', '')
-    if overdue == 'yes':
-        query = query.filter(
-            Application.due_date.isnot(None),
-            Application.due_date < datetime.utcnow(),
-            Application.completed_at.is_(None)
-        )
-    elif overdue == 'no':
-        query = query.filter(
-            or_(
-                Application.due_date.is_(None),
-                Application.due_date >= datetime.utcnow(),
-                Application.completed_at.isnot(None)
-            )
-        )
-    
-    # Сортировка
-    sort = request.args.get('sort', 'created_desc')
-    if sort == 'created_desc':
-        query = query.order_by(Application.created_at.desc())
-    elif sort == 'created_asc':
-        query = query.order_by(Application.created_at.asc())
-    elif sort == 'due_desc':
-        query = query.order_by(Application.due_date.desc().nullslast())
-    elif sort == 'due_asc':
-        query = query.order_by(Application.due_date.asc().nullsfirst())
-    elif sort == 'id_desc':
-        query = query.order_by(Application.id.desc())
-    elif sort == 'id_asc':
-        query = query.order_by(Application.id.asc())
-    else:
-        query = query.order_by(Application.created_at.desc())
+    """Экспорт заявок в Excel (или CSV/Parquet, параметр format) с учетом всех фильтров"""
+    export_format = request.args.get('format', 'xlsx')
+    if export_format != 'xlsx':
+        error = table_format_error(export_format)
+        if error:
+            flash(error, 'danger')
+            return redirect(url_for('main.applications'))
+
+    # Те же фильтры и сортировка, что и в списке заявок; заявки со связями для Excel грузятся страницами в iter_report_rows
+    app_query = ApplicationQuery.from_request_args(request.args, current_user)
+    query = app_query.select()
+
+    empty_message = 'Не найдено заявок для экспорта с указанными фильтрами.'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    # Получаем все заявки без пагинации для экспорта
-    apps = query.all()
-    
-    if not apps:
-        flash('Не найдено заявок для экспорта с указанными фильтрами.', 'info')
+    if export_format != 'xlsx':
+        # CSV/Parquet - одним запросом в DataFrame, без строки с фильтрами над таблицей
+        table = load_applications_table(query, APPLICATIONS_EXPORT_HEADERS)
+        if table.empty:
+            flash(empty_message, 'info')
+            return redirect(url_for('main.applications'))
+        output, size = write_report_table(table, export_format)
+        table_format = TABLE_FORMATS[export_format]
+        return send_report(output, size, f"applications_export_{timestamp}.{table_format['extension']}",
+                           table_format['mimetype'])
+
+    # id всех заявок для экспорта (без пагинации списка)
+    app_ids = load_report_ids(query)
+
+    if not app_ids:
+        flash(empty_message, 'info')
         return redirect(url_for('main.applications'))
 
-    # Создаем Excel файл
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Заявки"
-    
     # Создаем заголовок с информацией о фильтрах
-    filter_info = []
-    if status:
-        filter_info.append(f"Статус: {status}")
-    if app_type:
-        filter_info.append(f"Тип: {app_type}")
-    if date_from:
-        filter_info.append(f"С даты: {date_from}")
-    if date_to:
-        filter_info.append(f"По дату: {date_to}")
-    if search:
-        filter_info.append(f"Поиск: {search}")
-    if overdue == 'yes':
-        filter_info.append("Только просроченные")
-    elif overdue == 'no':
-        filter_info.append("Не просроченные")
-    
-    if filter_info:
-        ws.append([f"Отчет по заявкам. Фильтры: {', '.join(filter_info)}"])
-        ws.merge_cells('A1:N1')
-        ws['A1'].font = Font(bold=True, size=12)
-        ws['A1'].alignment = Alignment(horizontal="left", vertical="center")
-        ws.append([])  # Пустая строка
-    
-    # Заголовки колонок
-    headers = ["ID Заявки", "Дата создания", "Статус", "Тип заявки", "№ Договора", 
-               "ФИО Клиента", "Телефон клиента", "ЖК", "Дом", "Подъезд", "Номер квартиры",
-               "Ответственный", "Email ответственного", "Создатель заявки", "Источник", 
-               "Срок выполнения", "Дата завершения", "Просрочено", "Дата последнего изменения", 
-               "Последний комментарий", "Комментарий к заявке", "Дефекты (Тип: Комментарий)"]
-    ws.append(headers)
-    
-    # Стилизация заголовков
-    for cell in ws[ws.max_row]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    # Заполнение данными
-    for app in apps:
-        # Получаем данные о недвижимости
-        complex_name = "N/A"
-        house_name = "N/A"
-        entrance = "N/A"
-        flat_num = "N/A"
-        
-        if app.client and app.agreement_number:
-            deal = EstateDeals.query.filter_by(
-                agreement_number=app.agreement_number,
-                contacts_buy_id=app.client.id
-            ).first()
-            
-            if deal and deal.sell:
-                sell = deal.sell
-                entrance = sell.geo_house_entrance if sell.geo_house_entrance else "N/A"
-                flat_num = sell.geo_flatnum if sell.geo_flatnum else "N/A"
-                
-                if sell.house:
-                    complex_name = sell.house.complex_name if sell.house.complex_name else "N/A"
-                    house_name = sell.house.name if sell.house.name else "N/A"
-        
-        defects_str = "; ".join([f"{d.defect_type}: {d.description}" for d in app.defects])
-        is_overdue = "Да" if app.is_overdue else "Нет"
-        
-        # Получаем последний комментарий из логов
-        last_log = ApplicationLog.query.filter_by(application_id=app.id).order_by(ApplicationLog.timestamp.desc()).first()
-        last_comment = last_log.comment if last_log else "N/A"
-        
-        row_data = [
-            app.id, 
-            app.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            app.status, 
-            app.application_type,
-            app.agreement_number, 
-            app.client.contacts_buy_name if app.client else "N/A",
-            app.client.contacts_buy_phones if app.client else "N/A",
-            complex_name, 
-            house_name, 
-            entrance, 
-            flat_num,
-            app.responsible_person.full_name if app.responsible_person else "Не назначен",
-            app.responsible_person.email if app.responsible_person else "N/A",
-            app.creator.username if app.creator else "Система",
-            app.source if app.source else "Не указан",
-            app.due_date.strftime('%Y-%m-%d') if app.due_date else "N/A",
-            app.completed_at.strftime('%Y-%m-%d %H:%M:%S') if app.completed_at else "N/A",
-            is_overdue,
-            app.last_status_change.strftime('%Y-%m-%d %H:%M:%S') if app.last_status_change else "N/A",
-            last_comment,
-            app.comment, 
-            defects_str
-        ]
-        ws.append(row_data)
-
-    # Автоматическая настройка ширины колонок
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column].width = adjusted_width
-
-    # Сохранение в буфер
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
+    filter_info = app_query.describe()
+    title = f"Отчет по заявкам. Фильтры: {', '.join(filter_info)}" if filter_info else None
+
+    # Excel-файл пишется потоком во временный файл
+    rows = iter_report_rows(app_ids, APPLICATIONS_EXPORT_HEADERS)
+    output, size = write_report_xlsx("Заявки", APPLICATIONS_EXPORT_HEADERS, rows, title=title)
+
     # Формирование имени файла
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"applications_export_{timestamp}.xlsx"
-    
-    return send_file(buffer, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    return send_report(output, size, filename)
 
 
 @main.route('/client-service/applications')
@@ -407,102 +320,15 @@ def export_applications():
 def applications():
     page = request.args.get('page', 1, type=int)
 
-    # Базовый запрос с предзагрузкой связанных данных для оптимизации
-    query = Application.query.options(
+    # Фильтры и сортировка из параметров запроса; связи для таблицы - тем же запросом
+    query = ApplicationQuery.from_request_args(request.args, current_user).select().options(
         joinedload(Application.client),
-        joinedload(Application.responsible_person),
+        joinedload(Application.responsible_person).lazyload(ResponsiblePerson.assigned_complexes),
         joinedload(Application.creator)
     )
 
-    # Фильтрация заявок в зависимости от роли
-    if not current_user.has_role('Админ'):
-        # Пользователь видит заявки, которые он создал
-        created_by_me = Application.creator_id == current_user.id
-
-        # Пользователь видит заявки, где он - ответственный
-        # (через связь User -> ResponsiblePerson)
-        responsible_for = Application.responsible_person_id == (
-            current_user.responsible_person_profile.id if current_user.responsible_person_profile else -1
-        )
-
-        query = query.filter(or_(created_by_me, responsible_for))
-    
-    # Применяем фильтры
-    # Фильтр по статусу
-    status = request.args.get('status', '')
-    if status:
-        query = query.filter(Application.status == status)
-    
-    # Фильтр по типу заявки
-    app_type = request.args.get('type', '')
-    if app_type:
-        query = query.filter(Application.application_type == app_type)
-    
-    # Фильтр по датам создания
-    date_from = request.args.get('date_from', '')
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Application.created_at >= date_from_obj)
-        except ValueError:
-            pass
-    
-    date_to = request.args.get('date_to', '')
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-            query = query.filter(Application.created_at <= date_to_obj)
-        except ValueError:
-            pass
-    
-    # Поиск по клиенту или номеру договора
-    search = request.args.get('search', '')
-    if search:
-        query = query.join(Application.client).filter(
-            or_(
-                EstateDealsContacts.contacts_buy_name.contains(search),
-                Application.agreement_number.contains(search)
-            )
-        )
-    
-    # Фильтр по просроченным
-    overdue = request.args.get('overdue', '')
-    if overdue == 'yes':
-        # Только просроченные
-        query = query.filter(
-            Application.due_date.isnot(None),
-            Application.due_date < datetime.utcnow(),
-            Application.completed_at.is_(None)
-        )
-    elif overdue == 'no':
-        # Не просроченные
-        query = query.filter(
-            or_(
-                Application.due_date.is_(None),
-                Application.due_date >= datetime.utcnow(),
-                Application.completed_at.isnot(None)
-            )
-        )
-    
-    # Сортировка
-    sort = request.args.get('sort', 'created_desc')
-    if sort == 'created_desc':
-        query = query.order_by(Application.created_at.desc())
-    elif sort == 'created_asc':
-        query = query.order_by(Application.created_at.asc())
-    elif sort == 'due_desc':
-        query = query.order_by(Application.due_date.desc().nullslast())
-    elif sort == 'due_asc':
-        query = query.order_by(Application.due_date.asc().nullsfirst())
-    elif sort == 'id_desc':
-        query = query.order_by(Application.id.desc())
-    elif sort == 'id_asc':
-        query = query.order_by(Application.id.asc())
-    else:
-        query = query.order_by(Application.created_at.desc())
-
     # Пагинация
-    apps_paginated = query.paginate(page=page, per_page=20)
+    apps_paginated = db.paginate(query, page=page, per_page=20)
     
     # Получаем уникальные типы заявок для фильтра
     application_types = db.session.query(Application.application_type).distinct().order_by(Application.application_type).all()
@@ -861,120 +687,93 @@ def get_application_logs(app_id):
     logs = ApplicationLog.query.filter_by(application_id=app_id).options(
         joinedload(ApplicationLog.author)
     ).order_by(ApplicationLog.timestamp.desc()).all()
-    return jsonify(
-        [{'timestamp': log.timestamp.strftime('%d.%m.%Y %H:%M:%S'), 
-          'action': log.action, 
-          'comment': log.comment,
-          'author': log.author.username if log.author else 'Система'} for log in logs])
+    return jsonify([application_log_to_dict(log) for log in logs])
+
+
+@main.route('/client-service/api/applications/logs')
+@login_required
+def get_applications_logs_batch():
+    """Логи нескольких заявок одним запросом: ?ids=1,2,3 -> {"1": [...], "2": [...], "3": [...]}."""
+    try:
+        app_ids = list(dict.fromkeys(int(app_id) for app_id in request.args.get('ids', '').split(',') if app_id.strip()))
+    except ValueError:
+        return jsonify({'error': 'Параметр ids должен быть списком номеров заявок через запятую.'}), 400
+    if len(app_ids) > LOGS_BATCH_MAX_IDS:
+        return jsonify({'error': f'Не больше {LOGS_BATCH_MAX_IDS} заявок за один запрос.'}), 400
+    return jsonify({str(app_id): logs for app_id, logs in load_application_logs(app_ids).items()})
 
 
 @main.route('/client-service/reports')
 @login_required
 @permission_required('Админ')
 def reports():
-    return render_template('reports.html')
+    # Фоновые отчеты пользователя, которые еще хранятся (в работе, готовые к скачиванию, с ошибкой)
+    report_jobs = ReportJob.query.filter_by(created_by_id=current_user.id).order_by(ReportJob.id.desc()).limit(10).all()
+    # Очередь обслуживают потоки процессов веб-сервера: после перезапуска процесса они стартуют здесь
+    start_report_workers(current_app._get_current_object())
+    return render_template('reports.html', report_jobs=[_report_job_json(job) for job in report_jobs])
 
 
-@main.route('/client-service/reports/download', methods=['POST'])
+def _report_job_json(job):
+    data = report_job_to_dict(job)
+    data['title'] = PERIOD_REPORTS[job.kind]['sheet_title']
+    data['period'] = f"{job.start_date:%d.%m.%Y} - {job.end_date:%d.%m.%Y}"
+    data['status_url'] = url_for('main.report_job_status', job_id=job.id)
+    data['download_url'] = url_for('main.download_report_job', job_id=job.id) if job.status == 'success' else None
+    return data
+
+
+def _get_report_job_or_404(job_id):
+    """Задание на отчет; чужие задания видит только администратор."""
+    job = ReportJob.query.get_or_404(job_id)
+    if job.created_by_id != current_user.id and not current_user.has_role('Админ'):
+        abort(404)
+    return job
+
+
+@main.route('/client-service/reports/jobs', methods=['POST'])
 @login_required
 @permission_required('Специалист КЦ', 'Менеджер ДКС', 'Админ')
-def download_report():
-    start_date_str, end_date_str = request.form.get('start_date'), request.form.get('end_date')
-    if not start_date_str or not end_date_str:
-        flash('Необходимо указать и начальную, и конечную дату.', 'danger')
-        return redirect(url_for('main.reports'))
+def create_report_job():
+    """Ставит отчет за период (kind: period / completed) в фоновую очередь и сразу отвечает 202."""
+    kind = request.form.get('kind', 'period')
+    if kind not in PERIOD_REPORTS:
+        return jsonify({'error': 'Неизвестный тип отчета.'}), 400
     try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-    except ValueError:
-        flash('Неверный формат даты.', 'danger')
-        return redirect(url_for('main.reports'))
+        start_date, end_date = parse_report_period(request.form.get('start_date'), request.form.get('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = submit_report_job(current_app._get_current_object(), kind, start_date, end_date, current_user.id)
+    return jsonify(_report_job_json(job)), 202
 
-    apps = Application.query.options(joinedload(Application.client), joinedload(Application.responsible_person),
-                                     joinedload(Application.defects)).filter(Application.created_at >= start_date,
-                                                                             Application.created_at <= end_date).order_by(
-        Application.created_at.desc()).all()
-    if not apps:
-        flash('За указанный период не найдено ни одной заявки.', 'info')
+
+@main.route('/client-service/reports/jobs/<int:job_id>')
+@login_required
+@permission_required('Специалист КЦ', 'Менеджер ДКС', 'Админ')
+def report_job_status(job_id):
+    """Статус и прогресс фонового отчета; для готового - ссылка на скачивание."""
+    job = _get_report_job_or_404(job_id)
+    start_report_workers(current_app._get_current_object())
+    return jsonify(_report_job_json(job))
+
+
+@main.route('/client-service/reports/jobs/<int:job_id>/download')
+@login_required
+@permission_required('Специалист КЦ', 'Менеджер ДКС', 'Админ')
+def download_report_job(job_id):
+    job = _get_report_job_or_404(job_id)
+    if job.status != 'success' or not job.file_path or not os.path.exists(job.file_path):
+        flash('Файл отчета недоступен: отчет еще не готов или срок его хранения истек.', 'warning')
         return redirect(url_for('main.reports'))
+    return send_file(job.file_path, as_attachment=True, download_name=job.filename, mimetype=XLSX_MIMETYPE)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчет по заявкам"
-    headers = ["ID Заявки", "Дата создания", "Статус", "Тип заявки", "№ Договора", "ФИО Клиента", "Телефон клиента",
-               "ЖК", "Дом", "Подъезд", "Номер квартиры",
-               "Ответственный", "Email ответственного", "Источник", "Срок выполнения", "Дата завершения", "Просрочено",
-               "Дата последнего изменения", "Последний комментарий", "Комментарий к заявке", "Дефекты (Тип: Комментарий)"]
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for app in apps:
-        # Получаем данные о недвижимости через связи
-        complex_name = "N/A"
-        house_name = "N/A"
-        entrance = "N/A"
-        flat_num = "N/A"
-        
-        # Ищем сделку по номеру договора
-        if app.client and app.agreement_number:
-            deal = EstateDeals.query.filter_by(
-                agreement_number=app.agreement_number,
-                contacts_buy_id=app.client.id
-            ).first()
-            
-            if deal and deal.sell:
-                sell = deal.sell
-                entrance = sell.geo_house_entrance if sell.geo_house_entrance else "N/A"
-                flat_num = sell.geo_flatnum if sell.geo_flatnum else "N/A"
-                
-                if sell.house:
-                    complex_name = sell.house.complex_name if sell.house.complex_name else "N/A"
-                    house_name = sell.house.name if sell.house.name else "N/A"
-        
-        defects_str = "; ".join([f"{d.defect_type}: {d.description}" for d in app.defects])
-        
-        # Проверяем просроченность
-        is_overdue = "Да" if app.is_overdue else "Нет"
-        
-        # Получаем последний комментарий из логов
-        last_log = ApplicationLog.query.filter_by(application_id=app.id).order_by(ApplicationLog.timestamp.desc()).first()
-        last_comment = last_log.comment if last_log else "N/A"
-        
-        row_data = [app.id, app.created_at.strftime('%Y-%m-%d %H:%M:%S'), app.status, app.application_type,
-                    app.agreement_number, app.client.contacts_buy_name if app.client else "N/A",
-                    app.client.contacts_buy_phones if app.client else "N/A",
-                    complex_name, house_name, entrance, flat_num,
-                    app.responsible_person.full_name if app.responsible_person else "Не назначен",
-                    app.responsible_person.email if app.responsible_person else "N/A",
-                    app.source if app.source else "Не указан",
-                    app.due_date.strftime('%Y-%m-%d') if app.due_date else "N/A",
-                    app.completed_at.strftime('%Y-%m-%d %H:%M:%S') if app.completed_at else "N/A",
-                    is_overdue,
-                    app.last_status_change.strftime('%Y-%m-%d %H:%M:%S') if app.last_status_change else "N/A",
-                    last_comment,
-                    app.comment, defects_str]
-        ws.append(row_data)
-
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(cell.value)
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column].width = adjusted_width
 
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    filename = f"report_{start_date_str}_to_{end_date_str}.xlsx"
-    return send_file(buffer, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@main.route('/client-service/reports/download', methods=['POST'])
+@login_required
+@permission_required('Специалист КЦ', 'Менеджер ДКС', 'Админ')
+def download_report():
+    return _download_period_report('period')
 
 
 @main.route('/client-service/reports/download-completed', methods=['POST'])
@@ -982,130 +781,44 @@ def download_report():
 @permission_required('Специалист КЦ', 'Менеджер ДКС', 'Админ')
 def download_completed_report():
     """Генерирует отчет по завершенным заявкам за указанный период"""
-    start_date_str, end_date_str = request.form.get('start_date'), request.form.get('end_date')
-    if not start_date_str or not end_date_str:
-        flash('Необходимо указать и начальную, и конечную дату.', 'danger')
-        return redirect(url_for('main.reports'))
+    return _download_period_report('completed')
+
+
+def _download_period_report(kind):
+    """
+    Формирует отчет за период (PERIOD_REPORTS[kind]) прямо в запросе и отдает файл:
+    xlsx или, если в форме выбран format, CSV/Parquet.
+    """
+    report = PERIOD_REPORTS[kind]
     try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-    except ValueError:
-        flash('Неверный формат даты.', 'danger')
+        start_date, end_date = parse_report_period(request.form.get('start_date'), request.form.get('end_date'))
+    except ValueError as e:
+        flash(str(e), 'danger')
         return redirect(url_for('main.reports'))
 
-    # Фильтруем только завершенные заявки по дате завершения
-    apps = Application.query.options(
-        joinedload(Application.client), 
-        joinedload(Application.responsible_person),
-        joinedload(Application.defects),
-        joinedload(Application.creator)
-    ).filter(
-        Application.completed_at >= start_date,
-        Application.completed_at <= end_date,
-        Application.status.in_(['Выполнено', 'Закрыто', 'Отклонено'])
-    ).order_by(Application.completed_at.desc()).all()
-    
-    if not apps:
-        flash('За указанный период не найдено ни одной завершенной заявки.', 'info')
+    report_format = request.form.get('format', 'xlsx')
+    if report_format != 'xlsx':
+        error = table_format_error(report_format)
+        if error:
+            flash(error, 'danger')
+            return redirect(url_for('main.reports'))
+        table = load_applications_table(report['query'](start_date, end_date), report['headers'])
+        if table.empty:
+            flash(report['empty_message'], 'info')
+            return redirect(url_for('main.reports'))
+        output, size = write_report_table(table, report_format)
+        table_format = TABLE_FORMATS[report_format]
+        return send_report(output, size, period_report_filename(kind, start_date, end_date, table_format['extension']),
+                           table_format['mimetype'])
+
+    app_ids = load_report_ids(report['query'](start_date, end_date))
+    if not app_ids:
+        flash(report['empty_message'], 'info')
         return redirect(url_for('main.reports'))
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Завершенные заявки"
-    headers = ["ID Заявки", "Дата создания", "Дата завершения", "Время выполнения (дней)", 
-               "Статус", "Тип заявки", "№ Договора", "ФИО Клиента", "Телефон клиента",
-               "ЖК", "Дом", "Подъезд", "Номер квартиры",
-               "Ответственный", "Email ответственного", "Создатель заявки", "Источник", 
-               "Была просрочена", "Дата последнего изменения", "Последний комментарий", 
-               "Комментарий к заявке", "Дефекты (Тип: Комментарий)"]
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for app in apps:
-        # Получаем данные о недвижимости через связи
-        complex_name = "N/A"
-        house_name = "N/A"
-        entrance = "N/A"
-        flat_num = "N/A"
-        
-        # Ищем сделку по номеру договора
-        if app.client and app.agreement_number:
-            deal = EstateDeals.query.filter_by(
-                agreement_number=app.agreement_number,
-                contacts_buy_id=app.client.id
-            ).first()
-            
-            if deal and deal.sell:
-                sell = deal.sell
-                entrance = sell.geo_house_entrance if sell.geo_house_entrance else "N/A"
-                flat_num = sell.geo_flatnum if sell.geo_flatnum else "N/A"
-                
-                if sell.house:
-                    complex_name = sell.house.complex_name if sell.house.complex_name else "N/A"
-                    house_name = sell.house.name if sell.house.name else "N/A"
-        
-        defects_str = "; ".join([f"{d.defect_type}: {d.description}" for d in app.defects])
-        
-        # Рассчитываем время выполнения в днях
-        execution_time = "N/A"
-        if app.completed_at and app.created_at:
-            time_diff = app.completed_at - app.created_at
-            execution_time = time_diff.days
-        
-        # Проверяем, была ли заявка просрочена
-        was_overdue = "Нет"
-        if app.due_date and app.completed_at:
-            if app.completed_at > app.due_date:
-                was_overdue = "Да"
-        
-        # Получаем последний комментарий из логов
-        last_log = ApplicationLog.query.filter_by(application_id=app.id).order_by(ApplicationLog.timestamp.desc()).first()
-        last_comment = last_log.comment if last_log else "N/A"
-        
-        row_data = [
-            app.id, 
-            app.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            app.completed_at.strftime('%Y-%m-%d %H:%M:%S') if app.completed_at else "N/A",
-            execution_time,
-            app.status, 
-            app.application_type,
-            app.agreement_number, 
-            app.client.contacts_buy_name if app.client else "N/A",
-            app.client.contacts_buy_phones if app.client else "N/A",
-            complex_name, house_name, entrance, flat_num,
-            app.responsible_person.full_name if app.responsible_person else "Не назначен",
-            app.responsible_person.email if app.responsible_person else "N/A",
-            app.creator.username if app.creator else "Система",
-            app.source if app.source else "Не указан",
-            was_overdue,
-            app.last_status_change.strftime('%Y-%m-%d %H:%M:%S') if app.last_status_change else "N/A",
-            last_comment,
-            app.comment, 
-            defects_str
-        ]
-        ws.append(row_data)
-
-    # Автоматическая настройка ширины колонок
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)  # Ограничиваем максимальную ширину
-        ws.column_dimensions[column].width = adjusted_width
-
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    filename = f"completed_applications_{start_date_str}_to_{end_date_str}.xlsx"
-    return send_file(buffer, as_attachment=True, download_name=filename,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    rows = iter_report_rows(app_ids, report['headers'])
+    output, size = write_report_xlsx(report['sheet_title'], report['headers'], rows)
+    return send_report(output, size, period_report_filename(kind, start_date, end_date))
 
 
 @main.route('/client-service/deadlines/upload', methods=['GET', 'POST'])
@@ -1255,6 +968,47 @@ def email_logs():
     return render_template('email_logs.html', logs=logs)
 
 
+@main.route('/client-service/admin/sync-status')
+@login_required
+@admin_required
+def sync_status():
+    """
+    Состояние синхронизации по таблице sync_runs: последние запуски и прогресс
+    текущего (его пишет процесс, выполняющий синхронизацию, - веб или flask sync-worker).
+    """
+    def run_to_dict(run):
+        if run is None:
+            return None
+        return {
+            'id': run.id,
+            'mode': run.mode,
+            'trigger': run.trigger,
+            'status': run.status,
+            'started_at': run.started_at.isoformat() if run.started_at else None,
+            'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+            'duration_seconds': run.duration_seconds,
+            'rows_synced': run.rows_synced,
+            'error': run.error,
+            'stage': run.stage,
+            'table': run.current_table,
+            'tables': json.loads(run.tables_progress) if run.tables_progress else {},
+            'progress_updated_at': run.progress_updated_at.isoformat() if run.progress_updated_at else None,
+        }
+
+    recent_runs = SyncRun.query.order_by(SyncRun.id.desc()).limit(10).all()
+    last_success = SyncRun.query.filter_by(status='success').order_by(SyncRun.id.desc()).first()
+    running = next((run for run in recent_runs if run.status == 'running'), None)
+    current_run = run_to_dict(running)
+    return jsonify({
+        'running': running is not None,
+        'progress': {key: current_run[key] for key in ('stage', 'table', 'tables', 'progress_updated_at')}
+                    if current_run else None,
+        'current_run': current_run,
+        'last_success': run_to_dict(last_success),
+        'runs': [run_to_dict(run) for run in recent_runs],
+    })
+
+
 @main.route('/client-service/admin/defect-types', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -1267,6 +1021,7 @@ def manage_defect_types():
                 new_type = DefectType(name=new_type_name)
                 db.session.add(new_type)
                 db.session.commit()
+                invalidate_reference_cache()
                 flash(f'Тип дефекта "{new_type_name}" успешно добавлен.', 'success')
             else:
                 flash(f'Тип дефекта "{new_type_name}" уже существует.', 'warning')
@@ -1286,6 +1041,7 @@ def delete_defect_type(type_id):
     try:
         db.session.delete(type_to_delete)
         db.session.commit()
+        invalidate_reference_cache()
         flash(f'Тип дефекта "{type_to_delete.name}" удален.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1332,6 +1088,7 @@ def manage_application_types():
             new_app_type = ApplicationType(name=name, template_filename=filename, has_defect_list=has_defect_list, execution_days=execution_days)
             db.session.add(new_app_type)
             db.session.commit()
+            invalidate_reference_cache()
             flash(f'Тип заявки "{name}" с шаблоном "{filename}" и сроком выполнения {execution_days} дн.(-я) успешно создан.', 'success')
         else:
             flash('Разрешены только файлы формата .docx', 'danger')
@@ -1404,6 +1161,7 @@ def delete_application_type(type_id):
 
     db.session.delete(app_type_to_delete)
     db.session.commit()
+    invalidate_reference_cache()
     flash(f'Тип заявки "{app_type_to_delete.name}" удален.', 'success')
     return redirect(url_for('main.manage_application_types'))
 
@@ -0,0 +1,186 @@
+# app/services.py
+"""
+Загрузка данных для страниц: карточка клиента за два запроса к базе
+и кеш справочников (типы дефектов и типы заявок) на уровне процесса.
+"""
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text, or_, and_
+from sqlalchemy.orm import joinedload
+from .extensions import db
+from .models import (Application, ApplicationLog, ApplicationType, DefectType, ResponsiblePerson, Client, ClientView,
+                     DealView, SellView, HouseView)
+from .client_index import encode_cursor, decode_cursor
+
+# --- Кеш справочников ---
+# Типы дефектов и типы заявок меняются только в админке, а читаются на каждой
+# карточке клиента и странице списка. Храним их в процессе как словари;
+# маршруты админки сбрасывают кеш после изменения. У каждого воркера gunicorn
+# свой кеш, поэтому записи живут не дольше REFERENCE_CACHE_TTL секунд:
+# изменение в одном воркере видно в остальных не позже чем через TTL.
+REFERENCE_CACHE_TTL = 300
+_reference_cache = {}
+_reference_cache_lock = threading.Lock()
+
+
+def _cached_reference(key, load):
+    """Значение справочника из кеша или результат load(), если запись устарела."""
+    now = time.monotonic()
+    with _reference_cache_lock:
+        entry = _reference_cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+    value = load()
+    with _reference_cache_lock:
+        _reference_cache[key] = (now + REFERENCE_CACHE_TTL, value)
+    return value
+
+
+def invalidate_reference_cache():
+    """Сбрасывает кеш справочников (после изменения типов дефектов или заявок)."""
+    with _reference_cache_lock:
+        _reference_cache.clear()
+
+
+def get_defect_types():
+    """Типы дефектов [{'id', 'name'}] по алфавиту (для JS-формы заявки)."""
+    return _cached_reference('defect_types', lambda: [
+        {'id': dt.id, 'name': dt.name}
+        for dt in DefectType.query.order_by(DefectType.name).all()
+    ])
+
+
+def get_application_types():
+    """Типы заявок [{'id', 'name', 'has_defect_list', 'execution_days'}] по алфавиту."""
+    return _cached_reference('application_types', lambda: [
+        {'id': at.id, 'name': at.name, 'has_defect_list': at.has_defect_list, 'execution_days': at.execution_days}
+        for at in ApplicationType.query.order_by(ApplicationType.name).all()
+    ])
+
+
+# --- Карточка клиента ---
+# Контакт, сделки, объекты и дома - одним запросом с LEFT JOIN: у клиента без
+# сделок будет одна строка с NULL в колонках сделки. Даты гарантии приводятся
+# к date через типы колонок (в SQLite они хранятся строками).
+_CLIENT_CARD_SQL = text("""
+    SELECT c.id AS client_id, c.contacts_buy_name, c.contacts_buy_phones,
+           d.id AS deal_id, d.agreement_number, d.deal_sum, d.finances_income_reserved,
+           s.estate_sell_id, s.estate_floor, s.estate_riser, s.geo_flatnum, s.estate_rooms,
+           h.house_id, h.complex_name, h.name AS house_name,
+           h.warranty_house_end_date, h.warranty_apartments_end_date
+    FROM estate_deals_contacts c
+    LEFT JOIN estate_deals d ON d.contacts_buy_id = c.id
+    LEFT JOIN estate_sells s ON s.estate_sell_id = d.estate_sell_id
+    LEFT JOIN estate_houses h ON h.house_id = s.house_id
+    WHERE c.id = :client_id
+    ORDER BY d.id
+""").columns(warranty_house_end_date=db.Date, warranty_apartments_end_date=db.Date)
+
+
+def load_client_card(client_id):
+    """
+    Данные карточки клиента: {'client', 'applications', 'applications_cursor', 'warranty_info'}
+    или None, если контакта нет.
+    Первый запрос - контакт со сделками, объектами и домами, второй - первая
+    страница заявок клиента (остальные карточка подгружает через API).
+    """
+    rows = db.session.execute(_CLIENT_CARD_SQL, {'client_id': client_id}).mappings().all()
+    if not rows:
+        return None
+
+    contact = ClientView.from_row(rows[0])
+    deals = []
+    warranty_info = {}
+    for row in rows:
+        if row['deal_id'] is None:
+            continue
+        house = None
+        if row['house_id'] is not None:
+            house = HouseView(row['complex_name'], row['house_name'],
+                              row['warranty_house_end_date'], row['warranty_apartments_end_date'])
+            if house.name and house.name not in warranty_info:
+                warranty_info[house.name] = {
+                    'house_date': house.warranty_house_end_date,
+                    'apartments_date': house.warranty_apartments_end_date
+                }
+        sell = None
+        if row['estate_sell_id'] is not None:
+            sell = SellView(row['estate_floor'], row['estate_riser'], row['geo_flatnum'], row['estate_rooms'], house)
+        deals.append(DealView(row['agreement_number'], row['deal_sum'], row['finances_income_reserved'], sell))
+
+    applications, applications_cursor = load_client_applications(client_id)
+
+    return {
+        'client': Client(contact, deals),
+        'applications': applications,
+        'applications_cursor': applications_cursor,
+        'warranty_info': warranty_info,
+    }
+
+
+# --- Заявки и логи в карточке клиента ---
+# Заявки выводятся страницами (новые сначала): первая - при отрисовке карточки,
+# следующие - через API по курсору (created_at, id) последней показанной заявки.
+CARD_APPLICATIONS_PAGE_SIZE = 25
+CARD_APPLICATIONS_MAX_PAGE_SIZE = 100
+LOGS_BATCH_MAX_IDS = 100
+
+
+def encode_application_cursor(application):
+    """Курсор страницы заявок: (created_at, id) последней заявки на странице."""
+    return encode_cursor(application.created_at.isoformat(), application.id)
+
+
+def decode_application_cursor(token):
+    """Возвращает (created_at, id) из курсора или None, если курсор поврежден."""
+    position = decode_cursor(token)
+    if position is None:
+        return None
+    try:
+        return datetime.fromisoformat(position[0]), position[1]
+    except ValueError:
+        return None
+
+
+def load_client_applications(client_id, after=None, limit=CARD_APPLICATIONS_PAGE_SIZE):
+    """
+    Страница заявок клиента после позиции after = (created_at, id) и курсор
+    следующей страницы (None, если это последняя). Ответственные грузятся тем же
+    запросом; assigned_complexes у них (lazy='subquery') карточке не нужен.
+    """
+    query = Application.query.options(
+        joinedload(Application.responsible_person).lazyload(ResponsiblePerson.assigned_complexes)
+    ).filter(Application.client_id == client_id)
+    if after is not None:
+        created_at, app_id = after
+        query = query.filter(or_(Application.created_at < created_at,
+                                 and_(Application.created_at == created_at, Application.id < app_id)))
+    applications = query.order_by(Application.created_at.desc(), Application.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(applications) > limit:
+        applications = applications[:limit]
+        next_cursor = encode_application_cursor(applications[-1])
+    return applications, next_cursor
+
+
+def application_log_to_dict(log):
+    return {'timestamp': log.timestamp.strftime('%d.%m.%Y %H:%M:%S'),
+            'action': log.action,
+            'comment': log.comment,
+            'author': log.author.username if log.author else 'Система'}
+
+
+def load_application_logs(app_ids):
+    """Логи нескольких заявок одним запросом: {id заявки: [лог, ...]}, новые сначала."""
+    logs = {app_id: [] for app_id in app_ids}
+    if not logs:
+        return logs
+    query = ApplicationLog.query.options(joinedload(ApplicationLog.author)).filter(
+        ApplicationLog.application_id.in_(list(logs))
+    ).order_by(ApplicationLog.application_id, ApplicationLog.timestamp.desc())
+    for log in query:
+        logs[log.application_id].append(application_log_to_dict(log))
+    return logs
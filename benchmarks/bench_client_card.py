@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк страницы карточки клиента (/client-service/client/<id>).
+Создает во временной базе клиента с большим количеством сделок и заявок,
+запрашивает карточку через тестовый клиент Flask и печатает время
+отрисовки (p50/p95/max) и количество SQL-запросов на одну страницу.
+
+Запуск:  python benchmarks/bench_client_card.py --deals 200 --applications 300 --requests 200
+"""
+import argparse
+import datetime
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Добавляем корень проекта в путь Python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.mkdtemp(prefix='bench_client_card_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'bench.db')
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from sqlalchemy import event
+from app import create_app
+from app.extensions import db
+from app.models import (User, EstateDealsContacts, EstateDeals, EstateSells, EstateHouses, Application,
+                        ApplicationType, DefectType, ResponsiblePerson)
+
+CLIENT_ID = 1
+
+
+def fill_database(deals, applications, houses=10):
+    """Клиент с deals сделками в houses домах и applications заявками."""
+    db.create_all()
+    admin = User(username='bench', role='Админ')
+    admin.set_password('bench')
+    db.session.add(admin)
+    db.session.add(EstateDealsContacts(id=CLIENT_ID, contacts_buy_name='Корпоративный клиент',
+                                       contacts_buy_phones='+998 90 123-45-67'))
+    for house_id in range(1, houses + 1):
+        db.session.add(EstateHouses(house_id=house_id, complex_name=f'ЖК {house_id % 3}', name=f'Дом {house_id}',
+                                    warranty_house_end_date=datetime.date(2030, 1, 1)))
+    for i in range(1, deals + 1):
+        db.session.add(EstateSells(estate_sell_id=i, house_id=i % houses + 1, estate_floor=i % 16, estate_riser='A',
+                                   geo_flatnum=str(i), estate_rooms=2))
+        db.session.add(EstateDeals(id=i, estate_sell_id=i, contacts_buy_id=CLIENT_ID, agreement_number=f'ДКП-{i:05d}',
+                                   deal_sum=450000.0 + i, finances_income_reserved=1000.0))
+    persons = [ResponsiblePerson(full_name=f'Ответственный {i}', email=f'person{i}@example.com') for i in range(5)]
+    db.session.add_all(persons)
+    for name in ('Гарантия', 'Консультация', 'Документы'):
+        db.session.add(ApplicationType(name=name, has_defect_list=name == 'Гарантия'))
+    for name in ('Окна', 'Двери', 'Сантехника'):
+        db.session.add(DefectType(name=name))
+    db.session.flush()
+    for i in range(applications):
+        db.session.add(Application(client_id=CLIENT_ID, agreement_number=f'ДКП-{i % deals + 1:05d}',
+                                   application_type='Гарантия', comment='Комментарий', status='В работе',
+                                   responsible_person_id=persons[i % len(persons)].id,
+                                   created_at=datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=i)))
+    db.session.commit()
+    return admin.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deals', type=int, default=200)
+    parser.add_argument('--applications', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    try:
+        with app.app_context():
+            user_id = fill_database(args.deals, args.applications)
+            statements = [0]
+            event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        url = f'/client-service/client/{CLIENT_ID}'
+
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"❌ Карточка вернула {response.status_code}")
+            return 1
+
+        timings, queries = [], []
+        for _ in range(args.requests):
+            statements[0] = 0
+            started = time.perf_counter()
+            client.get(url).get_data()
+            timings.append(time.perf_counter() - started)
+            queries.append(statements[0])
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"Карточка: {args.deals} сделок, {args.applications} заявок, {args.requests} запросов")
+        print(f"✔️ p50 {statistics.median(timings) * 1000:.1f} мс, p95 {p95 * 1000:.1f} мс, "
+              f"max {timings[-1] * 1000:.1f} мс; SQL-запросов на страницу: {statistics.median(queries):.0f}")
+    finally:
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
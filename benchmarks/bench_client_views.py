@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк сборки страницы списка клиентов (index) из строк SQL.
+Сравнивает время на страницу:
+  - type:  прежний способ - новые классы type('obj', ...) на каждую сделку
+           (в index и в Client.__init__);
+  - slots: ClientView/DealView/SellView/HouseView и ClientDeal со __slots__.
+
+Запуск:  python benchmarks/bench_client_views.py --clients 100 --deals-per-client 2 --pages 500
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+# Добавляем корень проекта в путь Python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Client, ClientView, DealView
+
+
+def synthetic_rows(clients, deals_per_client):
+    """Строки одной страницы в том виде, в каком их возвращает запрос к client_directory."""
+    rows = []
+    for client_id in range(1, clients + 1):
+        for deal_no in range(deals_per_client):
+            rows.append({
+                'client_id': client_id,
+                'contacts_buy_name': f'Иванов{client_id} Пётр',
+                'contacts_buy_phones': f'+998 90 {client_id:03d}-00-11',
+                'agreement_number': f'ДКП-{client_id:05d}-{deal_no}',
+                'deal_sum': 450000.0 + client_id,
+                'finances_income_reserved': 1000.0,
+                'estate_floor': 5,
+                'estate_riser': 'A',
+                'geo_flatnum': str(client_id),
+                'estate_rooms': 2,
+                'complex_name': 'ЖК Golden House',
+                'house_name': 'Дом 1',
+            })
+    return rows
+
+
+class LegacyClient:
+    """Client.__init__ до перехода на __slots__: новый класс на каждую сделку."""
+
+    def __init__(self, contact, deals):
+        self.id = contact.id
+        self.fio = contact.contacts_buy_name
+        self.phone = contact.contacts_buy_phones
+        self.agreement_numbers = sorted(list(set(d.agreement_number for d in deals if d.agreement_number and d.agreement_number.strip())))
+        self.deals_map = {}
+        self.deals = []
+        for deal in deals:
+            if not deal.agreement_number or not deal.agreement_number.strip():
+                continue
+            sell = deal.sell
+            house = sell.house if sell else None
+            deal_info = {
+                'complex_name': house.complex_name if house else 'N/A',
+                'house_name': house.name if house else 'N/A',
+                'floor': sell.estate_floor if sell else 'N/A',
+                'riser': sell.estate_riser if sell else 'N/A',
+                'flat_num': sell.geo_flatnum if sell else 'N/A',
+                'rooms': sell.estate_rooms if sell else 'N/A',
+                'deal_sum': deal.deal_sum,
+                'to_pay': deal.finances_income_reserved,
+                'agreement_number': deal.agreement_number
+            }
+            self.deals.append(type('obj', (), deal_info)())
+            if house:
+                self.deals_map[deal.agreement_number] = house.complex_name
+
+
+def build_page_type(rows):
+    """Прежняя сборка в index(): три класса type('obj', ...) на каждую строку."""
+    clients_data, ordered_client_ids = {}, []
+    for row in rows:
+        client_id = row['client_id']
+        if client_id not in clients_data:
+            ordered_client_ids.append(client_id)
+            contact_info = {'id': row.get('client_id'), 'contacts_buy_name': row.get('contacts_buy_name'),
+                            'contacts_buy_phones': row.get('contacts_buy_phones')}
+            clients_data[client_id] = {'contact': contact_info, 'deals': []}
+        clients_data[client_id]['deals'].append(row)
+
+    client_list = []
+    for cid in ordered_client_ids:
+        data = clients_data[cid]
+        structured_deals = []
+        for deal_row in data['deals']:
+            sell_obj = type('obj', (object,), {'estate_floor': deal_row.get('estate_floor'),
+                                               'estate_riser': deal_row.get('estate_riser'),
+                                               'geo_flatnum': deal_row.get('geo_flatnum'),
+                                               'estate_rooms': deal_row.get('estate_rooms'),
+                                               'house': type('obj', (object,),
+                                                             {'complex_name': deal_row.get('complex_name'),
+                                                              'name': deal_row.get('house_name')})})
+            structured_deals.append(type('obj', (object,), {'agreement_number': deal_row.get('agreement_number'),
+                                                            'deal_sum': deal_row.get('deal_sum'),
+                                                            'finances_income_reserved': deal_row.get(
+                                                                'finances_income_reserved'), 'sell': sell_obj}))
+        contact_obj = type('obj', (object,), data['contact'])
+        client_list.append(LegacyClient(contact_obj, structured_deals))
+    return client_list
+
+
+def build_page_slots(rows):
+    """Текущая сборка в index(): объекты со __slots__ прямо из строк."""
+    clients_data, ordered_client_ids = {}, []
+    for row in rows:
+        client_id = row['client_id']
+        if client_id not in clients_data:
+            ordered_client_ids.append(client_id)
+            clients_data[client_id] = {'contact': ClientView.from_row(row), 'deals': []}
+        clients_data[client_id]['deals'].append(DealView.from_row(row))
+    return [Client(clients_data[cid]['contact'], clients_data[cid]['deals']) for cid in ordered_client_ids]
+
+
+def bench(label, build, rows, pages):
+    gc.collect()
+    collections_before = sum(stat['collections'] for stat in gc.get_stats())
+    started = time.perf_counter()
+    for _ in range(pages):
+        build(rows)
+    elapsed = time.perf_counter() - started
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - collections_before
+    print(f"{label:>5}: {elapsed / pages * 1000:8.3f} мс на страницу, сборок мусора: {collections}")
+    return elapsed / pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=100, help='клиентов на странице')
+    parser.add_argument('--deals-per-client', type=int, default=2)
+    parser.add_argument('--pages', type=int, default=500, help='сколько раз собрать страницу')
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.clients, args.deals_per_client)
+    print(f"Страница: {args.clients} клиентов, {len(rows)} строк; повторов: {args.pages}")
+    legacy = bench('type', build_page_type, rows, args.pages)
+    current = bench('slots', build_page_slots, rows, args.pages)
+    print(f"✔️ Ускорение: x{legacy / current:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест страницы приложения (по умолчанию /client-service/applications).
+Каждый поток входит в систему под своим cookie-сессией и в течение --duration секунд
+запрашивает страницу. Печатает запросы/с и задержки (p50/p95/max).
+
+Сравнение dev-сервера и gunicorn на одной и той же базе:
+    python run.py                                   # Werkzeug, debug + reloader
+    gunicorn -c gunicorn.conf.py wsgi:app           # production-конфигурация
+    python benchmarks/bench_http_load.py --base-url http://127.0.0.1:80 \
+        --username admin --password *** --concurrency 16 --duration 30
+"""
+import argparse
+import http.cookiejar
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def make_session(base_url, username, password):
+    """Открывает сессию с cookie и выполняет вход через форму логина."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    form = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    response = opener.open(base_url + '/client-service/login', data=form, timeout=30)
+    response.read()
+    if response.geturl().rstrip('/').endswith('/client-service/login'):
+        raise RuntimeError('Не удалось войти: проверьте логин и пароль.')
+    return opener
+
+
+def worker(opener, url, deadline, latencies, errors, lock):
+    local_latencies, local_errors = [], 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with opener.open(url, timeout=60) as response:
+                response.read()
+            local_latencies.append(time.perf_counter() - started)
+        except (urllib.error.URLError, OSError):
+            local_errors += 1
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:80')
+    parser.add_argument('--path', default='/client-service/applications')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='длительность замера, с')
+    parser.add_argument('--warmup', type=float, default=2.0, help='прогрев перед замером, с')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    url = base_url + args.path
+    print(f"Вход {args.concurrency} пользователей на {base_url}...")
+    sessions = [make_session(base_url, args.username, args.password) for _ in range(args.concurrency)]
+
+    lock = threading.Lock()
+    if args.warmup > 0:
+        print(f"Прогрев {args.warmup:.0f} с...")
+        deadline = time.perf_counter() + args.warmup
+        threads = [threading.Thread(target=worker, args=(s, url, deadline, [], [0], lock)) for s in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print(f"Замер: {url}, {args.concurrency} потоков, {args.duration:.0f} с...")
+    latencies, errors = [], [0]
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=worker, args=(s, url, deadline, latencies, errors, lock)) for s in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print(f"❌ Нет успешных запросов (ошибок: {errors[0]}).")
+        return 1
+    print(f"✔️ Запросов: {len(latencies)}, ошибок: {errors[0]}, {len(latencies) / elapsed:.1f} запросов/с")
+    print(f"   Задержка: p50 {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} мс, max {max(latencies) * 1000:.1f} мс")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
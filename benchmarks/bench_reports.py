@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк Excel-отчетов по заявкам: экспорт заявок (/client-service/export-applications),
+отчет за период и отчет по завершенным заявкам (/client-service/reports/...).
+Создает во временной базе --applications заявок с договорами, объектами, домами
+и логами, скачивает каждый отчет через тестовый клиент Flask и печатает
+количество SQL-запросов и время на 1000 строк, а также контрольную сумму
+значений ячеек (для сравнения содержимого отчетов между версиями).
+
+С --trace-memory дополнительно печатает пиковый объем памяти Python (tracemalloc)
+на формирование каждого отчета; время при этом заметно растет.
+С --format csv или parquet отчеты скачиваются в этом формате (нужен pandas/pyarrow);
+контрольные суммы сравнимы только между запусками в одном формате.
+
+Запуск:  python benchmarks/bench_reports.py --applications 5000 [--trace-memory] [--format csv]
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Добавляем корень проекта в путь Python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.mkdtemp(prefix='bench_reports_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'bench.db')
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from openpyxl import load_workbook
+from sqlalchemy import event
+from app import create_app
+from app.extensions import db
+from app.models import (User, EstateDealsContacts, EstateDeals, EstateSells, EstateHouses, Application,
+                        ApplicationLog, Defect, ResponsiblePerson)
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def fill_database(applications, clients=1000, houses=20):
+    """Клиенты со сделками, заявки по их договорам, у части заявок - логи и дефекты."""
+    db.create_all()
+    admin = User(username='bench', role='Админ')
+    admin.set_password('bench')
+    db.session.add(admin)
+    persons = [ResponsiblePerson(full_name=f'Ответственный {i}', email=f'person{i}@example.com') for i in range(5)]
+    db.session.add_all(persons)
+    db.session.flush()
+
+    rows = {'houses': [], 'sells': [], 'deals': [], 'contacts': []}
+    for house_id in range(1, houses + 1):
+        rows['houses'].append({'house_id': house_id, 'complex_name': f'ЖК {house_id % 4}',
+                               'name': f'Дом {house_id}' if house_id % 7 else None})
+    for client_id in range(1, clients + 1):
+        rows['contacts'].append({'id': client_id, 'contacts_buy_name': f'Иванов{client_id} Пётр',
+                                 'contacts_buy_phones': f'+998 90 {client_id:03d}-00-11'})
+        # У каждого десятого клиента нет объекта, у каждого тринадцатого объект без дома
+        sell_id = client_id if client_id % 10 else None
+        if sell_id:
+            rows['sells'].append({'estate_sell_id': sell_id, 'house_id': client_id % houses + 1 if client_id % 13 else None,
+                                  'geo_house_entrance': str(client_id % 4 + 1), 'geo_flatnum': str(client_id)})
+        rows['deals'].append({'id': client_id, 'estate_sell_id': sell_id, 'contacts_buy_id': client_id,
+                              'agreement_number': f'ДКП-{client_id:05d}'})
+    db.session.execute(EstateHouses.__table__.insert(), rows['houses'])
+    db.session.execute(EstateSells.__table__.insert(), rows['sells'])
+    db.session.execute(EstateDeals.__table__.insert(), rows['deals'])
+    db.session.execute(EstateDealsContacts.__table__.insert(), rows['contacts'])
+
+    app_rows, log_rows, defect_rows = [], [], []
+    for i in range(1, applications + 1):
+        created_at = START + datetime.timedelta(minutes=i)
+        completed = i % 3 == 0
+        app_rows.append({'id': i, 'client_id': i % clients + 1, 'creator_id': admin.id if i % 2 else None,
+                         'agreement_number': f'ДКП-{i % clients + 1:05d}' if i % 17 else 'ДКП-нет',
+                         'application_type': 'Гарантия', 'comment': f'Заявка {i}',
+                         'status': 'Выполнено' if completed else 'В работе',
+                         'responsible_person_id': persons[i % len(persons)].id if i % 11 else None,
+                         'created_at': created_at, 'due_date': created_at + datetime.timedelta(days=3),
+                         'completed_at': created_at + datetime.timedelta(days=i % 6) if completed else None,
+                         'source': 'Звонок', 'last_status_change': created_at})
+        for k in range(i % 4):
+            log_rows.append({'application_id': i, 'action': 'Изменение статуса', 'comment': f'Лог {k} заявки {i}',
+                             'timestamp': created_at + datetime.timedelta(hours=k)})
+        if i % 5 == 0:
+            defect_rows.append({'application_id': i, 'defect_type': 'Окна', 'description': 'Продувает'})
+    db.session.execute(Application.__table__.insert(), app_rows)
+    db.session.execute(ApplicationLog.__table__.insert(), log_rows)
+    db.session.execute(Defect.__table__.insert(), defect_rows)
+    db.session.commit()
+    return admin.id
+
+
+def workbook_checksum(data):
+    """Количество строк и контрольная сумма значений ячеек первого листа."""
+    ws = load_workbook(io.BytesIO(data), read_only=True).active
+    digest = hashlib.sha256()
+    count = 0
+    for row in ws.iter_rows(values_only=True):
+        digest.update(repr(row).encode('utf-8'))
+        count += 1
+    return count, digest.hexdigest()[:16]
+
+
+def table_checksum(data, fmt):
+    """Как workbook_checksum, но для выгрузки в формате fmt (CSV/Parquet читаются через pandas)."""
+    if fmt == 'xlsx':
+        return workbook_checksum(data)
+    import pandas as pd
+    if fmt == 'csv':
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    else:
+        df = pd.read_parquet(io.BytesIO(data))
+    return len(df) + 1, hashlib.sha256(df.to_csv(index=False).encode('utf-8')).hexdigest()[:16]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--applications', type=int, default=5000)
+    parser.add_argument('--trace-memory', action='store_true', help='замерить пиковую память (tracemalloc)')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    args = parser.parse_args()
+
+    app = create_app()
+    try:
+        with app.app_context():
+            user_id = fill_database(args.applications)
+            statements = [0]
+            event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+
+        period = {'start_date': '2023-12-01', 'end_date': '2025-12-31'}
+        period['format'] = args.format
+        reports = [
+            ('Экспорт заявок', lambda: client.get(f'/client-service/export-applications?format={args.format}')),
+            ('Отчет за период', lambda: client.post('/client-service/reports/download', data=period)),
+            ('Завершенные заявки', lambda: client.post('/client-service/reports/download-completed', data=period)),
+        ]
+        print(f"Заявок в базе: {args.applications}, формат: {args.format}")
+        for label, download in reports:
+            statements[0] = 0
+            if args.trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            response = download()
+            data = response.get_data()
+            elapsed = time.perf_counter() - started
+            memory = ''
+            if args.trace_memory:
+                memory = f"; пик памяти {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} МБ"
+                tracemalloc.stop()
+            if response.status_code != 200:
+                print(f"❌ {label}: ответ {response.status_code}")
+                return 1
+            rows, checksum = table_checksum(data, args.format)
+            per_thousand = 1000 / max(rows - 1, 1)
+            print(f"✔️ {label}: {rows - 1} строк, {elapsed:.2f} с, SQL-запросов: {statements[0]}; "
+                  f"на 1000 строк: {elapsed * per_thousand:.2f} с, {statements[0] * per_thousand:.0f} запросов; "
+                  f"контрольная сумма {checksum}{memory}")
+    finally:
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
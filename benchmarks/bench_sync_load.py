@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк локальной загрузки данных синхронизации.
+Сравнивает скорость вставки (строк/с) синтетических сделок EstateDeals:
+  - orm:  db.session.bulk_insert_mappings (прежний путь sync_data);
+  - core: data_sync._BulkLoader (insert(table) + executemany, PRAGMA на время загрузки).
+
+Запуск:  python benchmarks/bench_sync_load.py --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Добавляем корень проекта в путь Python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.mkdtemp(prefix='bench_sync_load_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'bench.db')
+
+from app import create_app
+from app.extensions import db
+from app.models import EstateDeals
+from data_sync import _BulkLoader, BATCH_SIZE
+
+
+def synthetic_deals(rows, batch_size):
+    """Генерирует сделки пакетами, чтобы не держать весь набор в памяти."""
+    batch = []
+    agreement_date = datetime.date(2024, 1, 1)
+    for i in range(1, rows + 1):
+        batch.append({
+            'id': i,
+            'estate_sell_id': i,
+            'deal_status_name': 'Сделка проведена',
+            'agreement_number': f'ДКП-{i:07d}',
+            'agreement_date': agreement_date,
+            'deal_sum': 450000.0 + i,
+            'deal_area': 54.3,
+            'contacts_buy_id': i // 2 + 1,
+            'finances_income_reserved': 1000.0,
+        })
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reset_table():
+    db.session.remove()
+    EstateDeals.__table__.drop(db.engine, checkfirst=True)
+    EstateDeals.__table__.create(db.engine)
+
+
+def bench_orm(rows, batch_size):
+    reset_table()
+    started = time.perf_counter()
+    for batch in synthetic_deals(rows, batch_size):
+        db.session.bulk_insert_mappings(EstateDeals, batch)
+    db.session.commit()
+    return time.perf_counter() - started
+
+
+def bench_core(rows, batch_size):
+    reset_table()
+    columns = [col.name for col in EstateDeals.__table__.columns]
+    started = time.perf_counter()
+    with db.engine.connect() as con:
+        with _BulkLoader(con) as loader:
+            for batch in synthetic_deals(rows, batch_size):
+                loader.insert(EstateDeals.__tablename__, columns, batch)
+            con.commit()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Количество синтетических сделок')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help='Размер пакета вставки')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"База для бенчмарка: {db.engine.url}")
+        print(f"Строк: {args.rows}, размер пакета: {args.batch}\n")
+        for name, bench in (('orm  (bulk_insert_mappings)', bench_orm), ('core (_BulkLoader)', bench_core)):
+            seconds = bench(args.rows, args.batch)
+            print(f"{name:<30} {seconds:8.2f} с  {args.rows / seconds:12.0f} строк/с")
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(_tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
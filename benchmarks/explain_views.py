@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Планы запросов (EXPLAIN QUERY PLAN) основных страниц к таблицам estate_*
+до и после индексов из моделей (EstateDeals, EstateSells).
+
+Создает во временной базе --contacts клиентов со сделками, объектами и домами:
+"до" - таблицы без индексов моделей и без статистики планировщика, "после" -
+с индексами моделей и ANALYZE, как после синхронизации (data_sync).
+С --database вместо синтетических данных берется копия указанной базы
+(для "до" из нее удаляются индексы моделей); исходная база не изменяется.
+
+Запуск:  python benchmarks/explain_views.py --contacts 30000 --deals-per-contact 2
+         python benchmarks/explain_views.py --database instance/app.db
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Добавляем корень проекта в путь Python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from app.extensions import db
+from app.models import EstateDeals, EstateDealsContacts, EstateHouses, EstateSells
+from app.client_index import _CLIENT_DIRECTORY_SOURCE_SQL
+from data_sync import ANALYZE_LIMIT
+
+# Запросы страниц в том виде, в каком их выполняют ORM и data_sync
+VIEW_QUERIES = [
+    ("Карточка клиента: сделки клиента (contact.deals)",
+     "SELECT * FROM estate_deals WHERE contacts_buy_id = :contact_id"),
+    ("Карточка клиента: объект со сделками (EstateSells.deals, lazy='joined')",
+     "SELECT * FROM estate_sells LEFT OUTER JOIN estate_deals ON estate_sells.estate_sell_id = estate_deals.estate_sell_id "
+     "WHERE estate_sells.estate_sell_id = :sell_id"),
+    ("Отчеты и письма: сделка по договору и клиенту (filter_by(agreement_number, contacts_buy_id))",
+     "SELECT * FROM estate_deals WHERE agreement_number = :agreement AND contacts_buy_id = :contact_id LIMIT 1"),
+    ("Объекты дома (EstateSells.house_id)",
+     "SELECT * FROM estate_sells WHERE house_id = :house_id"),
+    ("Синхронизация: построение client_directory", _CLIENT_DIRECTORY_SOURCE_SQL),
+]
+# Параметры для --database; для синтетических данных - клиент из середины таблиц (synthetic_params)
+QUERY_PARAMS = {'contact_id': 1, 'sell_id': 1, 'agreement': 'ДКП-1', 'house_id': 1}
+
+
+def model_index_columns():
+    """Наборы колонок индексов, объявленных в моделях estate_*."""
+    return {(model.__tablename__, tuple(col.name for col in index.columns))
+            for model in (EstateDeals, EstateSells) for index in model.__table__.indexes}
+
+
+def drop_model_indexes(connection):
+    """Удаляет из базы индексы моделей (по колонкам: имена могут быть с суффиксом __staging)."""
+    wanted = model_index_columns()
+    dropped = []
+    for table_name in {table for table, _ in wanted}:
+        for index_row in connection.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+            index_name = index_row[1]
+            columns = tuple(info[2] for info in connection.execute(f'PRAGMA index_info("{index_name}")').fetchall())
+            if (table_name, columns) in wanted and not index_name.startswith('sqlite_autoindex'):
+                connection.execute(f'DROP INDEX "{index_name}"')
+                dropped.append(index_name)
+    connection.commit()
+    return dropped
+
+
+def fill_database(path, contacts, deals_per_contact, houses=50):
+    """
+    Таблицы estate_* по моделям и синтетические данные: у клиента deals_per_contact
+    сделок с разными договорами, у каждой сделки свой объект в одном из houses домов.
+    """
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine, tables=[model.__table__ for model in
+                                           (EstateHouses, EstateSells, EstateDealsContacts, EstateDeals)])
+    engine.dispose()
+
+    connection = sqlite3.connect(path)
+    connection.executemany("INSERT INTO estate_houses (house_id, complex_name, name) VALUES (?, ?, ?)",
+                           [(house_id, f'ЖК {house_id % 7}', f'Дом {house_id}') for house_id in range(1, houses + 1)])
+    connection.executemany("INSERT INTO estate_deals_contacts (id, contacts_buy_name, contacts_buy_phones) "
+                           "VALUES (?, ?, ?)",
+                           [(contact_id, f'Иванов{contact_id} Пётр', f'+998 90 {contact_id:07d}')
+                            for contact_id in range(1, contacts + 1)])
+    sells, deals = [], []
+    for contact_id in range(1, contacts + 1):
+        for deal_no in range(deals_per_contact):
+            deal_id = (contact_id - 1) * deals_per_contact + deal_no + 1
+            sells.append((deal_id, deal_id % houses + 1, deal_id % 16 + 1, str(deal_id % 300 + 1), deal_id % 4 + 1))
+            deals.append((deal_id, deal_id, contact_id, f'ДКП-{contact_id}' + (f'/{deal_no}' if deal_no else ''),
+                          450000.0 + deal_id))
+    connection.executemany("INSERT INTO estate_sells (estate_sell_id, house_id, estate_floor, geo_flatnum, "
+                           "estate_rooms) VALUES (?, ?, ?, ?, ?)", sells)
+    connection.executemany("INSERT INTO estate_deals (id, estate_sell_id, contacts_buy_id, agreement_number, "
+                           "deal_sum) VALUES (?, ?, ?, ?, ?)", deals)
+    connection.commit()
+    connection.close()
+    return len(deals)
+
+
+def analyze(connection):
+    """Статистика планировщика, как в конце синхронизации."""
+    connection.execute(f'PRAGMA analysis_limit = {ANALYZE_LIMIT}')
+    connection.execute('ANALYZE')
+    connection.commit()
+
+
+def synthetic_params(contacts, deals_per_contact):
+    """Параметры запросов для клиента из середины синтетических данных (без раннего выхода по LIMIT)."""
+    contact_id = contacts // 2
+    return {'contact_id': contact_id, 'sell_id': (contact_id - 1) * deals_per_contact + 1,
+            'agreement': f'ДКП-{contact_id}', 'house_id': 1}
+
+
+def print_plans(connection, title, params):
+    print(f"\n=== {title} ===")
+    for label, sql in VIEW_QUERIES:
+        print(f"\n-- {label}")
+        for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall():
+            print(f"   {row[3]}")
+        started = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        print(f"   время: {(time.perf_counter() - started) * 1000:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contacts', type=int, default=30000)
+    parser.add_argument('--deals-per-contact', type=int, default=2)
+    parser.add_argument('--database', help='файл SQLite вместо синтетических данных (например, instance/app.db)')
+    args = parser.parse_args()
+
+    if args.database and not os.path.exists(args.database):
+        print(f"❌ База данных не найдена: {args.database}")
+        return 1
+
+    tmp_dir = tempfile.mkdtemp(prefix='explain_views_')
+    try:
+        before_path, after_path = os.path.join(tmp_dir, 'before.db'), os.path.join(tmp_dir, 'after.db')
+        if args.database:
+            source = sqlite3.connect(f'file:{args.database}?mode=ro', uri=True)
+            after = sqlite3.connect(after_path)
+            source.backup(after)
+            source.close()
+            params = QUERY_PARAMS
+            print(f"Копия базы {args.database}")
+        else:
+            deals = fill_database(after_path, args.contacts, args.deals_per_contact)
+            after = sqlite3.connect(after_path)
+            params = synthetic_params(args.contacts, args.deals_per_contact)
+            print(f"Синтетические данные: {args.contacts} клиентов, {deals} сделок и объектов")
+        shutil.copyfile(after_path, before_path)
+        before = sqlite3.connect(before_path)
+        if not args.database:
+            analyze(after)
+        dropped = drop_model_indexes(before)
+        print(f"\"До\": удалены индексы моделей: {', '.join(dropped) or 'нет'}")
+
+        print_plans(before, 'ДО: без индексов моделей', params)
+        print_plans(after, 'ПОСЛЕ: индексы моделей + ANALYZE', params)
+        before.close()
+        after.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,4 +51,40 @@ class Config:
 
     # --- Настройки локальной БД ---
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir+'/instance/', 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # --- Настройки синхронизации ---
+    # Интервал между синхронизациями в часах
+    SYNC_INTERVAL_HOURS = float(os.environ.get('SYNC_INTERVAL_HOURS', 4))
+    # Расписание в формате cron (например, '0 2,13 * * *'); если задано, интервал не используется
+    SYNC_CRON = os.environ.get('SYNC_CRON', '')
+    # Случайная добавка к плановому времени, чтобы запуски не совпадали с пиками источника
+    SYNC_JITTER_SECONDS = int(os.environ.get('SYNC_JITTER_SECONDS', 300))
+    # Повторы после ошибки: экспоненциальная задержка от BASE до MAX секунд, не больше MAX_RETRIES раз
+    SYNC_RETRY_BASE_SECONDS = int(os.environ.get('SYNC_RETRY_BASE_SECONDS', 60))
+    SYNC_RETRY_MAX_SECONDS = int(os.environ.get('SYNC_RETRY_MAX_SECONDS', 3600))
+    SYNC_MAX_RETRIES = int(os.environ.get('SYNC_MAX_RETRIES', 5))
+    # Файл блокировки: одновременно выполняется только одна синхронизация на развертывание
+    SYNC_LOCK_FILE = os.environ.get('SYNC_LOCK_FILE') or os.path.join(basedir, 'instance', 'sync.lock')
+    # Запускать ли синхронизацию внутри веб-процесса (run.py). При отдельном
+    # воркере (`flask sync-worker`) нужно установить SYNC_IN_WEB_PROCESS=false.
+    SYNC_IN_WEB_PROCESS = os.environ.get('SYNC_IN_WEB_PROCESS', 'true').lower() == 'true'
+    # Первая синхронизация при запуске run.py: background - в фоновом потоке, страницы
+    # сразу отдаются по имеющимся локальным данным; blocking - до запуска веб-сервера.
+    SYNC_STARTUP_MODE = os.environ.get('SYNC_STARTUP_MODE', 'background').lower()
+
+    # --- Фоновое формирование отчетов (app/report_jobs.py) ---
+    # Потоков на процесс, папка для готовых файлов и сколько часов файл доступен для скачивания
+    REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+    REPORTS_DIR = os.environ.get('REPORTS_DIR') or os.path.join(basedir, 'instance', 'reports')
+    REPORT_FILE_TTL_HOURS = float(os.environ.get('REPORT_FILE_TTL_HOURS', 24))
+    # Как часто свободный поток проверяет очередь и как часто выполняющееся задание отмечается в базе
+    REPORT_JOB_POLL_SECONDS = float(os.environ.get('REPORT_JOB_POLL_SECONDS', 5))
+    REPORT_JOB_HEARTBEAT_SECONDS = float(os.environ.get('REPORT_JOB_HEARTBEAT_SECONDS', 30))
+    # Выполняющееся задание без отметки дольше этого времени (процесс перезапущен)
+    # возвращается в очередь; после REPORT_JOB_MAX_ATTEMPTS запусков - помечается ошибкой
+    REPORT_JOB_STALE_MINUTES = float(os.environ.get('REPORT_JOB_STALE_MINUTES', 2))
+    REPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('REPORT_JOB_MAX_ATTEMPTS', 2))
+    # Сколько останавливаемый воркер gunicorn (max_requests) ждет свои задания, прежде чем вернуть их в очередь;
+    # должно быть меньше timeout gunicorn, иначе мастер завершит процесс принудительно
+    REPORT_JOB_EXIT_WAIT_SECONDS = float(os.environ.get('REPORT_JOB_EXIT_WAIT_SECONDS', 20))
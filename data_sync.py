@@ -1,136 +1,799 @@
 # data_sync.py
+import datetime
+import hashlib
+import json
+import queue
+import re
+import threading
 import time
 from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.client_index import (CLIENT_SEARCH_TABLE, CLIENT_TABLES, affected_client_ids, all_client_ids,
+                              build_client_tables, client_search_exists, client_tables_need_rebuild, create_client_search,
+                              rebuild_client_tables, refresh_client_tables)
 from app.extensions import db
-from app.models import EstateSells, EstateDeals, EstateDealsContacts, EstateHouses
+from app.models import (EstateSells, EstateDeals, EstateDealsContacts, EstateHouses, SyncRowHash, SyncRun,
+                        ClientDirectory, ClientSuggest, ContactPhone, Application, ApplicationLog, Defect, ReportJob)
 from config import Config
-from sqlalchemy.orm import noload
-from app.models import EstateSells, EstateDeals, EstateDealsContacts, EstateHouses
 # --- НОВОЕ: Устанавливаем размер порции данных для обработки ---
-# Это количество записей, которое будет загружаться в память за один раз.
-# 1000 - это хороший баланс между скоростью и использованием памяти.
+# CHUNK_SIZE - размер окна keyset-пагинации (строк на один запрос к MySQL).
+# Строки окна не материализуются целиком: они читаются потоково (server-side cursor)
+# и передаются дальше пакетами по BATCH_SIZE.
 CHUNK_SIZE = 100000
+BATCH_SIZE = 2000
 
+# Глубина очереди пакетов между потоком чтения таблицы и записью в локальную БД.
+# В памяти одновременно находится не больше (QUEUE_DEPTH + 1) пакетов на таблицу.
+QUEUE_DEPTH = 4
 
-def sync_data():
+# Пока поток записи занят другой таблицей, чтение из открытого потокового курсора
+# стоит на месте. Увеличиваем net_write_timeout, чтобы MySQL не разорвал соединение.
+SOURCE_NET_WRITE_TIMEOUT = 3600
+
+# Размер пакета для UPSERT/DELETE в инкрементальном режиме.
+WRITE_BATCH_SIZE = 500
+
+# Суффиксы теневых таблиц полной перезагрузки и их предыдущих версий при подмене.
+STAGING_SUFFIX = '__staging'
+OLD_SUFFIX = '__old'
+
+# PRAGMA локальной SQLite на время массовой загрузки теневых таблиц
+# (после загрузки возвращаются прежние значения). cache_size < 0 - размер в КиБ.
+BULK_LOAD_PRAGMAS = {'synchronous': 'OFF', 'journal_mode': 'WAL', 'cache_size': '-131072'}
+
+# ANALYZE после синхронизации читает не больше ~ANALYZE_LIMIT строк каждого индекса
+# (PRAGMA analysis_limit): статистика приблизительная, зато не зависит от размера таблиц.
+ANALYZE_LIMIT = 1000
+
+# Порядок синхронизации: сначала родительские таблицы, затем дочерние.
+SYNC_MODELS = [EstateHouses, EstateDealsContacts, EstateSells, EstateDeals]
+
+# Прогресс текущего запуска сохраняется в его строку sync_runs (стадия, таблица,
+# строки по таблицам): /admin/sync-status читает его оттуда, в каком бы процессе
+# ни шла синхронизация (в веб-процессе или в отдельном `flask sync-worker`).
+# Количество строк записывается не чаще раза в SYNC_PROGRESS_INTERVAL секунд.
+SYNC_PROGRESS_INTERVAL = 1.0
+
+_progress = {}
+_progress_lock = threading.Lock()
+
+
+def _set_progress(**fields):
+    """Обновляет стадию (таблицу, режим) текущего запуска и сразу сохраняет прогресс."""
+    with _progress_lock:
+        _progress.update(fields)
+    _save_progress()
+
+
+def _set_table_progress(table_name, rows):
+    with _progress_lock:
+        _progress['table'] = table_name
+        _progress['tables'][table_name] = rows
+        due = time.monotonic() - _progress.get('saved_at', 0) >= SYNC_PROGRESS_INTERVAL
+    if due:
+        _save_progress()
+
+
+def _save_progress():
+    """
+    Пишет прогресс в sync_runs отдельным соединением. Вызывается только после
+    фиксации изменений синхронизации, поэтому не ждет ее же блокировку записи.
+    Ошибка записи прогресса синхронизацию не прерывает.
+    """
+    with _progress_lock:
+        run_id = _progress.get('run_id')
+        values = {
+            'mode': _progress.get('mode'),
+            'stage': _progress.get('stage'),
+            'current_table': _progress.get('table'),
+            'tables_progress': json.dumps(_progress.get('tables', {}), ensure_ascii=False),
+            'progress_updated_at': datetime.datetime.utcnow(),
+        }
+        _progress['saved_at'] = time.monotonic()
+    if run_id is None:
+        return
+    try:
+        with db.engine.begin() as con:
+            con.execute(db.update(SyncRun).where(SyncRun.id == run_id).values(**values))
+    except Exception as e:
+        print(f"   - Не удалось сохранить прогресс синхронизации: {e}")
+
+
+def _source_columns(model):
+    """Колонки, которые забираются из источника для модели."""
+    if model == EstateHouses:
+        # Сроки гарантии заполняются локально (upload_deadlines), в источнике их нет.
+        return [model.house_id, model.complex_name, model.name]
+    return list(model.__table__.columns)
+
+
+def _primary_key(model):
+    return model.__table__.primary_key.columns[0]
+
+
+def _source_query(model):
+    """Базовый запрос к MySQL для модели (без LIMIT/OFFSET)."""
+    # Выбираем колонки таблицы, а не ORM-сущность: так lazy='joined' у EstateSells.deals
+    # не подмешивает связанные сделки и не порождает дубликаты.
+    query = db.select(*_source_columns(model))
+    if model == EstateDeals:
+        # Для EstateDeals принудительно соединяем с родительскими таблицами,
+        # чтобы отфильтровать "осиротевшие" записи в источнике и избежать ошибок FOREIGN KEY.
+        query = (
+            query
+            .join(EstateSells, model.estate_sell_id == EstateSells.estate_sell_id)
+            .join(EstateDealsContacts, model.contacts_buy_id == EstateDealsContacts.id)
+        )
+    return query
+
+
+def _iter_source_chunks(source_session, model):
+    """
+    Отдает строки таблицы-источника пакетами по BATCH_SIZE.
+    Используется keyset-пагинация (WHERE pk > последний ORDER BY pk) вместо OFFSET:
+    MySQL не перечитывает уже обработанные строки, и каждое окно (включая JOIN
+    у EstateDeals) стоит одинаково, так что время выборки растет линейно.
+    Внутри окна строки читаются потоково (stream_results -> SSCursor у PyMySQL),
+    поэтому память не зависит ни от CHUNK_SIZE, ни от размера таблицы.
+    """
+    pk_column = _primary_key(model)
+    pk_name = pk_column.name
+    last_pk = None
+    while True:
+        chunk_query = _source_query(model).order_by(pk_column).limit(CHUNK_SIZE)
+        if last_pk is not None:
+            chunk_query = chunk_query.where(pk_column > last_pk)
+
+        window_rows = 0
+        fetch_seconds = 0.0
+        fetch_started = time.perf_counter()
+        result = source_session.execute(
+            chunk_query, execution_options={'stream_results': True, 'max_row_buffer': BATCH_SIZE}
+        )
+        try:
+            for batch in result.mappings().partitions(BATCH_SIZE):
+                fetch_seconds += time.perf_counter() - fetch_started
+                window_rows += len(batch)
+                last_pk = batch[-1][pk_name]
+                yield batch
+                fetch_started = time.perf_counter()
+        finally:
+            result.close()
+        fetch_seconds += time.perf_counter() - fetch_started
+
+        # Если окно пустое, значит, мы обработали всю таблицу
+        if not window_rows:
+            break
+        print(f"    - [{model.__tablename__}] Выборка {window_rows} записей из MySQL: {fetch_seconds:.2f} с "
+              f"({window_rows / max(fetch_seconds, 1e-6):.0f} записей/с).")
+        if window_rows < CHUNK_SIZE:
+            break
+
+
+class _ExtractionPipeline:
+    """
+    Параллельное чтение таблиц источника.
+    Для каждой таблицы работает свой поток со своим соединением к MySQL, который
+    складывает порции в ограниченную очередь (QUEUE_DEPTH). Запись в локальную БД
+    выполняется одним потоком: он забирает порции через chunks() строго в порядке
+    внешних ключей, пока остальные таблицы уже скачиваются. Объем памяти ограничен
+    глубиной очередей: поток чтения ждет, пока запись не освободит место.
+    """
+
+    _DONE = object()
+
+    def __init__(self, source_engine, models):
+        self._source_engine = source_engine
+        self._queues = {model: queue.Queue(maxsize=QUEUE_DEPTH) for model in models}
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._read_table, args=(model,), name=f'sync-{model.__tablename__}', daemon=True)
+            for model in models
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _put(self, model, item):
+        """Кладет элемент в очередь, пока синхронизация не остановлена."""
+        while not self._stop.is_set():
+            try:
+                self._queues[model].put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_table(self, model):
+        try:
+            with self._source_engine.connect() as source_session:
+                if source_session.dialect.name == 'mysql':
+                    source_session.exec_driver_sql(f'SET SESSION net_write_timeout = {SOURCE_NET_WRITE_TIMEOUT}')
+                for chunk in _iter_source_chunks(source_session, model):
+                    if not self._put(model, chunk):
+                        return
+            self._put(model, self._DONE)
+        except Exception as e:
+            # Ошибку чтения передаем в поток записи, там она будет выброшена
+            self._put(model, e)
+
+    def chunks(self, model):
+        """Отдает порции таблицы по мере их скачивания."""
+        model_queue = self._queues[model]
+        while True:
+            item = model_queue.get()
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """Останавливает потоки чтения (в том числе после ошибки записи)."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def _row_hash(row):
+    """Контрольная сумма строки источника (64-битное знаковое целое)."""
+    digest = hashlib.blake2b(repr(tuple(row.values())).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _hash_mappings(model, chunk):
+    pk_name = _primary_key(model).name
+    table_name = model.__tablename__
+    return [{'table_name': table_name, 'pk': row[pk_name], 'row_hash': _row_hash(row)} for row in chunk]
+
+
+def _has_sync_state(local_session):
+    """Есть ли контрольные суммы для всех синхронизируемых таблиц."""
+    synced_tables = {
+        name for (name,) in local_session.execute(db.select(SyncRowHash.table_name).distinct())
+    }
+    return all(model.__tablename__ in synced_tables for model in SYNC_MODELS)
+
+
+def _upsert(local_session, model, rows):
+    """INSERT ... ON CONFLICT DO UPDATE только по колонкам источника."""
+    if not rows:
+        return
+    table = model.__table__
+    pk_name = _primary_key(model).name
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[pk_name],
+        set_={col.name: stmt.excluded[col.name] for col in _source_columns(model) if col.name != pk_name}
+    )
+    local_session.execute(stmt, rows)
+
+
+def _upsert_hashes(local_session, hash_rows):
+    if not hash_rows:
+        return
+    stmt = sqlite_insert(SyncRowHash.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['table_name', 'pk'],
+        set_={'row_hash': stmt.excluded.row_hash}
+    )
+    local_session.execute(stmt, hash_rows)
+
+
+class _BulkLoader:
+    """
+    Быстрая массовая вставка в локальную SQLite.
+    Вместо ORM (bulk_insert_mappings с unit-of-work) используется один раз
+    скомпилированный insert(table) и executemany курсора DBAPI с кортежами значений.
+    На время загрузки включаются BULK_LOAD_PRAGMAS, при выходе восстанавливаются прежние.
+    """
+
+    def __init__(self, con):
+        self._con = con
+        self._saved_pragmas = {}
+        self._statements = {}
+
+    def _pragma(self, name, value=None):
+        sql = f'PRAGMA {name}' if value is None else f'PRAGMA {name} = {value}'
+        result = self._con.exec_driver_sql(sql)
+        return result.scalar() if result.returns_rows else None
+
+    def __enter__(self):
+        for name, value in BULK_LOAD_PRAGMAS.items():
+            try:
+                self._saved_pragmas[name] = self._pragma(name)
+                self._pragma(name, value)
+            except Exception as e:
+                # journal_mode нельзя сменить, пока БД заблокирована другим соединением
+                print(f"   - Не удалось установить PRAGMA {name} = {value}: {e}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._con.in_transaction():
+            self._con.rollback() if exc_type else self._con.commit()
+        for name, value in self._saved_pragmas.items():
+            try:
+                self._pragma(name, value)
+            except Exception as e:
+                print(f"   - Не удалось восстановить PRAGMA {name} = {value}: {e}")
+        return False
+
+    def insert(self, table_name, column_names, rows):
+        """Вставляет строки (словари/RowMapping) одним executemany."""
+        if not rows:
+            return
+        key = (table_name, tuple(column_names))
+        sql = self._statements.get(key)
+        if sql is None:
+            table = db.table(table_name, *[db.column(name) for name in column_names])
+            sql = self._statements[key] = str(db.insert(table).compile(dialect=self._con.dialect))
+        # exec_driver_sql со списком кортежей - это прямой cursor.executemany() драйвера
+        self._con.exec_driver_sql(sql, [tuple(row[name] for name in column_names) for row in rows])
+
+
+def _staging_name(table_name):
+    return f'{table_name}{STAGING_SUFFIX}'
+
+
+def _staging_index_name(index_name):
+    """
+    Имена индексов в SQLite глобальны и не переименовываются вместе с таблицей,
+    поэтому у теневой таблицы индекс получает "парное" имя: суффикс добавляется
+    или снимается поочередно от синхронизации к синхронизации.
+    """
+    if index_name.endswith(STAGING_SUFFIX):
+        return index_name[:-len(STAGING_SUFFIX)]
+    return index_name + STAGING_SUFFIX
+
+
+def _create_staging_table(con, table_name):
+    """Создает пустую теневую таблицу с той же схемой (DDL берется из sqlite_master)."""
+    staging = _staging_name(table_name)
+    con.execute(db.text(f'DROP TABLE IF EXISTS "{staging}"'))
+    ddl = con.execute(
+        db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table_name}
+    ).scalar()
+    staging_ddl = re.sub(r'^CREATE TABLE\s+("?)' + re.escape(table_name) + r'\1',
+                         f'CREATE TABLE "{staging}"', ddl, count=1, flags=re.IGNORECASE)
+    con.execute(db.text(staging_ddl))
+
+
+def _create_staging_indexes(con, table_name):
+    """Строит на теневой таблице те же индексы, что и на рабочей."""
+    staging = _staging_name(table_name)
+    indexes = con.execute(
+        db.text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"),
+        {'name': table_name}
+    ).all()
+    for index_name, ddl in indexes:
+        staging_ddl = re.sub(
+            r'^(CREATE\s+(?:UNIQUE\s+)?INDEX\s+)("?)' + re.escape(index_name) + r'\2(\s+ON\s+)("?)'
+            + re.escape(table_name) + r'\4',
+            lambda m: f'{m.group(1)}"{_staging_index_name(index_name)}"{m.group(3)}"{staging}"',
+            ddl, count=1, flags=re.IGNORECASE
+        )
+        con.execute(db.text(staging_ddl))
+
+
+def _existing_index_columns(con, table_name):
+    """Наборы колонок индексов таблицы (имена индексов могут быть "парными", см. _staging_index_name)."""
+    existing = set()
+    for index_row in con.exec_driver_sql(f'PRAGMA index_list("{table_name}")').all():
+        index_name = index_row[1]
+        columns = tuple(info[2] for info in con.exec_driver_sql(f'PRAGMA index_info("{index_name}")').all())
+        existing.add(columns)
+    return existing
+
+
+def _ensure_model_columns(con, model):
+    """
+    Добавляет в существующую таблицу модели колонки, которых в ней еще нет
+    (db.create_all() существующие таблицы не меняет). Добавляются только
+    необязательные колонки - ALTER TABLE ADD COLUMN без значения по умолчанию.
+    Возвращает имена добавленных колонок.
+    """
+    table_name = model.__tablename__
+    existing = {row[1] for row in con.exec_driver_sql(f'PRAGMA table_info("{table_name}")').all()}
+    added = []
+    for column in model.__table__.columns:
+        if column.name in existing or not column.nullable or column.primary_key:
+            continue
+        column_type = column.type.compile(dialect=con.dialect)
+        con.exec_driver_sql(f'ALTER TABLE "{table_name}" ADD COLUMN "{column.name}" {column_type}')
+        added.append(f'{table_name}.{column.name}')
+    return added
+
+
+def _ensure_model_indexes(con, model, table_name=None):
+    """
+    Создает на таблице (по умолчанию - рабочей таблице модели) индексы из модели,
+    которых на ней еще нет. Наличие проверяется по колонкам, а не по имени:
+    после полной перезагрузки рабочие индексы могут называться с суффиксом __staging.
+    Возвращает имена созданных индексов.
+    """
+    table_name = table_name or model.__tablename__
+    existing = _existing_index_columns(con, table_name)
+    taken_names = {row[0] for row in con.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").all()}
+    created = []
+    for index in model.__table__.indexes:
+        columns = tuple(col.name for col in index.columns)
+        if columns in existing:
+            continue
+        index_name = index.name if index.name not in taken_names else _staging_index_name(index.name)
+        unique = 'UNIQUE ' if index.unique else ''
+        con.exec_driver_sql(
+            f'CREATE {unique}INDEX "{index_name}" ON "{table_name}" ({", ".join(columns)})'
+        )
+        created.append(index_name)
+    return created
+
+
+def _analyze():
+    """Обновляет статистику планировщика SQLite (sqlite_stat1) после изменения данных."""
+    started = time.perf_counter()
+    with db.engine.connect() as con:
+        con.exec_driver_sql(f'PRAGMA analysis_limit = {ANALYZE_LIMIT}')
+        con.exec_driver_sql('ANALYZE')
+        con.commit()
+    print(f"✔️ Статистика планировщика обновлена (ANALYZE) за {time.perf_counter() - started:.2f} с.")
+
+
+def _copy_local_columns(con, model):
+    """Переносит в теневую таблицу колонки, которые заполняются только локально (например, сроки гарантии)."""
+    source_names = {col.name for col in _source_columns(model)}
+    local_columns = [col.name for col in model.__table__.columns if col.name not in source_names]
+    if not local_columns:
+        return
+    table_name = model.__tablename__
+    staging = _staging_name(table_name)
+    pk_name = _primary_key(model).name
+    assignments = ', '.join(
+        f'{name} = (SELECT live.{name} FROM "{table_name}" AS live WHERE live.{pk_name} = "{staging}".{pk_name})'
+        for name in local_columns
+    )
+    con.execute(db.text(f'UPDATE "{staging}" SET {assignments}'))
+
+
+def _swap_staging_tables(table_names):
+    """
+    Одной короткой транзакцией подменяет рабочие таблицы теневыми.
+    Читатели видят либо старый снимок данных целиком, либо новый.
+    legacy_alter_table=ON не дает SQLite переписать ссылки FOREIGN KEY в других
+    таблицах (applications, responsible_assignments) на переименованные старые таблицы.
+    """
+    raw_connection = db.engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        raw_connection.commit()
+        foreign_keys = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+        legacy_alter_table = cursor.execute('PRAGMA legacy_alter_table').fetchone()[0]
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        cursor.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            for name in table_names:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}{OLD_SUFFIX}"')
+
+            swap_started = time.perf_counter()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for name in table_names:
+                    cursor.execute(f'ALTER TABLE "{name}" RENAME TO "{name}{OLD_SUFFIX}"')
+                    cursor.execute(f'ALTER TABLE "{_staging_name(name)}" RENAME TO "{name}"')
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            print(f"✔️ Таблицы подменены за {(time.perf_counter() - swap_started) * 1000:.1f} мс.")
+
+            for name in table_names:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}{OLD_SUFFIX}"')
+            print("✔️ Старые версии таблиц удалены.")
+        finally:
+            cursor.execute(f'PRAGMA legacy_alter_table = {legacy_alter_table}')
+            cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+    finally:
+        raw_connection.close()
+
+
+def _full_reload(pipeline):
+    """
+    Полная перезагрузка через теневые таблицы (<таблица>__staging).
+    Теневые таблицы создаются сразу с индексами и заполняются порциями, каждая
+    порция фиксируется отдельно: блокировка записи SQLite держится миллисекунды
+    на порцию, а не всю загрузку таблицы, и приложение может сохранять заявки.
+    По загруженным теневым таблицам так же порциями строятся теневые копии
+    производных таблиц клиентов (список, подсказки, телефоны, поиск).
+    Затем все таблицы подменяются одной короткой транзакцией. Пока идет загрузка,
+    страницы приложения продолжают работать со старым снимком данных.
+    """
+    # --- ЭТАП 2: Загрузка в теневые таблицы ---
+    print("\n--- ЭТАП 2: Загрузка данных в теневые таблицы ---")
+    swap_tables = [model.__tablename__ for model in SYNC_MODELS] + [SyncRowHash.__tablename__]
+    total_records_synced = 0
+
+    _set_progress(stage='load')
+    with db.engine.connect() as con:
+        # Индексы строятся на пустых таблицах и дальше пополняются порциями:
+        # построение индекса по загруженной таблице держало бы блокировку записи секундами
+        print("-> Создание теневых таблиц и индексов...")
+        for table_name in swap_tables:
+            _create_staging_table(con, table_name)
+            _create_staging_indexes(con, table_name)
+        # Индексы, объявленные в моделях, но еще отсутствующие на рабочих таблицах
+        for model in SYNC_MODELS:
+            for index_name in _ensure_model_indexes(con, model, _staging_name(model.__tablename__)):
+                print(f"    - Новый индекс: {index_name}")
+        con.commit()
+
+        staging_hashes = _staging_name(SyncRowHash.__tablename__)
+        hash_columns = [col.name for col in SyncRowHash.__table__.columns]
+
+        with _BulkLoader(con) as loader:
+            for model in SYNC_MODELS:
+                table_name = model.__tablename__
+                print(f"--> Синхронизация таблицы: {table_name}...")
+                staging_table = _staging_name(table_name)
+                columns = [col.name for col in _source_columns(model)]
+                model_records_synced = 0
+                write_seconds = 0.0
+                table_started = time.perf_counter()
+
+                for chunk in pipeline.chunks(model):
+                    write_started = time.perf_counter()
+                    loader.insert(staging_table, columns, chunk)
+                    # Запоминаем контрольные суммы строк для следующей инкрементальной синхронизации
+                    loader.insert(staging_hashes, hash_columns, _hash_mappings(model, chunk))
+                    con.commit()
+                    write_seconds += time.perf_counter() - write_started
+                    model_records_synced += len(chunk)
+                    _set_table_progress(table_name, model_records_synced)
+
+                _copy_local_columns(con, model)
+                con.commit()
+                total_records_synced += model_records_synced
+                print(f"✔️ Синхронизация таблицы {table_name} завершена. Всего записей: {model_records_synced} "
+                      f"за {time.perf_counter() - table_started:.2f} с (из них запись: {write_seconds:.2f} с).\n")
+
+    print(f"\n✔️ ЭТАП 2 ЗАВЕРШЕН. Всего загружено {total_records_synced} записей.")
+
+    # --- ЭТАП 3: Производные таблицы клиентов ---
+    swap_tables += _build_staging_client_tables()
+
+    # --- ЭТАП 4: Подмена таблиц ---
+    print("\n--- ЭТАП 4: Подмена рабочих таблиц теневыми ---")
+    _set_progress(stage='swap')
+    _swap_staging_tables(swap_tables)
+    return total_records_synced
+
+
+def _build_staging_client_tables():
+    """
+    Строит теневые копии производных таблиц клиентов по теневым таблицам estate_*.
+    Возвращает имена рабочих таблиц, которые нужно подменить вместе с estate_*.
+    """
+    print("\n--- ЭТАП 3: Построение списка клиентов и поисковых индексов ---")
+    _set_progress(stage='client_index', table=None)
+    started = time.perf_counter()
+    derived_models = [ClientDirectory, ClientSuggest, ContactPhone]
+    derived_tables = [model.__tablename__ for model in derived_models]
+    with db.engine.connect() as con:
+        for model in derived_models:
+            _create_staging_table(con, model.__tablename__)
+            _create_staging_indexes(con, model.__tablename__)
+            _ensure_model_indexes(con, model, _staging_name(model.__tablename__))
+        staging_tables = {key: _staging_name(name) for key, name in CLIENT_TABLES.items()}
+        # Таблицу поиска подменяем, только если рабочая есть (SQLite с FTS5)
+        con.execute(db.text(f'DROP TABLE IF EXISTS "{staging_tables["search"]}"'))
+        if client_search_exists(con) and create_client_search(con, staging_tables['search']):
+            derived_tables.append(CLIENT_SEARCH_TABLE)
+        else:
+            staging_tables['search'] = None
+        con.commit()
+
+        counts = build_client_tables(con, staging_tables)
+    for table_name, rows in counts.items():
+        print(f"    - {table_name}: {rows}")
+    print(f"✔️ Производные таблицы построены за {time.perf_counter() - started:.2f} с.")
+    return derived_tables
+
+
+def _known_hashes(local_session, table_name, after_pk, upto_pk):
+    """Контрольные суммы строк таблицы с pk в диапазоне (after_pk, upto_pk]; None - без границы."""
+    query = db.select(SyncRowHash.pk, SyncRowHash.row_hash).where(SyncRowHash.table_name == table_name)
+    if after_pk is not None:
+        query = query.where(SyncRowHash.pk > after_pk)
+    if upto_pk is not None:
+        query = query.where(SyncRowHash.pk <= upto_pk)
+    return dict(local_session.execute(query).all())
+
+
+def _incremental_sync(pipeline, local_session):
+    """
+    Инкрементальная синхронизация по контрольным суммам строк.
+    В источнике нет колонок с временем изменения, поэтому для каждой строки
+    хранится хеш (таблица sync_row_hashes). Записываются только новые и
+    изменившиеся строки, исчезнувшие из источника удаляются.
+    Порции источника приходят по возрастанию pk, поэтому с каждой сравниваются
+    только хеши того же диапазона pk: в памяти нет хешей всей таблицы. Изменения
+    порции фиксируются сразу после сравнения - блокировка записи SQLite не
+    держится, пока ждем MySQL, и заявки можно сохранять во время синхронизации.
+    Хеш строки пишется в той же транзакции, что и сама строка, поэтому после
+    сбоя следующий запуск продолжит с того места, где остановился этот.
+    Возвращает (количество записанных и удаленных строк, {таблица: pk записанных
+    и удаленных строк}) - по ним обновляются производные таблицы клиентов.
+    """
+    print("\n--- ЭТАП 2: Поиск и применение изменений ---")
+    _set_progress(stage='compare')
+    vanished_by_model = {}
+    total_upserted = 0
+    changed = {model.__tablename__: set() for model in SYNC_MODELS}
+
+    for model in SYNC_MODELS:
+        table_name = model.__tablename__
+        pk_name = _primary_key(model).name
+        print(f"--> Сравнение таблицы: {table_name}...")
+        vanished = vanished_by_model[model] = []
+        model_upserted = 0
+        rows_compared = 0
+        last_pk = None
+
+        for chunk in pipeline.chunks(model):
+            chunk_last_pk = chunk[-1][pk_name]
+            known_hashes = _known_hashes(local_session, table_name, last_pk, chunk_last_pk)
+            changed_rows, changed_hashes = [], []
+            for row in chunk:
+                pk = row[pk_name]
+                row_hash = _row_hash(row)
+                if known_hashes.pop(pk, None) != row_hash:
+                    changed_rows.append(dict(row))
+                    changed_hashes.append({'table_name': table_name, 'pk': pk, 'row_hash': row_hash})
+            # Что осталось - есть локально в этом диапазоне pk, но не в источнике
+            vanished.extend(known_hashes)
+
+            for start in range(0, len(changed_rows), WRITE_BATCH_SIZE):
+                _upsert(local_session, model, changed_rows[start:start + WRITE_BATCH_SIZE])
+                _upsert_hashes(local_session, changed_hashes[start:start + WRITE_BATCH_SIZE])
+            local_session.commit()
+            changed[table_name].update(row_hash['pk'] for row_hash in changed_hashes)
+            last_pk = chunk_last_pk
+            model_upserted += len(changed_rows)
+            rows_compared += len(chunk)
+            _set_table_progress(table_name, rows_compared)
+
+        # Строки с pk больше последнего из источника (или все, если таблица в источнике пуста)
+        vanished.extend(_known_hashes(local_session, table_name, last_pk, None))
+        local_session.commit()
+        total_upserted += model_upserted
+        print(f"    - Новых или измененных записей: {model_upserted}, исчезло из источника: {len(vanished)}.")
+
+    # Удаляем исчезнувшие записи от дочерних таблиц к родительским, каждую пачку - своей транзакцией
+    _set_progress(stage='apply', table=None)
+    total_deleted = 0
+    for model in reversed(SYNC_MODELS):
+        vanished = vanished_by_model[model]
+        pk_column = _primary_key(model)
+        for start in range(0, len(vanished), WRITE_BATCH_SIZE):
+            batch = vanished[start:start + WRITE_BATCH_SIZE]
+            local_session.execute(db.delete(model.__table__).where(pk_column.in_(batch)))
+            local_session.execute(db.delete(SyncRowHash.__table__).where(
+                SyncRowHash.table_name == model.__tablename__, SyncRowHash.pk.in_(batch)))
+            local_session.commit()
+        changed[model.__tablename__].update(vanished)
+        total_deleted += len(vanished)
+
+    print(f"\n✔️ ЭТАП 2 ЗАВЕРШЕН. Записано {total_upserted} записей, удалено {total_deleted}.")
+    return total_upserted + total_deleted, changed
+
+
+def _client_index_stale(run_id):
+    """
+    True, если предыдущий запуск - неудавшаяся инкрементальная синхронизация:
+    ее изменения могли быть записаны без обновления производных таблиц клиентов.
+    """
+    previous = db.session.execute(
+        db.select(SyncRun.mode, SyncRun.status).where(SyncRun.id < run_id).order_by(SyncRun.id.desc()).limit(1)
+    ).first()
+    return previous is not None and previous.mode == 'incremental' and previous.status == 'failed'
+
+
+def _refresh_client_index(changed, refresh_all=False):
+    """
+    Обновляет производные таблицы клиентов (список, поиск, подсказки, телефоны)
+    после инкрементальной синхронизации - только для затронутых клиентов.
+    changed - {таблица: pk записанных и удаленных строк} из _incremental_sync;
+    refresh_all=True - для всех клиентов (после неудавшейся синхронизации).
+    """
+    print("\n--- ЗАВЕРШАЮЩИЙ ЭТАП: Обновление списка клиентов и поисковых индексов ---")
+    _set_progress(stage='client_index', table=None)
+    started = time.perf_counter()
+    with db.engine.connect() as con:
+        if refresh_all:
+            print("-> Предыдущая синхронизация не завершилась: обновляются все клиенты.")
+            client_ids = phone_contact_ids = all_client_ids(con)
+        else:
+            client_ids = affected_client_ids(con, changed)
+            phone_contact_ids = changed[EstateDealsContacts.__tablename__]
+        print(f"-> Затронуто клиентов: {len(client_ids)}.")
+        counts = refresh_client_tables(con, client_ids, phone_contact_ids)
+    for table_name, rows in counts.items():
+        print(f"    - {table_name}: {rows}")
+    print(f"✔️ Производные таблицы обновлены за {time.perf_counter() - started:.2f} с.")
+
+
+def _start_sync_run(mode, trigger):
+    """Создает запись о запуске в sync_runs; "зависшие" запуски помечаются прерванными."""
+    db.session.execute(
+        db.update(SyncRun).where(SyncRun.status == 'running')
+        .values(status='failed', error='Синхронизация была прервана', finished_at=datetime.datetime.utcnow())
+    )
+    sync_run = SyncRun(mode=mode, trigger=trigger, status='running', started_at=datetime.datetime.utcnow())
+    db.session.add(sync_run)
+    db.session.commit()
+    return sync_run.id
+
+
+def _finish_sync_run(run_id, status, mode, rows_synced=None, error=None):
+    sync_run = db.session.get(SyncRun, run_id)
+    sync_run.status = status
+    sync_run.mode = mode
+    sync_run.rows_synced = rows_synced
+    sync_run.error = error
+    sync_run.finished_at = datetime.datetime.utcnow()
+    sync_run.duration_seconds = (sync_run.finished_at - sync_run.started_at).total_seconds()
+    db.session.commit()
+
+
+def sync_data(full=False, trigger='manual'):
     """
     Синхронизирует данные из удаленной БД MySQL в локальную БД SQLite.
-    ОБНОВЛЕННАЯ ЛОГИКА: Обрабатывает данные порциями (чанками),
-    чтобы избежать переполнения памяти при работе с большими таблицами.
+    По умолчанию работает инкрементально: переносит только изменившиеся строки.
+    full=True (или отсутствие сохраненных контрольных сумм) - полная перезагрузка
+    с очисткой таблиц, данные обрабатываются порциями (чанками).
+    Каждый запуск записывается в sync_runs. Возвращает 'success' или 'failed'.
     """
     print(f"\n[{time.ctime()}] ЗАПУСК ПРОЦЕССА СИНХРОНИЗАЦИИ ДАННЫХ")
 
     source_engine = None
-    source_session = None
+    pipeline = None
+    mode = 'full' if full else 'incremental'
+    run_id = _start_sync_run(mode, trigger)
+    with _progress_lock:
+        _progress.clear()
+    _set_progress(run_id=run_id, mode=mode, stage='connect', table=None, tables={})
 
     try:
-        # --- ЭТАП 1: Подключение к БД и очистка локальных таблиц ---
+        # --- ЭТАП 1: Подключение к БД ---
         print("\n--- ЭТАП 1: Подготовка ---")
         print("-> Подключение к удаленной базе данных MySQL...")
         source_engine = create_engine(Config.SOURCE_DATABASE_URI)
-        source_session = source_engine.connect()
+        with source_engine.connect():
+            pass
         print("✔️ Подключение к MySQL успешно.")
 
         local_session = db.session
-        print("-> Очистка синхронизируемых таблиц в локальной БД...")
-        # Определяем порядок удаления (от дочерних к родительским)
-        models_to_clear = [EstateDeals, EstateSells, EstateDealsContacts, EstateHouses]
-
-        print("-> Отключаем проверку внешних ключей и начинаем транзакцию...")
-        with local_session.get_bind().connect() as con:
-            trans = con.begin()
-            try:
-                con.execute(db.text('PRAGMA foreign_keys = OFF'))
-                print("   - Проверка ключей отключена.")
-
-                for model in models_to_clear:
-                    table_name = model.__tablename__
-                    print(f"   - Очистка таблицы {table_name} с помощью прямого SQL-запроса...")
-                    # Заменяем ORM-метод на прямой SQL-запрос в той же транзакции
-                    con.execute(db.text(f'DELETE FROM {table_name}'))
-
-                print("   - Включаем проверку ключей обратно.")
-                con.execute(db.text('PRAGMA foreign_keys = ON'))
-
-                print("-> Фиксация транзакции...")
-                trans.commit()
-                print("✔️ Транзакция успешно зафиксирована.")
-
-            except Exception as e:
-                print(f"❌ Ошибка во время очистки таблиц: {e}. Откат транзакции...")
-                trans.rollback()
-                # Перевыбрасываем исключение, чтобы остановить выполнение всего скрипта
-                raise e
-
-        print("✔️ Локальные таблицы очищены.")
-
-        # --- ЭТАП 2: Поочередная синхронизация таблиц порциями ---
-        print("\n--- ЭТАП 2: Загрузка и сохранение данных ---")
-
-        # Определяем порядок скачивания (сначала родительские таблицы)
-        models_to_sync = [EstateHouses, EstateDealsContacts, EstateSells, EstateDeals]
-        total_records_synced = 0
-
-        for model in models_to_sync:
-            table_name = model.__tablename__
-            print(f"--> Синхронизация таблицы: {table_name}...")
-
-            offset = 0
-            model_records_synced = 0
-
-            # Цикл для загрузки данных порциями
-            while True:
-                # --- ИЗМЕНЕНИЕ: Загружаем не все, а только порцию данных ---
-                if model == EstateHouses:
-                    # Особый запрос для EstateHouses...
-                    chunk_query = db.select(model.house_id, model.complex_name, model.name).limit(CHUNK_SIZE).offset(
-                        offset)
-
-                # --- НАЧАЛО ИЗМЕНЕНИЯ ---
-                elif model == EstateSells:
-                    # Для EstateSells отключаем автоматическую загрузку связанных сделок,
-                    # чтобы избежать дубликатов из-за lazy='joined' в модели.
-                    chunk_query = db.select(model).options(noload(model.deals)).limit(CHUNK_SIZE).offset(offset)
-                # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-                elif model == EstateDeals:
-                    # Для EstateDeals принудительно соединяем с родительскими таблицами,
-                    # чтобы отфильтровать "осиротевшие" записи в источнике и избежать ошибок FOREIGN KEY.
-                    chunk_query = (
-                        db.select(model)
-                        .join(EstateSells, model.estate_sell_id == EstateSells.estate_sell_id)
-                        .join(EstateDealsContacts, model.contacts_buy_id == EstateDealsContacts.id)
-                        .limit(CHUNK_SIZE).offset(offset)
-                    )
-                # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-
-                else:
-                    # Стандартный запрос для остальных моделей
-                    chunk_query = db.select(model).limit(CHUNK_SIZE).offset(offset)
-
-
-                # Выполняем запрос в исходной БД
-                chunk = source_session.execute(chunk_query).mappings().all()
-
-                # Если порция пуста, значит, мы обработали всю таблицу
-                if not chunk:
-                    break
-
-                # Сразу записываем полученную порцию в локальную БД
-                local_session.bulk_insert_mappings(model, chunk)
-
-                chunk_size = len(chunk)
-                model_records_synced += chunk_size
-                total_records_synced += chunk_size
-                offset += CHUNK_SIZE
-
-                print(f"    - Обработано и сохранено {chunk_size} записей (всего для таблицы: {model_records_synced}).")
-
-            # Сохраняем изменения в локальной БД после каждой таблицы
-            local_session.commit()
-            print(f"✔️ Синхронизация таблицы {table_name} завершена. Всего записей: {model_records_synced}.\n")
+        if not full and not _has_sync_state(local_session):
+            print("-> Контрольные суммы не найдены, выполняется полная перезагрузка.")
+            full, mode = True, 'full'
+            _set_progress(mode=mode)
+
+        print(f"-> Запуск параллельного чтения {len(SYNC_MODELS)} таблиц...")
+        pipeline = _ExtractionPipeline(source_engine, SYNC_MODELS)
+        if full:
+            print("-> Режим: полная перезагрузка.")
+            rows_synced = _full_reload(pipeline)
+        else:
+            print("-> Режим: инкрементальная синхронизация.")
+            client_index_stale = _client_index_stale(run_id)
+            rows_synced, changed = _incremental_sync(pipeline, local_session)
+            if rows_synced or client_index_stale:
+                _refresh_client_index(changed, refresh_all=client_index_stale)
+            else:
+                print("-> Изменений нет: производные таблицы и статистика планировщика не обновляются.")
 
-        print(f"\n✔️ ЭТАП 2 ЗАВЕРШЕН. Всего синхронизировано {total_records_synced} записей.")
+        if full or rows_synced:
+            _analyze()
+        _finish_sync_run(run_id, 'success', mode, rows_synced=rows_synced)
         print(f"\n[{time.ctime()}] ✔️ СИНХРОНИЗАЦИЯ УСПЕШНО ЗАВЕРШЕНА.")
+        return 'success'
 
     except Exception as e:
         print(f"\n[{time.ctime()}] ❌ КРИТИЧЕСКАЯ ОШИБКА во время синхронизации: {e}")
@@ -138,10 +801,16 @@ def sync_data():
             print("-> Попытка отката транзакции...")
             local_session.rollback()
             print("✔️ Транзакция отменена.")
+        db.session.rollback()
+        _finish_sync_run(run_id, 'failed', mode, error=str(e))
+        return 'failed'
     finally:
-        if source_session:
-            source_session.close()
-            print("-> Соединение с MySQL закрыто.")
+        _set_progress(stage=None, table=None)
+        if pipeline:
+            pipeline.close()
+        if source_engine:
+            source_engine.dispose()
+            print("-> Соединения с MySQL закрыты.")
 
 
 def create_database(app):
@@ -154,6 +823,33 @@ def create_database(app):
         db.create_all()
         print("✔️ Выполнена команда db.create_all(). Таблицы созданы или уже существуют.")
 
+        # db.create_all() не добавляет новые колонки и индексы в уже существующие таблицы
+        with db.engine.connect() as con:
+            added_columns = []
+            for model in [SyncRun, ReportJob]:
+                added_columns.extend(_ensure_model_columns(con, model))
+            con.commit()
+        if added_columns:
+            print(f"✔️ Добавлены недостающие колонки: {added_columns}")
+
+        with db.engine.connect() as con:
+            created_indexes = []
+            for model in SYNC_MODELS + [ClientDirectory, ClientSuggest, ContactPhone,
+                                        Application, ApplicationLog, Defect]:
+                created_indexes.extend(_ensure_model_indexes(con, model))
+            con.commit()
+        if created_indexes:
+            print(f"✔️ Созданы недостающие индексы: {created_indexes}")
+            _analyze()
+
+        # Производные таблицы клиентов строятся после синхронизации. Если база обновлена
+        # до версии с ними (таблицы пусты или виртуальной таблицы поиска еще нет),
+        # заполняем их по уже загруженным данным.
+        with db.engine.connect() as con:
+            if client_tables_need_rebuild(con):
+                counts = rebuild_client_tables(con)
+                print(f"✔️ Построены производные таблицы клиентов: {counts}")
+
         try:
             inspector = inspect(db.engine)
             tables = inspector.get_table_names()
@@ -162,7 +858,8 @@ def create_database(app):
             required_tables = [
                 'users', 'estate_houses', 'estate_deals_contacts', 'estate_sells', 'estate_deals',
                 'applications', 'defects', 'application_logs',
-                'responsible_persons', 'responsible_assignments'
+                'responsible_persons', 'responsible_assignments', 'sync_row_hashes', 'sync_runs',
+                'client_directory', 'client_suggest', 'contact_phones', 'report_jobs'
             ]
 
             missing_tables = [t for t in required_tables if t not in tables]
@@ -172,4 +869,4 @@ def create_database(app):
                 print(
                     f"❌ ВНИМАНИЕ: Не найдены следующие таблицы: {missing_tables}. Они будут созданы при запуске приложения.")
         except Exception as e:
-            print(f"❌ КРИТИЧЕСКАЯ ОШИБКА при проверке таблиц: {e}")
\ No newline at end of file
+            print(f"❌ КРИТИЧЕСКАЯ ОШИБКА при проверке таблиц: {e}")
@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+# Конфигурация gunicorn для production:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# Значения можно переопределить переменными окружения GUNICORN_*.
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+
+# Локальная БД - SQLite: чтения из разных процессов идут параллельно, а запись
+# одна на всю базу, поэтому много процессов не нужно. Остальное добирается потоками:
+# во время запроса воркер в основном ждет SQLite, openpyxl или SMTP.
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 5)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Приложение и модели импортируются один раз в мастер-процессе, воркеры получают
+# их через fork (быстрее старт, меньше памяти за счет copy-on-write).
+preload_app = True
+
+# Выгрузка отчетов в Excel может занимать больше стандартных 30 секунд
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Периодически перезапускаем воркеры, чтобы не копилась память. Фоновые отчеты
+# при этом не теряются: очередь хранится в report_jobs, а выполняющиеся задания
+# воркер при остановке дописывает (до REPORT_JOB_EXIT_WAIT_SECONDS) или
+# возвращает в очередь (worker_exit).
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """
+    Соединения SQLite, открытые в мастер-процессе при preload (create_database),
+    нельзя использовать после fork. Сбрасываем пул: воркер откроет свои соединения,
+    а унаследованные не закрываются, чтобы не затронуть соединения мастера.
+    """
+    from wsgi import app
+    from app.extensions import db
+    from app.report_jobs import start_report_workers
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # Потоки фоновых отчетов забирают задания из report_jobs сразу, не дожидаясь первого запроса
+    start_report_workers(app)
+
+
+def worker_exit(server, worker):
+    """Задания на отчеты, которые выполняет останавливаемый воркер, дописываются или возвращаются в очередь."""
+    from wsgi import app
+    from app.report_jobs import release_report_jobs
+
+    with app.app_context():
+        try:
+            release_report_jobs(app)
+        except Exception as e:
+            print(f"❌ Не удалось вернуть отчеты в очередь: {e}")
@@ -1,7 +1,6 @@
 # run.py
 import os
 import threading
-import time
 from dotenv import load_dotenv
 from flask import Flask, url_for
 from flask_sqlalchemy import SQLAlchemy
@@ -11,7 +10,8 @@ from prefix_middleware import PrefixMiddleware
 # Это нужно сделать до импорта app и config, чтобы они "увидели" эти переменные
 load_dotenv()
 from app import create_app
-from data_sync import sync_data, create_database
+from data_sync import create_database
+from sync_worker import run_locked_sync, run_sync_worker
 
 
 
@@ -19,23 +19,16 @@ from data_sync import sync_data, create_database
 app = create_app()
 
 # --- ФОНОВАЯ СИНХРОНИЗАЦИЯ ---
-def background_sync_task(app_context):
+def background_sync_task(app, initial_sync=False):
     """
-    Задача, которая выполняется в фоновом потоке для периодической синхронизации.
+    Задача, которая выполняется в фоновом потоке для периодической синхронизации
+    по расписанию (см. sync_scheduler). При initial_sync=True сначала выполняется
+    первая синхронизация, пока приложение уже обслуживает запросы по имеющемуся
+    локальному снимку. Для production предпочтительнее отдельный процесс: `flask sync-worker`.
     """
-    # Устанавливаем интервал в часах
-    sync_interval_hours = 4
-    sync_interval_seconds = sync_interval_hours * 3600
-
-    while True:
-        # --- ИЗМЕНЕНИЕ ЗДЕСЬ ---
-        # Сначала ждем указанный интервал.
-        print(f"\nСледующая фоновая синхронизация запланирована через {sync_interval_hours} часа(ов)...")
-        time.sleep(sync_interval_seconds)
-
-        # Затем выполняем синхронизацию.
-        with app_context:
-            sync_data()
+    if initial_sync:
+        run_locked_sync(app, trigger='startup')
+    run_sync_worker(app)
 
 # behind_proxy = os.getenv('BEHIND_PROXY', 'false').lower() == 'true'
 # prefix = '/client-service' if behind_proxy else ''
@@ -67,21 +60,32 @@ def custom_static(filename):
 
 
 if __name__ == '__main__':
+    use_reloader = True
+    # С use_reloader=True этот блок выполняется в двух процессах: наблюдателе и дочернем
+    # процессе, который обслуживает запросы. Синхронизацию запускаем только во втором.
+    is_serving_process = not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
     # 1. Создаем локальную базу данных и таблицы (если их нет)
     create_database(app)
 
-    # 2. Выполняем ПЕРВУЮ и ЕДИНСТВЕННУЮ синхронизацию данных при запуске
-    with app.app_context():
-        sync_data()
-
-    # 3. Запускаем периодическую синхронизацию в отдельном фоновом потоке
-    print("\nЗапуск фонового процесса для периодической синхронизации данных...")
-    sync_thread = threading.Thread(target=background_sync_task, args=(app.app_context(),))
-    sync_thread.daemon = True  # Поток завершится при выходе из основного приложения
-    sync_thread.start()
+    if not app.config['SYNC_IN_WEB_PROCESS']:
+        print("\nСинхронизация данных выполняется отдельным процессом (flask sync-worker).")
+    elif is_serving_process:
+        # 2. ПЕРВАЯ синхронизация данных при запуске. В режиме 'background' она выполняется
+        # в фоновом потоке, а запросы сразу обслуживаются по имеющимся локальным данным
+        # (ход синхронизации: /client-service/admin/sync-status).
+        startup_in_background = app.config['SYNC_STARTUP_MODE'] == 'background'
+        if not startup_in_background:
+            run_locked_sync(app, trigger='startup')
+
+        # 3. Запускаем периодическую синхронизацию в отдельном фоновом потоке
+        print("\nЗапуск фонового процесса для периодической синхронизации данных...")
+        sync_thread = threading.Thread(target=background_sync_task, args=(app, startup_in_background))
+        sync_thread.daemon = True  # Поток завершится при выходе из основного приложения
+        sync_thread.start()
 
     # 4. Запускаем веб-приложение Flask
     print("\nЗапуск веб-приложения Flask...")
     # Для production используйте Gunicorn или другой WSGI-сервер
     # debug=True и use_reloader=True не должны использоваться в production
-    app.run(host='0.0.0.0', port=80, debug=app.config.get('DEBUG', True), use_reloader=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=80, debug=app.config.get('DEBUG', True), use_reloader=use_reloader)
@@ -0,0 +1,176 @@
+# sync_scheduler.py
+import datetime
+import random
+import time
+
+from app.extensions import db
+from app.models import SyncRun
+
+
+class CronSchedule:
+    """
+    Расписание в формате cron из пяти полей: минута час день месяц день_недели.
+    Поддерживаются '*', числа, диапазоны 'a-b', списки через запятую и шаг '/n'.
+    День недели: 0-6, воскресенье = 0 (или 7). Время - локальное (TZ контейнера).
+    """
+
+    _FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron-выражение должно состоять из 5 полей: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(part, low, high) for part, (low, high) in zip(parts, self._FIELD_RANGES)
+        ]
+        self.weekdays = {day % 7 for day in self.weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_str = part.split('/', 1)
+                step = int(step_str)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if step != 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Недопустимое значение поля cron: '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day_matches = moment.day in self.days
+        weekday_matches = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day:
+            return weekday_matches
+        if self._any_weekday:
+            return day_matches
+        # Как в cron: если заданы оба поля, достаточно совпадения любого из них
+        return day_matches or weekday_matches
+
+    def next_after(self, moment):
+        """Ближайшее время срабатывания строго после moment."""
+        candidate = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = candidate + datetime.timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + datetime.timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += datetime.timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron-выражение '{self.expression}' никогда не срабатывает")
+
+    def seconds_until_next_run(self, reference_run):
+        if reference_run is None:
+            return 0
+        now = datetime.datetime.now()
+        return (self.next_after(now) - now).total_seconds()
+
+    def __str__(self):
+        return f"cron '{self.expression}'"
+
+
+class IntervalSchedule:
+    """Запуск через фиксированный интервал после начала последней успешной синхронизации."""
+
+    def __init__(self, hours):
+        self.interval = datetime.timedelta(hours=hours)
+
+    def seconds_until_next_run(self, reference_run):
+        if reference_run is None:
+            return 0
+        next_run = reference_run.started_at + self.interval
+        return max(0.0, (next_run - datetime.datetime.utcnow()).total_seconds())
+
+    def __str__(self):
+        return f"каждые {self.interval.total_seconds() / 3600:g} ч"
+
+
+def build_schedule(config):
+    """SYNC_CRON имеет приоритет; без него используется SYNC_INTERVAL_HOURS."""
+    if config.get('SYNC_CRON'):
+        return CronSchedule(config['SYNC_CRON'])
+    return IntervalSchedule(config['SYNC_INTERVAL_HOURS'])
+
+
+def last_successful_run():
+    return SyncRun.query.filter_by(status='success').order_by(SyncRun.id.desc()).first()
+
+
+def last_run():
+    return SyncRun.query.order_by(SyncRun.id.desc()).first()
+
+
+def retry_delay(failures, base_seconds, max_seconds):
+    """Экспоненциальная задержка перед повтором: base, 2*base, 4*base, ... но не больше max."""
+    return min(base_seconds * 2 ** (failures - 1), max_seconds)
+
+
+def run_scheduler(app):
+    """
+    Бесконечный цикл планировщика синхронизации.
+    - расписание: cron (SYNC_CRON) или интервал (SYNC_INTERVAL_HOURS);
+    - к плановому запуску добавляется случайная задержка до SYNC_JITTER_SECONDS;
+    - после ошибки - повторы с экспоненциальной задержкой (SYNC_RETRY_BASE_SECONDS,
+      не больше SYNC_RETRY_MAX_SECONDS), после SYNC_MAX_RETRIES ждем следующего слота;
+    - если синхронизация уже идет (занята блокировка), запуск пропускается.
+    """
+    from sync_worker import run_locked_sync
+
+    config = app.config
+    schedule = build_schedule(config)
+    base_seconds = config['SYNC_RETRY_BASE_SECONDS']
+    max_seconds = config['SYNC_RETRY_MAX_SECONDS']
+    print(f"Планировщик синхронизации: {schedule}, jitter до {config['SYNC_JITTER_SECONDS']} с.")
+
+    failures = 0
+    gave_up = False
+    while True:
+        if failures:
+            trigger = 'retry'
+            delay = retry_delay(failures, base_seconds, max_seconds)
+            print(f"\nПовторная попытка №{failures} через {delay:.0f} с...")
+        else:
+            trigger = 'schedule'
+            with app.app_context():
+                # После исчерпания повторов отсчитываем слот от последней попытки,
+                # иначе при отсутствии успешных запусков цикл начнется сразу заново
+                reference_run = last_run() if gave_up else last_successful_run()
+                db.session.remove()
+            delay = schedule.seconds_until_next_run(reference_run)
+            if delay > 0:
+                delay += random.uniform(0, config['SYNC_JITTER_SECONDS'])
+            next_run = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+            print(f"\nСледующая синхронизация запланирована на {next_run:%d.%m.%Y %H:%M:%S}...")
+
+        time.sleep(delay)
+        status = run_locked_sync(app, trigger=trigger)
+        gave_up = False
+
+        if status == 'success':
+            failures = 0
+        elif status == 'failed':
+            failures += 1
+            if failures > config['SYNC_MAX_RETRIES']:
+                print(f"❌ Синхронизация не удалась {failures} раз(а) подряд. Ждем следующего планового запуска.")
+                failures = 0
+                gave_up = True
+        else:
+            # Синхронизация уже идет в другом процессе - проверим снова не раньше чем через base_seconds
+            time.sleep(base_seconds)
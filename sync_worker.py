@@ -0,0 +1,102 @@
+# sync_worker.py
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.extensions import db
+from data_sync import sync_data
+from sync_scheduler import run_scheduler
+
+
+class SyncLock:
+    """
+    Межпроцессная блокировка синхронизации на файле.
+    Гарантирует, что на одно развертывание (общий каталог instance) одновременно
+    выполняется не больше одной синхронизации: в отдельном воркере, в CLI-команде
+    или в фоновом потоке веб-приложения.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Пытается захватить блокировку без ожидания. Возвращает True при успехе."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            lock_file.seek(0)
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        # Для диагностики записываем PID владельца блокировки
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if not self._file:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def run_locked_sync(app, full=False, trigger='manual'):
+    """
+    Выполняет одну синхронизацию под блокировкой SyncLock.
+    Возвращает статус sync_data ('success' / 'failed') или 'skipped',
+    если синхронизация уже идет в другом процессе или потоке.
+    """
+    lock = SyncLock(app.config['SYNC_LOCK_FILE'])
+    if not lock.acquire():
+        print(f"\n[{time.ctime()}] Синхронизация уже выполняется другим процессом "
+              f"(блокировка {lock.path}). Запуск пропущен.")
+        return 'skipped'
+    try:
+        with app.app_context():
+            status = sync_data(full=full, trigger=trigger)
+            db.session.remove()
+    finally:
+        lock.release()
+    return status
+
+
+def run_sync_worker(app, once=False):
+    """
+    Процесс синхронизации (команда `flask sync-worker`).
+    Отдельная блокировка воркера гарантирует один планировщик на развертывание;
+    сама синхронизация берет SyncLock только на время выполнения, поэтому ручной
+    `flask sync` между плановыми запусками по-прежнему возможен.
+    """
+    worker_lock = SyncLock(app.config['SYNC_LOCK_FILE'] + '.worker')
+    if not worker_lock.acquire():
+        print(f"❌ Воркер синхронизации уже запущен (блокировка {worker_lock.path}). Завершение.")
+        return False
+
+    print(f"Воркер синхронизации запущен (PID {os.getpid()}).")
+    try:
+        if once:
+            run_locked_sync(app)
+        else:
+            run_scheduler(app)
+    finally:
+        worker_lock.release()
+    return True
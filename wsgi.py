@@ -0,0 +1,16 @@
+# wsgi.py
+# Точка входа для production WSGI-сервера:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# Настройки gunicorn (воркеры, потоки, preload_app) - в gunicorn.conf.py.
+# Синхронизация данных в этом режиме выполняется отдельным процессом (`flask sync-worker`),
+# поэтому для веб-процессов нужно установить SYNC_IN_WEB_PROCESS=false.
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from run import app
+from data_sync import create_database
+
+# При preload_app=True модуль импортируется один раз в мастер-процессе gunicorn,
+# поэтому таблицы проверяются и создаются до запуска воркеров.
+create_database(app)